@@ -12,6 +12,10 @@ import logging
 import hashlib
 import requests
 import calendar
+import click
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from functools import wraps
 from datetime import datetime, date, timedelta
 
@@ -19,14 +23,15 @@ import ssl
 import ssl
 
 from dotenv import load_dotenv
-from flask import Flask, render_template, send_file, request, jsonify, url_for, flash, redirect, session
+from flask import Flask, render_template, send_file, request, jsonify, url_for, flash, redirect, session, has_request_context, g
 from flask_apscheduler import APScheduler
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_mail import Mail, Message
 from flask_migrate import Migrate
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import func, or_, and_, inspect, text
+from sqlalchemy import exc, func, or_, and_, inspect, text, select, event
+from sqlalchemy.orm import aliased, selectinload
 
 from recurring_detection import detect_recurring_transactions, create_recurring_expense_from_detection
 from oidc_auth import setup_oidc_config, register_oidc_routes
@@ -36,6 +41,16 @@ from simplefin_client import SimpleFin
 from session_timeout import DemoTimeout, demo_time_limited
 
 from fmp_cache import FMPCache
+from expense_rollups import ExpenseRollup, bucket_key
+from category_rules import CategoryNameIndex, CategoryRuleCache, CategoryRuleSet
+from job_locks import FileRunLock, holder_id, run_key
+from csv_import import CsvImportOptions, CsvRowParser, batches, iter_csv_rows
+from transaction_types import TransactionClassifier
+from mail_batch import BatchMailer
+from recurrence import FREQUENCIES, add_months, due_dates
+from budget_status import (BudgetSpending, GRAINS, PERIODS, budget_status, month_start, period_dates,
+                           period_rows, progress_percentage, week_start)
+from fx_rates import RateHistory, RateSnapshot, RateTable, as_date, parse_frankfurter_json, parse_rates_csv, rates_to_base
 
 
 os.environ['OPENSSL_LEGACY_PROVIDER'] = '1'
@@ -71,6 +86,8 @@ app.config['LOCAL_LOGIN_DISABLE'] = os.getenv('LOCAL_LOGIN_DISABLE', 'False').lo
 
 app.config['SIMPLEFIN_ENABLED'] = os.getenv('SIMPLEFIN_ENABLED', 'True').lower() == 'true'
 app.config['SIMPLEFIN_SETUP_TOKEN_URL'] = os.getenv('SIMPLEFIN_SETUP_TOKEN_URL', 'https://beta-bridge.simplefin.org/setup-token')
+app.config['SIMPLEFIN_SYNC_WORKERS'] = int(os.getenv('SIMPLEFIN_SYNC_WORKERS', 8))  # Concurrent bridge requests in the nightly sync
+app.config['SIMPLEFIN_SYNC_TIMEOUT'] = int(os.getenv('SIMPLEFIN_SYNC_TIMEOUT', 60))  # Seconds before a user's bridge request is abandoned
 
 
 
@@ -78,6 +95,33 @@ app.config['SIMPLEFIN_SETUP_TOKEN_URL'] = os.getenv('SIMPLEFIN_SETUP_TOKEN_URL',
 app.config['INVESTMENT_TRACKING_ENABLED'] = os.getenv('INVESTMENT_TRACKING_ENABLED', 'False').lower() == 'true'
 app.config['FMP_API_KEY'] = os.getenv('FMP_API_KEY', None)
 app.config['FMP_API_URL'] = os.getenv('FMP_API_URL', 'https://financialmodelingprep.com/api/v3')
+# Most FMP responses each worker keeps in memory in front of the shared file cache
+app.config['FMP_CACHE_MEMORY_ENTRIES'] = int(os.getenv('FMP_CACHE_MEMORY_ENTRIES', 512))
+# 'files' (one JSON file per response) or 'sqlite' (a single indexed file)
+app.config['FMP_CACHE_BACKEND'] = os.getenv('FMP_CACHE_BACKEND', 'files').lower()
+# Company profiles (name, sector, industry) change rarely, so they are kept longer than quotes (hours)
+app.config['FMP_PROFILE_CACHE_HOURS'] = int(os.getenv('FMP_PROFILE_CACHE_HOURS', 24 * 7))
+# How often the scheduled job refreshes every user's investment prices (hours)
+app.config['PRICE_REFRESH_HOURS'] = int(os.getenv('PRICE_REFRESH_HOURS', 6))
+
+# How long compiled category rules are reused before re-reading mappings (seconds)
+app.config['CATEGORY_RULES_TTL'] = int(os.getenv('CATEGORY_RULES_TTL', 60))
+app.config['CURRENCY_RATES_TTL'] = int(os.getenv('CURRENCY_RATES_TTL', 60))
+app.config['CURRENCY_HISTORY_TTL'] = int(os.getenv('CURRENCY_HISTORY_TTL', 3600))
+
+# CSV rows saved per transaction, and the upload size above which an import runs in the background (bytes)
+app.config['CSV_IMPORT_BATCH_SIZE'] = int(os.getenv('CSV_IMPORT_BATCH_SIZE', 500))
+app.config['CSV_IMPORT_BACKGROUND_BYTES'] = int(os.getenv('CSV_IMPORT_BACKGROUND_BYTES', 1024 * 1024))
+# Seconds between checks for queued background imports, and minutes without progress before a running import is failed
+app.config['CSV_IMPORT_POLL_SECONDS'] = int(os.getenv('CSV_IMPORT_POLL_SECONDS', 10))
+app.config['CSV_IMPORT_STALE_MINUTES'] = int(os.getenv('CSV_IMPORT_STALE_MINUTES', 10))
+
+# Recurring templates whose due instances are created per transaction
+app.config['RECURRING_BATCH_SIZE'] = int(os.getenv('RECURRING_BATCH_SIZE', 200))
+# Minutes between refreshes of the detected recurring candidates of users with new transactions
+app.config['RECURRING_DETECTION_MINUTES'] = int(os.getenv('RECURRING_DETECTION_MINUTES', 30))
+# Minutes between checks for stored base-currency amounts to recompute after a base currency change
+app.config['AMOUNT_REBASE_MINUTES'] = int(os.getenv('AMOUNT_REBASE_MINUTES', 5))
 
 
 
@@ -90,33 +134,139 @@ app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER', os.getenv('MAIL_USERNAME'))
 
+# Monthly report run: users whose reports are built at once, emails per SMTP connection, attempts per email
+app.config['MONTHLY_REPORT_WORKERS'] = int(os.getenv('MONTHLY_REPORT_WORKERS', 4))
+app.config['MONTHLY_REPORT_BATCH_SIZE'] = int(os.getenv('MONTHLY_REPORT_BATCH_SIZE', 100))
+app.config['MONTHLY_REPORT_SEND_RETRIES'] = int(os.getenv('MONTHLY_REPORT_SEND_RETRIES', 3))
+# Public address of the app, for links in emails sent outside a request
+app.config['APP_URL'] = os.getenv('APP_URL', 'http://localhost:5006')
+
 app.config['TIMEZONE'] = 'EST'  # Default timezone
+# Run scheduled jobs in this process; turn off in the web containers when a separate worker (python worker.py) runs them
+app.config['SCHEDULER_ENABLED'] = os.getenv('SCHEDULER_ENABLED', 'True').lower() == 'true'
+# Days finished scheduled job runs are kept in scheduled_job_runs
+app.config['SCHEDULED_RUN_RETENTION_DAYS'] = int(os.getenv('SCHEDULED_RUN_RETENTION_DAYS', 30))
 
 # Initialize scheduler
 scheduler = APScheduler()
 scheduler.timezone = pytz.timezone('EST') # Explicitly set scheduler to use EST
 scheduler.init_app(app)
 
+def claim_scheduled_run(job_id, key):
+    """
+    Claim one run of a scheduled job for this process. Returns the ScheduledJobRun
+    row, or None when another worker or host has already claimed the run
+    """
+    # SQLite lives on one host: settle the race with a lock file rather than concurrent writes
+    if db.engine.url.get_backend_name() == 'sqlite':
+        if not FileRunLock(os.path.join(app.instance_path, 'scheduler-locks')).claim(job_id, key):
+            return None
+    
+    run = ScheduledJobRun(job_id=job_id, run_key=key, holder=holder_id())
+    db.session.add(run)
+    try:
+        db.session.commit()
+    except exc.IntegrityError:
+        db.session.rollback()
+        return None
+    
+    prune_scheduled_runs()
+    return run
+
+def prune_scheduled_runs():
+    """
+    Delete finished runs older than SCHEDULED_RUN_RETENTION_DAYS. Claims only race
+    within the current period, so old rows are just history
+    """
+    cutoff = datetime.utcnow() - timedelta(days=app.config['SCHEDULED_RUN_RETENTION_DAYS'])
+    try:
+        ScheduledJobRun.query.filter(
+            ScheduledJobRun.status != 'running',
+            ScheduledJobRun.finished_at < cutoff
+        ).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error pruning scheduled job runs: {str(e)}")
+
+def run_scheduled_job(job_id, period, job):
+    """Run job unless another process has already claimed this period's run (see job_locks)"""
+    key = run_key(period, datetime.now(scheduler.timezone))
+    with app.app_context():
+        run = claim_scheduled_run(job_id, key)
+        if run is None:
+            app.logger.info(f"Skipping {job_id} run {key}: already claimed by another worker")
+            return
+        run_id = run.id
+    
+    app.logger.info(f"Running {job_id} run {key} on {holder_id()}")
+    status = 'success'
+    try:
+        job()
+    except Exception as e:
+        status = 'failed'
+        app.logger.error(f"Scheduled job {job_id} failed: {str(e)}")
+    finally:
+        with app.app_context():
+            run = ScheduledJobRun.query.get(run_id)
+            run.status = status
+            run.finished_at = datetime.utcnow()
+            db.session.commit()
+
 @scheduler.task('cron', id='monthly_reports', day=1, hour=1, minute=0)
 def scheduled_monthly_reports():
     """Run on the 1st day of each month at 1:00 AM"""
-    send_automatic_monthly_reports()
+    run_scheduled_job('monthly_reports', 'monthly', send_automatic_monthly_reports)
+
+
+@scheduler.task('cron', id='recurring_expenses', hour=0, minute=30)
+def scheduled_recurring_expenses():
+    """Run every day at 12:30 AM"""
+    run_scheduled_job('recurring_expenses', 'daily', create_scheduled_expenses)
 
+@scheduler.task('interval', id='recurring_detection', minutes=app.config['RECURRING_DETECTION_MINUTES'])
+def scheduled_recurring_detection():
+    """Run every RECURRING_DETECTION_MINUTES minutes"""
+    run_scheduled_job('recurring_detection', app.config['RECURRING_DETECTION_MINUTES'] * 60,
+                      refresh_stale_recurring_candidates)
+
+@scheduler.task('interval', id='amount_rebase', minutes=app.config['AMOUNT_REBASE_MINUTES'])
+def scheduled_amount_rebase():
+    """Run every AMOUNT_REBASE_MINUTES minutes"""
+    run_scheduled_job('amount_rebase', app.config['AMOUNT_REBASE_MINUTES'] * 60, rebase_missing_amounts)
+
+@scheduler.task('interval', id='csv_imports', seconds=app.config['CSV_IMPORT_POLL_SECONDS'])
+def scheduled_csv_imports():
+    """Run every CSV_IMPORT_POLL_SECONDS seconds; each import is claimed on its own row"""
+    run_queued_import_jobs()
 
 @scheduler.task('cron', id='simplefin_sync', hour=23, minute=0)
 def scheduled_simplefin_sync():
     """Run every day at 11:00 PM"""
-    sync_all_simplefin_accounts()
+    run_scheduled_job('simplefin_sync', 'daily', sync_all_simplefin_accounts)
+
+@scheduler.task('interval', id='investment_price_refresh', hours=app.config['PRICE_REFRESH_HOURS'])
+def scheduled_investment_price_refresh():
+    """Run every PRICE_REFRESH_HOURS hours"""
+    run_scheduled_job('investment_price_refresh', app.config['PRICE_REFRESH_HOURS'] * 3600,
+                      refresh_all_investment_prices)
+
+def start_scheduler():
+    """Start the scheduler in this process (once)"""
+    if not scheduler.running:
+        scheduler.start()
 
-# Start the scheduler
-scheduler.start()
+# Start the scheduler, unless a separate worker runs the jobs
+if app.config['SCHEDULER_ENABLED']:
+    start_scheduler()
 
 
 simplefin_client = SimpleFin(app)
 
 mail = Mail(app)
 
-fmp_cache = FMPCache()
+fmp_cache = FMPCache(memory_entries=app.config['FMP_CACHE_MEMORY_ENTRIES'],
+                     backend=app.config['FMP_CACHE_BACKEND'])
 
 # Logging configuration
 log_level = os.getenv('LOG_LEVEL', 'INFO').upper()
@@ -240,6 +390,20 @@ class Settlement(db.Model):
     payer = db.relationship('User', foreign_keys=[payer_id], backref=db.backref('settlements_paid', lazy=True))
     receiver = db.relationship('User', foreign_keys=[receiver_id], backref=db.backref('settlements_received', lazy=True))
 
+class PairwiseBalance(db.Model):
+    """
+    Running IOU ledger between two users, updated alongside every expense and settlement write.
+    Pairs are stored once with user_a < user_b; a positive amount means user_b owes user_a.
+    """
+    __tablename__ = 'pairwise_balances'
+    user_a = db.Column(db.String(120), db.ForeignKey('users.id'), primary_key=True)
+    user_b = db.Column(db.String(120), db.ForeignKey('users.id'), primary_key=True, index=True)
+    amount = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<PairwiseBalance {self.user_b} owes {self.user_a}: {self.amount}>"
+
 class Currency(db.Model):
     __tablename__ = 'currencies'
     code = db.Column(db.String(3), primary_key=True)  # ISO 4217 currency code (e.g., USD, EUR, GBP)
@@ -251,6 +415,22 @@ class Currency(db.Model):
     
     def __repr__(self):
         return f"{self.code} ({self.symbol})"
+
+class CurrencyRate(db.Model):
+    """A currency's rate to base on one day; update_currency_rates appends, 'flask import-currency-rates' backfills"""
+    __tablename__ = 'currency_rates'
+    id = db.Column(db.Integer, primary_key=True)
+    code = db.Column(db.String(3), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    rate_to_base = db.Column(db.Float, nullable=False)  # How much of base_code one unit of code was worth that day
+    base_code = db.Column(db.String(3), nullable=False)  # Base currency the rate is expressed in
+
+    __table_args__ = (
+        db.UniqueConstraint('base_code', 'code', 'date', name='uq_currency_rate'),
+    )
+
+    def __repr__(self):
+        return f"<CurrencyRate {self.code} {self.date}: {self.rate_to_base} {self.base_code}>"
     
 expense_tags = db.Table('expense_tags',
     db.Column('expense_id', db.Integer, db.ForeignKey('expenses.id'), primary_key=True),
@@ -281,6 +461,7 @@ class CategorySplit(db.Model):
     expense_id = db.Column(db.Integer, db.ForeignKey('expenses.id'), nullable=False)
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
     amount = db.Column(db.Float, nullable=False)
+    amount_base = db.Column(db.Float, nullable=True)  # Amount in the current base currency, kept by sync_amount_base()
     description = db.Column(db.String(200), nullable=True)
     
     # Relationships
@@ -330,6 +511,7 @@ class Expense(db.Model):
     # Add these fields to your existing Expense class:
     currency_code = db.Column(db.String(3), db.ForeignKey('currencies.code'), nullable=True)
     original_amount = db.Column(db.Float, nullable=True) # Amount in original currency
+    amount_base = db.Column(db.Float, nullable=True)  # Amount in the current base currency at the rate on its date, kept by sync_amount_base()
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True)
     currency = db.relationship('Currency', backref=db.backref('expenses', lazy=True))
     #imports
@@ -346,6 +528,23 @@ class Expense(db.Model):
     
     # Add to Expense class:
     has_category_splits = db.Column(db.Boolean, default=False)
+
+    # Indexed participant rows (payer + everyone in split_with), kept in sync by sync_expense_participants()
+    participants = db.relationship('ExpenseParticipant', backref='expense', lazy=True,
+                                   cascade='all, delete-orphan')
+
+    __table_args__ = (
+        db.Index('ix_expenses_user_date', 'user_id', 'date'),
+        db.Index('ix_expenses_paid_by', 'paid_by'),
+        # One row per SimpleFin transaction, even when two syncs run at once
+        db.Index('uq_expenses_import_external_id', 'user_id', 'import_source', 'external_id', unique=True,
+                 postgresql_where=db.text("import_source = 'simplefin'"),
+                 sqlite_where=db.text("import_source = 'simplefin'")),
+        # One instance per recurring template and occurrence date, even when two runs overlap
+        db.Index('uq_expenses_recurring_date', 'recurring_id', 'date', unique=True,
+                 postgresql_where=db.text('recurring_id IS NOT NULL'),
+                 sqlite_where=db.text('recurring_id IS NOT NULL')),
+    )
     
     @property
     def is_income(self):
@@ -360,18 +559,72 @@ class Expense(db.Model):
         return self.transaction_type == 'expense' or self.transaction_type is None
 
     def calculate_splits(self):
-    
-        # Get the user who paid
-        payer = User.query.filter_by(id=self.paid_by).first()
-        payer_name = payer.name if payer else "Unknown"
-        payer_email = payer.id
+        """
+        Return the payer/splits breakdown for this expense.
+        Reads the shares stored in expense_participants; expenses that haven't been
+        materialized yet fall back to compute_splits()
+        """
+        if not self.participants:
+            return self.compute_splits()
+        
+        original_amount = self.original_amount if self.original_amount is not None else self.amount
+        
+        payer_row = None
+        split_rows = {}
+        for participant in self.participants:
+            if participant.is_payer:
+                payer_row = participant
+            else:
+                split_rows[participant.user_id] = participant
+        
+        result = {
+            'payer': {
+                'name': payer_row.user.name if payer_row and payer_row.user else "Unknown",
+                'email': self.paid_by,
+                'amount': payer_row.share_amount if payer_row else 0,
+                'original_amount': original_amount,
+                'currency_code': self.currency_code
+            },
+            'splits': []
+        }
+        
+        # Keep the split_with ordering, then anything not listed there
+        split_with_ids = [uid.strip() for uid in self.split_with.split(',')] if self.split_with else []
+        ordered_rows = [split_rows.pop(uid) for uid in split_with_ids if uid in split_rows]
+        ordered_rows.extend(split_rows.values())
+        
+        for participant in ordered_rows:
+            result['splits'].append({
+                'name': participant.user.name if participant.user else "Unknown",
+                'email': participant.user_id,
+                'amount': participant.share_amount,
+                'original_amount': participant.share_original_amount,
+                'currency_code': self.currency_code
+            })
         
+        return result
+
+    def compute_splits(self, users_by_id=None):
+        """
+        Compute the payer/splits breakdown from split_with and split_details.
+        users_by_id lets batch callers pass preloaded users instead of querying here.
+        """
         # Get all people this expense is split with
         split_with_ids = self.split_with.split(',') if self.split_with else []
+        
+        if users_by_id is None:
+            user_ids = {self.paid_by} | {user_id.strip() for user_id in split_with_ids}
+            users_by_id = {user.id: user for user in User.query.filter(User.id.in_(user_ids)).all()}
+        
+        # Get the user who paid
+        payer = users_by_id.get(self.paid_by)
+        payer_name = payer.name if payer else "Unknown"
+        payer_email = self.paid_by
+        
         split_users = []
         
         for user_id in split_with_ids:
-            user = User.query.filter_by(id=user_id.strip()).first()
+            user = users_by_id.get(user_id.strip())
             if user:
                 split_users.append({
                     'id': user.id,
@@ -560,6 +813,52 @@ class Expense(db.Model):
 
         return result
 
+class ExpenseParticipant(db.Model):
+    """
+    One row per person sharing an expense, so "expenses involving user X" is an
+    indexed lookup instead of a LIKE scan over Expense.split_with
+    """
+    __tablename__ = 'expense_participants'
+    id = db.Column(db.Integer, primary_key=True)
+    expense_id = db.Column(db.Integer, db.ForeignKey('expenses.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.String(120), db.ForeignKey('users.id'), nullable=False)
+    is_payer = db.Column(db.Boolean, nullable=False, default=False)  # Payer row vs. split_with row
+    share_amount = db.Column(db.Float, nullable=False, default=0.0)  # Share in base currency
+    share_original_amount = db.Column(db.Float, nullable=True)  # Share in the expense's original currency
+
+    # Joined so that reading splits never needs a separate User lookup
+    user = db.relationship('User', lazy='joined')
+
+    __table_args__ = (
+        db.UniqueConstraint('expense_id', 'user_id', 'is_payer', name='uq_expense_participant'),
+        db.Index('ix_expense_participants_user_expense', 'user_id', 'expense_id'),
+    )
+
+    def __repr__(self):
+        return f"<ExpenseParticipant {self.user_id} on expense {self.expense_id}: {self.share_amount}>"
+
+class CategoryPeriodSpend(db.Model):
+    """
+    A user's share of spending per category per day, week and month, kept up to
+    date on commit by refresh_category_spend() so budgets and trend charts read
+    totals instead of summing expenses
+    """
+    __tablename__ = 'category_period_spend'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(120), db.ForeignKey('users.id'), nullable=False)
+    category_id = db.Column(db.Integer, nullable=False)  # No FK: rows follow their expenses when a category is removed
+    grain = db.Column(db.String(10), nullable=False)  # 'day', 'week' or 'month'
+    period_start = db.Column(db.Date, nullable=False)  # First day of the period
+    amount = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'category_id', 'grain', 'period_start', name='uq_category_period_spend'),
+        db.Index('ix_category_period_spend_user_grain_start', 'user_id', 'grain', 'period_start'),
+    )
+
+    def __repr__(self):
+        return f"<CategoryPeriodSpend {self.user_id} category {self.category_id} {self.grain} {self.period_start}: {self.amount}>"
+
 class RecurringExpense(db.Model):
     __tablename__ = 'recurring_expenses'
     id = db.Column(db.Integer, primary_key=True)
@@ -575,7 +874,7 @@ class RecurringExpense(db.Model):
     split_with = db.Column(db.String(500), nullable=True)  # Comma-separated list of user IDs
     
     # Recurring specific fields
-    frequency = db.Column(db.String(20), nullable=False)  # 'daily', 'weekly', 'monthly', 'yearly'
+    frequency = db.Column(db.String(20), nullable=False)  # 'daily', 'weekly', 'biweekly', 'monthly', 'quarterly', 'yearly'
     start_date = db.Column(db.DateTime, nullable=False)
     end_date = db.Column(db.DateTime, nullable=True)  # Optional end date
     last_created = db.Column(db.DateTime, nullable=True)  # Track last created instance
@@ -608,8 +907,18 @@ class RecurringExpense(db.Model):
         if for_date is None:
             for_date = datetime.utcnow()
             
-        # Copy data to create a new expense
-        expense = Expense(
+        expense = self.new_expense_instance(for_date)
+        sync_expense_participants(expense)
+        sync_amount_base([expense])
+        
+        # Update the last created date
+        self.last_created = for_date
+        
+        return expense
+    
+    def new_expense_instance(self, for_date):
+        """Copy this template into a new expense on for_date; participants and amount_base are left to the caller"""
+        return Expense(
             description=self.description,
             amount=self.amount,
             date=for_date,
@@ -627,13 +936,9 @@ class RecurringExpense(db.Model):
             account_id=self.account_id,
             destination_account_id=self.destination_account_id if self.transaction_type == 'transfer' else None,
             currency_code=self.currency_code,
-            original_amount=self.original_amount
+            original_amount=self.original_amount,
+            category_splits=[]  # Saves sync_amount_base a lazy load (and flush) per instance
         )
-        
-        # Update the last created date
-        self.last_created = for_date
-        
-        return expense
     
 
 
@@ -719,6 +1024,58 @@ class IgnoredRecurringPattern(db.Model):
     def __repr__(self):
         return f"<IgnoredPattern: {self.description} ({self.amount}) - {self.frequency}>"
 
+
+class RecurringCandidate(db.Model):
+    """
+    A recurring pattern detected in a user's transactions, kept up to date by
+    refresh_recurring_candidates() so the recurring page doesn't run detection
+    """
+    __tablename__ = 'recurring_candidates'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(120), db.ForeignKey('users.id'), nullable=False)
+    pattern_key = db.Column(db.String(255), nullable=False)  # Same key as IgnoredRecurringPattern
+    description = db.Column(db.String(200), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    currency_code = db.Column(db.String(3), nullable=True)
+    frequency = db.Column(db.String(20), nullable=False)
+    account_id = db.Column(db.Integer, nullable=True)
+    category_id = db.Column(db.Integer, nullable=True)
+    transaction_type = db.Column(db.String(20), nullable=True)
+    confidence = db.Column(db.Float, nullable=False)
+    occurrences = db.Column(db.Integer, nullable=False)
+    last_date = db.Column(db.DateTime, nullable=False)
+    next_date = db.Column(db.DateTime, nullable=False)
+    avg_interval = db.Column(db.Float, nullable=False)
+    transaction_ids = db.Column(db.Text, nullable=False)  # JSON list of the matching expense IDs
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'pattern_key', name='uq_recurring_candidate_pattern'),)
+    
+    # Fields copied from the detector's candidate dicts
+    DETECTED_FIELDS = ('description', 'amount', 'currency_code', 'frequency', 'account_id', 'category_id',
+                       'transaction_type', 'confidence', 'occurrences', 'last_date', 'next_date', 'avg_interval')
+    
+    @property
+    def candidate_id(self):
+        return f"candidate_{self.id}"
+    
+    def to_dict(self):
+        """The candidate in the shape create_recurring_expense_from_detection() takes"""
+        data = {field: getattr(self, field) for field in self.DETECTED_FIELDS}
+        data['pattern_key'] = self.pattern_key
+        data['transaction_ids'] = json.loads(self.transaction_ids)
+        return data
+    
+    def __repr__(self):
+        return f"<RecurringCandidate {self.user_id}: {self.description} ({self.amount}) - {self.frequency}>"
+
+class RecurringDetectionState(db.Model):
+    """When a user's recurring candidates were last refreshed, and whether transactions changed since"""
+    __tablename__ = 'recurring_detection_state'
+    user_id = db.Column(db.String(120), db.ForeignKey('users.id'), primary_key=True)
+    stale = db.Column(db.Boolean, nullable=False, default=True)
+    refreshed_at = db.Column(db.DateTime, nullable=True)
+
             
      
 #--------------------
@@ -749,148 +1106,22 @@ class Budget(db.Model):
     
     def get_current_period_dates(self):
         """Get start and end dates for the current budget period"""
-        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        if self.period == 'weekly':
-            # Start of the week (Monday)
-            start_of_week = today - timedelta(days=today.weekday())
-            end_of_week = start_of_week + timedelta(days=6, hours=23, minutes=59, seconds=59)
-            return start_of_week, end_of_week
-            
-        elif self.period == 'monthly':
-            # Start of the month
-            start_of_month = today.replace(day=1)
-            # End of the month
-            if today.month == 12:
-                end_of_month = today.replace(year=today.year + 1, month=1, day=1) - timedelta(seconds=1)
-            else:
-                end_of_month = today.replace(month=today.month + 1, day=1) - timedelta(seconds=1)
-            return start_of_month, end_of_month
-            
-        elif self.period == 'yearly':
-            # Start of the year
-            start_of_year = today.replace(month=1, day=1)
-            # End of the year
-            end_of_year = today.replace(year=today.year + 1, month=1, day=1) - timedelta(seconds=1)
-            return start_of_year, end_of_year
-            
-        # Default to current day
-        return today, today.replace(hour=23, minute=59, second=59)
+        return period_dates(self.period)
     
     def calculate_spent_amount(self):
         """Calculate how much has been spent in this budget's category during the current period"""
-        start_date, end_date = self.get_current_period_dates()
-        
-        # Base query: find all expenses in the relevant date range for this user
-        from sqlalchemy import or_
-        
-        if self.include_subcategories:
-            # If this is a parent category, include subcategories
-            subcategories = Category.query.filter_by(parent_id=self.category_id).all()
-            subcategory_ids = [subcat.id for subcat in subcategories]
-            
-            # Include the parent category itself and all subcategories
-            category_filter = or_(
-                Expense.category_id == self.category_id,
-                Expense.category_id.in_(subcategory_ids) if subcategory_ids else False
-            )
-        else:
-            # Only include this specific category
-            category_filter = (Expense.category_id == self.category_id)
-        
-        # Get all expenses that match our criteria
-        expenses = Expense.query.filter(
-            Expense.user_id == self.user_id,
-            Expense.date >= start_date,
-            Expense.date <= end_date,
-            category_filter
-        ).all()
-        
-        # Calculate the total spent for these expenses
-        total_spent = 0.0
-        
-        # Process each expense to calculate the user's portion
-        for expense in expenses:
-            # If the expense has category splits, we need a different approach
-            if expense.has_category_splits:
-                # Handle category splits separately
-                continue
-                
-            # Get the split information for this expense
-            splits = expense.calculate_splits()
-            
-            # If the user is the payer and not in the splits, add their portion
-            if expense.paid_by == self.user_id and (not expense.split_with or self.user_id not in expense.split_with.split(',')):
-                total_spent += splits['payer']['amount']
-            else:
-                # Check if the current user is in the splits
-                for split in splits['splits']:
-                    if split['email'] == self.user_id:
-                        total_spent += split['amount']
-                        break
-        
-        # Handle expenses with category splits
-        if self.include_subcategories:
-            category_ids = [self.category_id] + [subcat.id for subcat in subcategories]
-        else:
-            category_ids = [self.category_id]
-        
-        # Find all category splits for relevant categories
-        category_splits = CategorySplit.query.join(
-            Expense, CategorySplit.expense_id == Expense.id
-        ).filter(
-            Expense.user_id == self.user_id,
-            Expense.date >= start_date,
-            Expense.date <= end_date,
-            CategorySplit.category_id.in_(category_ids)
-        ).all()
-        
-        # Process each category split
-        for cat_split in category_splits:
-            expense = Expense.query.get(cat_split.expense_id)
-            if not expense:
-                continue
-                
-            # Get the split information for this expense
-            splits = expense.calculate_splits()
-            
-            # Calculate the user's share of this category split
-            if expense.paid_by == self.user_id and (not expense.split_with or self.user_id not in expense.split_with.split(',')):
-                # User is the payer and not in splits - add their portion
-                if expense.amount > 0:
-                    user_ratio = splits['payer']['amount'] / expense.amount
-                    total_spent += cat_split.amount * user_ratio
-            else:
-                # Check if the user is in the splits
-                for split in splits['splits']:
-                    if split['email'] == self.user_id:
-                        if expense.amount > 0:
-                            user_ratio = split['amount'] / expense.amount
-                            total_spent += cat_split.amount * user_ratio
-                        break
-        
-        return total_spent
+        return get_budget_spending(self.user_id).spent(self.category_id, self.period, self.include_subcategories)
     
     def get_remaining_amount(self):
         """Calculate remaining budget amount"""
         return self.amount - self.calculate_spent_amount()
     
     def get_progress_percentage(self):
-            spent = self.calculate_spent_amount()
-            if self.amount <= 0:
-                return 100  # Avoid division by zero
-            percentage = (spent / self.amount) * 100
-            return min(percentage, 100)  # Cap at 100%
+        return progress_percentage(self.amount, self.calculate_spent_amount())
         
     def get_status(self):
         """Return the budget status: 'under', 'approaching', 'over'"""
-        percentage = self.get_progress_percentage()
-        if percentage >= 100:
-            return 'over'
-        elif percentage >= 80:
-            return 'approaching'
-        else:
-            return 'under'
+        return budget_status(self.amount, self.calculate_spent_amount())
             
 
 
@@ -993,6 +1224,89 @@ class InvestmentTransaction(db.Model):
         """Calculate the total value of this transaction"""
         return self.shares * self.price + self.fees
 
+class MonthlyReportDelivery(db.Model):
+    """Delivery log of the monthly report runs: one row per user and report month"""
+    __tablename__ = 'monthly_report_deliveries'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(120), db.ForeignKey('users.id'), nullable=False)
+    period = db.Column(db.String(7), nullable=False)  # Report month, 'YYYY-MM'
+    status = db.Column(db.String(20), nullable=False)  # 'sent', 'failed' or 'no_data'
+    attempts = db.Column(db.Integer, default=0)  # SMTP attempts over every run for this month
+    error = db.Column(db.Text)
+    sent_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'period', name='uq_monthly_report_delivery'),
+        db.Index('ix_monthly_report_deliveries_period_status', 'period', 'status'),
+    )
+
+    def __repr__(self):
+        return f"<MonthlyReportDelivery {self.user_id} {self.period}: {self.status}>"
+
+class ImportJob(db.Model):
+    """A CSV import run by the scheduler in the background, with its progress for the status endpoint"""
+    __tablename__ = 'import_jobs'
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.String(120), db.ForeignKey('users.id'), nullable=False)
+    filename = db.Column(db.String(255))
+    account_id = db.Column(db.Integer, db.ForeignKey('accounts.id', ondelete='SET NULL'))
+    options = db.Column(db.Text)  # JSON of CsvImportOptions
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'done' or 'failed'
+    total_bytes = db.Column(db.Integer, default=0)
+    processed_bytes = db.Column(db.Integer, default=0)
+    processed_rows = db.Column(db.Integer, default=0)
+    imported_count = db.Column(db.Integer, default=0)
+    duplicate_count = db.Column(db.Integer, default=0)
+    error_count = db.Column(db.Integer, default=0)
+    message = db.Column(db.Text)
+    holder = db.Column(db.String(255))  # host:pid that claimed the import
+    heartbeat_at = db.Column(db.DateTime)  # Last progress commit; a stale one means the process died
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        progress = 100 if self.status == 'done' else 0
+        if self.status != 'done' and self.total_bytes:
+            progress = min(99, int(100 * (self.processed_bytes or 0) / self.total_bytes))
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'progress': progress,
+            'processed_rows': self.processed_rows or 0,
+            'imported_count': self.imported_count or 0,
+            'duplicate_count': self.duplicate_count or 0,
+            'error_count': self.error_count or 0,
+            'message': self.message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f"<ImportJob {self.id} {self.user_id} {self.status}: {self.imported_count} imported>"
+
+class ScheduledJobRun(db.Model):
+    """
+    One claimed run of a scheduled job. The unique (job_id, run_key) key means only
+    the first worker or host to reach a run executes it
+    """
+    __tablename__ = 'scheduled_job_runs'
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(50), nullable=False)
+    run_key = db.Column(db.String(32), nullable=False)  # Period the run belongs to, see job_locks.run_key
+    holder = db.Column(db.String(255), nullable=False)  # host:pid that claimed the run
+    status = db.Column(db.String(20), nullable=False, default='running')  # 'running', 'success' or 'failed'
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.UniqueConstraint('job_id', 'run_key', name='uq_scheduled_job_run'),
+    )
+
+    def __repr__(self):
+        return f"<ScheduledJobRun {self.job_id} {self.run_key} on {self.holder}: {self.status}>"
+
 # Model to store user's Financial Modeling Prep API key
 class UserApiSettings(db.Model):
     __tablename__ = 'user_api_settings'
@@ -1253,15 +1567,18 @@ def calculate_asset_debt_trends(current_user):
         # Start with the most recent balance
         balance_history[today.strftime('%Y-%m')] = current_balance
         
+        # Consider currency conversion for each transaction if needed, at the rate on its date
+        transaction_amounts = convert_many_on(
+            [transaction.amount for transaction in transactions],
+            [transaction.currency_code or account_currency_code for transaction in transactions],
+            account_currency_code,
+            [transaction.date for transaction in transactions]
+        )
+        
         # Process transactions to track historical balances
-        for transaction in transactions:
+        for transaction, transaction_amount in zip(transactions, transaction_amounts):
             month_key = transaction.date.strftime('%Y-%m')
             
-            # Consider currency conversion for each transaction if needed
-            transaction_amount = transaction.amount
-            if transaction.currency_code and transaction.currency_code != account_currency_code:
-                transaction_amount = convert_currency(transaction_amount, transaction.currency_code, account_currency_code)
-            
             # Adjust balance based on transaction
             if transaction.transaction_type == 'income':
                 current_balance += transaction_amount
@@ -1271,10 +1588,16 @@ def calculate_asset_debt_trends(current_user):
             # Update monthly balance
             balance_history[month_key] = current_balance
         
-        # Convert balance history to user currency if needed
+        # Convert balance history to user currency if needed, at each month's closing rate
         if account_currency_code != user_currency_code:
-            for month, balance in balance_history.items():
-                balance_history[month] = convert_currency(balance, account_currency_code, user_currency_code)
+            month_ends = []
+            for month in balance_history:
+                year, month_number = map(int, month.split('-'))
+                month_ends.append(min(date(year, month_number, calendar.monthrange(year, month_number)[1]), today.date()))
+            balance_history = dict(zip(
+                balance_history.keys(),
+                convert_many_on(balance_history.values(), account_currency_code, user_currency_code, month_ends)
+            ))
         
         # Categorize and store balances
         for month, balance in balance_history.items():
@@ -1318,128 +1641,84 @@ def calculate_asset_debt_trends(current_user):
     }
 
 
-def detect_internal_transfer(description, amount, account_id=None):
+def transaction_classifier(user_id, negative_is_expense=False):
     """
-    Detect if a transaction appears to be an internal transfer between accounts
-    Returns a tuple of (is_transfer, source_account_id, destination_account_id)
+    Build the transfer/income/expense classifier for a user's imports from their
+    accounts; needs no request, so scheduled syncs can use it
     """
-    # Default return values
-    is_transfer = False
-    source_account_id = account_id
-    destination_account_id = None
-    
-    # Skip if no description or account
-    if not description or not account_id:
-        return is_transfer, source_account_id, destination_account_id
-    
-    # Normalize description for easier matching
-    desc_lower = description.lower()
+    accounts = db.session.query(Account.id, Account.name).filter_by(user_id=user_id).order_by(Account.id).all()
+    return TransactionClassifier(accounts, negative_is_expense)
+
+# Compiled mapping rules per user; routes that change mappings invalidate them
+category_rule_cache = CategoryRuleCache(ttl=app.config['CATEGORY_RULES_TTL'])
+
+def load_category_rule_set(user_id):
+    """Compile a user's active category mappings into a rule set"""
+    mappings = db.session.query(
+        CategoryMapping.id,
+        CategoryMapping.keyword,
+        CategoryMapping.category_id,
+        CategoryMapping.is_regex,
+        CategoryMapping.priority,
+        CategoryMapping.match_count
+    ).filter_by(
+        user_id=user_id,
+        active=True
+    ).order_by(CategoryMapping.priority.desc(), CategoryMapping.match_count.desc()).all()
     
-    # Common transfer-related keywords
-    transfer_keywords = [
-        'transfer', 'xfer', 'move', 'moved to', 'sent to', 'to account', 
-        'from account', 'between accounts', 'internal', 'account to account',
-        'trx to', 'trx from', 'trans to', 'trans from','ACH Withdrawal',
-        'Robinhood', 'BK OF AMER VISA ONLINE PMT','Payment Thank You',
+    return CategoryRuleSet(mappings)
 
+def get_category_rule_set(user_id):
+    """Get the user's compiled rule set, building it on first use"""
+    return category_rule_cache.get(user_id, load_category_rule_set)
 
-    ]
-    
-    # Check for transfer keywords in description
-    if any(keyword in desc_lower for keyword in transfer_keywords):
-        is_transfer = True
-        
-        # Try to identify the destination account
-        # Get all user accounts
-        user_accounts = Account.query.filter_by(user_id=current_user.id).all()
-        
-        # Look for account names in the description
-        for account in user_accounts:
-            # Skip the source account
-            if account.id == account_id:
-                continue
-                
-            # Check if account name appears in the description
-            if account.name.lower() in desc_lower:
-                # This is likely the destination account
-                destination_account_id = account.id
-                break
-    
-    return is_transfer, source_account_id, destination_account_id
+def invalidate_category_rules(user_id=None):
+    """Drop compiled rules after a user's mappings change"""
+    category_rule_cache.invalidate(user_id)
 
-# Update the determine_transaction_type function to detect internal transfers
-def determine_transaction_type(row, current_account_id=None):
+def run_in_savepoint(session, write, action):
     """
-    Determine transaction type based on row data from CSV import
-    Now with enhanced internal transfer detection
+    Run a before_commit side write in a savepoint. If it fails, only its own
+    statements are rolled back and logged, so the commit still saves the
+    caller's changes (a failed statement would otherwise abort the whole
+    transaction on PostgreSQL and turn the COMMIT into a ROLLBACK)
     """
-    type_column = request.form.get('type_column')
-    negative_is_expense = 'negative_is_expense' in request.form
-    
-    # Get description column name (default to 'Description')
-    description_column = request.form.get('description_column', 'Description')
-    description = row.get(description_column, '').strip()
+    try:
+        with session.begin_nested():
+            write()
+    except Exception as e:
+        app.logger.error(f"Error {action}: {str(e)}")
+
+def record_category_matches(rules, session=None):
+    """Count rule matches on the cached rules and queue the increments for the session's next commit"""
+    session = session or db.session
+    category_rule_cache.record_matches(rules)
+    pending = session.info.setdefault('category_match_counts', {})
+    for rule in rules:
+        pending[rule.id] = pending.get(rule.id, 0) + 1
+
+@event.listens_for(db.session, 'before_commit')
+def write_category_match_counts(session):
+    """Write the match-count increments queued in this transaction in a single UPDATE"""
+    pending = session.info.pop('category_match_counts', None)
+    if not pending:
+        return
     
-    # Get amount column name (default to 'Amount')
-    amount_column = request.form.get('amount_column', 'Amount')
-    amount_str = row.get(amount_column, '0').strip().replace('$', '').replace(',', '')
+    def write():
+        session.query(CategoryMapping).filter(
+            CategoryMapping.id.in_(pending.keys())
+        ).update({
+            CategoryMapping.match_count: func.coalesce(CategoryMapping.match_count, 0) + db.case(pending, value=CategoryMapping.id, else_=0)
+        }, synchronize_session=False)
     
-    try:
-        amount = float(amount_str)
-    except ValueError:
-        amount = 0
-    
-    # First check for internal transfer
-    if current_account_id:
-        is_transfer, _, _ = detect_internal_transfer(description, amount, current_account_id)
-        if is_transfer:
-            return 'transfer'
-    
-    # Check if there's a specific transaction type column
-    if type_column and type_column in row:
-        type_value = row[type_column].strip().lower()
-        
-        # Map common terms to transaction types
-        if type_value in ['expense', 'debit', 'purchase', 'payment', 'withdrawal']:
-            return 'expense'
-        elif type_value in ['income', 'credit', 'deposit', 'refund']:
-            return 'income'
-        elif type_value in ['transfer', 'move', 'xfer']:
-            return 'transfer'
-    
-    # If no type column or unknown value, try to determine from description
-    if description:
-        # Common transfer keywords
-        transfer_keywords = ['transfer', 'xfer', 'move', 'moved to', 'sent to', 'to account', 'between accounts']
-        # Common income keywords
-        income_keywords = ['salary', 'deposit', 'refund', 'interest', 'dividend', 'payment received']
-        # Common expense keywords
-        expense_keywords = ['payment', 'purchase', 'fee', 'subscription', 'bill']
-        
-        desc_lower = description.lower()
-        
-        # Check for keywords in description
-        if any(keyword in desc_lower for keyword in transfer_keywords):
-            return 'transfer'
-        elif any(keyword in desc_lower for keyword in income_keywords):
-            return 'income'
-        elif any(keyword in desc_lower for keyword in expense_keywords):
-            return 'expense'
-    
-    # If still undetermined, use amount sign
-    try:
-        # Determine type based on amount sign and settings
-        if amount < 0 and negative_is_expense:
-            return 'expense'
-        elif amount > 0 and negative_is_expense:
-            return 'income'
-        elif amount < 0 and not negative_is_expense:
-            return 'income'  # In some systems, negative means money coming in
-        else:
-            return 'expense'  # Default to expense for positive amounts
-    except ValueError:
-        # If amount can't be parsed, default to expense
-        return 'expense'
+    run_in_savepoint(session, write, 'updating category mapping match counts')
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def discard_category_match_counts(session, previous_transaction):
+    # A savepoint rolling back leaves the rest of the transaction's changes to commit
+    if previous_transaction.nested:
+        return
+    session.info.pop('category_match_counts', None)
 
 def auto_categorize_transaction(description, user_id):
     """
@@ -1448,65 +1727,44 @@ def auto_categorize_transaction(description, user_id):
     """
     if not description:
         return None
-        
-    # Standardize description - lowercase and remove extra spaces
-    description = description.strip().lower()
     
-    # Get all active category mappings for the user
-    mappings = CategoryMapping.query.filter_by(
-        user_id=user_id,
-        active=True
-    ).order_by(CategoryMapping.priority.desc(), CategoryMapping.match_count.desc()).all()
+    # Match against the user's compiled rules; scoring is done by the rule set
+    rule = get_category_rule_set(user_id).match(description)
+    if rule is None:
+        return None
     
-    # Keep track of matches and their scores
-    matches = []
+    # The increment is written with the caller's next commit
+    record_category_matches([rule])
+    return rule.category_id
+
+def categorize_many(descriptions, user_id, category_names=None):
+    """
+    Auto-categorize a batch of descriptions against rules loaded once.
+    Identical descriptions are matched once; match counts go out in one UPDATE
+    with the caller's next commit.
+    Rows no rule matches fall back to category_names, when given, looked up
+    against the user's existing categories.
+    Returns a list of category IDs (None where nothing matched)
+    """
+    descriptions = list(descriptions)
+    if not descriptions:
+        return []
     
-    # Check each mapping
-    for mapping in mappings:
-        matched = False
-        if mapping.is_regex:
-            # Use regex pattern matching
-            try:
-                import re
-                pattern = re.compile(mapping.keyword, re.IGNORECASE)
-                if pattern.search(description):
-                    matched = True
-            except:
-                # If regex is invalid, fall back to simple substring search
-                matched = mapping.keyword.lower() in description
-        else:
-            # Simple substring matching
-            matched = mapping.keyword.lower() in description
-            
-        if matched:
-            # Calculate match score based on:
-            # 1. Priority (user-defined importance)
-            # 2. Usage count (previous successful matches)
-            # 3. Keyword length (longer keywords are more specific)
-            # 4. Keyword position (earlier in the string is better)
-            score = (mapping.priority * 100) + (mapping.match_count * 10) + len(mapping.keyword)
-            
-            # Adjust score based on position (if simple keyword)
-            if not mapping.is_regex:
-                position = description.find(mapping.keyword.lower())
-                if position == 0:  # Matches at the start
-                    score += 50
-                elif position > 0:  # Adjust based on how early it appears
-                    score += max(0, 30 - position)
-                    
-            matches.append((mapping, score))
+    rules = get_category_rule_set(user_id).match_many(descriptions)
+    matched = [rule for rule in rules if rule is not None]
+    if matched:
+        record_category_matches(matched)
     
-    # Sort matches by score, descending
-    matches.sort(key=lambda x: x[1], reverse=True)
+    category_ids = [rule.category_id if rule else None for rule in rules]
     
-    # If we have any matches, increment the match count for the winner and return its category ID
-    if matches:
-        best_mapping = matches[0][0]
-        best_mapping.match_count += 1
-        db.session.commit()
-        return best_mapping.category_id
+    if category_names:
+        unmatched = [i for i, category_id in enumerate(category_ids) if not category_id and category_names[i]]
+        if unmatched:
+            name_index = load_category_name_index(user_id)
+            for i in unmatched:
+                category_ids[i] = name_index.find(category_names[i].strip())
     
-    return None
+    return category_ids
 
 def update_category_mappings(transaction_id, category_id, learn=False):
     """
@@ -1544,6 +1802,7 @@ def update_category_mappings(transaction_id, category_id, learn=False):
             db.session.add(new_mapping)
             db.session.commit()
         
+        invalidate_category_rules(transaction.user_id)
         return True
         
     return False
@@ -1576,80 +1835,79 @@ def extract_keywords(description):
 
 
 
-def get_category_id(category_name, description=None, user_id=None):
-    """Find, create, or auto-suggest a category based on name and description"""
-    # Clean the category name
-    category_name = category_name.strip() if category_name else ""
-    
-    # If we have a user ID and no category name but have a description
-    if user_id and not category_name and description:
-        # Try to auto-categorize based on description
-        auto_category_id = auto_categorize_transaction(description, user_id)
-        if auto_category_id:
-            return auto_category_id
-    
-    # If we have a category name, try to find it
-    if category_name:
-        # Try to find an exact match first
-        category = Category.query.filter(
-            Category.user_id == user_id if user_id else current_user.id,
-            func.lower(Category.name) == func.lower(category_name)
-        ).first()
-        
-        if category:
-            return category.id
-        
-        # Try to find a partial match in subcategories
-        subcategory = Category.query.filter(
-            Category.user_id == user_id if user_id else current_user.id,
-            Category.parent_id.isnot(None),
-            func.lower(Category.name).like(f"%{category_name.lower()}%")
-        ).first()
-        
-        if subcategory:
-            return subcategory.id
-        
-        # Try to find a partial match in parent categories
-        parent_category = Category.query.filter(
-            Category.user_id == user_id if user_id else current_user.id,
-            Category.parent_id.is_(None),
-            func.lower(Category.name).like(f"%{category_name.lower()}%")
-        ).first()
-        
-        if parent_category:
-            return parent_category.id
+def load_category_name_index(user_id):
+    """Load a user's categories once for name lookups"""
+    categories = db.session.query(
+        Category.id,
+        Category.name,
+        Category.parent_id
+    ).filter_by(user_id=user_id).order_by(Category.id).all()
+    
+    return CategoryNameIndex(categories)
+
+def get_category_ids(entries, user_id, create_missing=False):
+    """
+    Batch version of get_category_id(): entries is a list of
+    (category_name, description) pairs. Categories and mapping rules are
+    loaded once; a category name is tried before the description.
+    If create_missing is set, unknown names become new categories under "Other".
+    Returns a list of category IDs (None where nothing matched)
+    """
+    entries = [((name or '').strip(), description) for name, description in entries]
+    category_ids = [None] * len(entries)
+    if not entries:
+        return category_ids
+    
+    name_index = None
+    other_category = None
+    for i, (category_name, description) in enumerate(entries):
+        if not category_name:
+            continue
+        if name_index is None:
+            name_index = load_category_name_index(user_id)
+            if create_missing:
+                # Find "Other" category as parent for new categories
+                other_category = Category.query.filter_by(
+                    name='Other',
+                    user_id=user_id,
+                    is_system=True
+                ).first()
         
-        # If auto-categorize is enabled, create a new category
-        if 'auto_categorize' in request.form:
-            # Find "Other" category as parent
-            other_category = Category.query.filter_by(
-                name='Other',
-                user_id=user_id if user_id else current_user.id,
-                is_system=True
-            ).first()
-            
+        category_id = name_index.find(category_name)
+        if not category_id and create_missing:
             new_category = Category(
                 name=category_name[:50],  # Limit to 50 chars
                 icon='fa-tag',
                 color='#6c757d',
                 parent_id=other_category.id if other_category else None,
-                user_id=user_id if user_id else current_user.id
+                user_id=user_id
             )
-            
             db.session.add(new_category)
             db.session.flush()  # Get ID without committing
             
-            return new_category.id
+            # Later rows with the same name reuse the new category
+            name_index.add(new_category.id, new_category.name, new_category.parent_id)
+            category_id = new_category.id
+        
+        category_ids[i] = category_id
     
-    # If we still don't have a category, try auto-categorization again with the description
-    if description and user_id:
-        # Try to auto-categorize based on description
-        auto_category_id = auto_categorize_transaction(description, user_id)
-        if auto_category_id:
-            return auto_category_id
+    # Whatever the names didn't resolve is auto-categorized by description in one pass
+    pending = [i for i, (_, description) in enumerate(entries) if not category_ids[i] and description]
+    if pending:
+        suggestions = categorize_many([entries[i][1] for i in pending], user_id)
+        for i, category_id in zip(pending, suggestions):
+            category_ids[i] = category_id
     
-    # Default to None if no match found and auto-categorize is off
-    return None
+    return category_ids
+
+def get_category_id(category_name, description=None, user_id=None):
+    """Find, create, or auto-suggest a category based on name and description"""
+    user_id = user_id or current_user.id
+    
+    # If auto-categorize is enabled on the submitted form, unknown names become new categories
+    create_missing = has_request_context() and 'auto_categorize' in request.form
+    
+    return get_category_ids([(category_name, description)], user_id, create_missing)[0]
 
 
 def create_default_category_mappings(user_id):
@@ -1858,6 +2116,7 @@ def create_default_category_mappings(user_id):
     # Commit all mappings at once
     try:
         db.session.commit()
+        invalidate_category_rules(user_id)
         app.logger.info(f"Created default category mappings for user {user_id}")
     except Exception as e:
         db.session.rollback()
@@ -2123,8 +2382,13 @@ def update_currency_rates():
             else:
                 app.logger.warning(f"No rate found for {currency.code}")
         
+        # Keep the day's rates in the history as well
+        rate_date = as_date(data['date']) if data.get('date') else datetime.utcnow().date()
+        record_currency_rates(base_code, rate_date, rates_to_base(base_code, rates, base_code))
+        
         # Commit changes
         db.session.commit()
+        invalidate_currency_rates()
         app.logger.info(f"Updated {updated_count} currency rates")
         return updated_count
         
@@ -2177,98 +2441,675 @@ def init_default_currencies():
             
             try:
                 db.session.commit()
+                invalidate_currency_rates()
                 print("Default currencies initialized")
             except Exception as e:
                 db.session.rollback()
                 print(f"Error initializing currencies: {str(e)}")
 
 
-def convert_currency(amount, from_code, to_code):
-    """Convert an amount from one currency to another"""
-    if from_code == to_code:
-        return amount
-    
-    from_currency = Currency.query.filter_by(code=from_code).first()
-    to_currency = Currency.query.filter_by(code=to_code).first()
-    
-    if not from_currency or not to_currency:
-        return amount  # Return original if either currency not found
-    
-    # Get base currency for reference
-    base_currency = Currency.query.filter_by(is_base=True).first()
-    if not base_currency:
-        return amount  # Cannot convert without a base currency
+# Exchange rates shared by every request in this process; currency writes bump its version
+currency_rate_table = RateTable(ttl=app.config['CURRENCY_RATES_TTL'])
+
+def load_currency_rates():
+    """Load every currency's rate to base, plus the base currency code"""
+    rates = {}
+    base_code = None
+    for code, rate_to_base, is_base in db.session.query(Currency.code, Currency.rate_to_base, Currency.is_base):
+        rates[code] = rate_to_base
+        if is_base and base_code is None:
+            base_code = code
+    return rates, base_code
+
+def get_currency_rates():
+    """Get the process-wide rate snapshot, loading it when stale"""
+    return currency_rate_table.get(lambda: RateSnapshot(*load_currency_rates()))
+
+# Dated rates against the current base currency, for converting at the rate on a given day
+currency_history_table = RateTable(ttl=app.config['CURRENCY_HISTORY_TTL'])
+
+def load_currency_history():
+    """Load the rate history expressed in the current base currency"""
+    base_code = get_currency_rates().base_code
+    rows = db.session.query(
+        CurrencyRate.code,
+        CurrencyRate.date,
+        CurrencyRate.rate_to_base
+    ).filter(CurrencyRate.base_code == base_code).all()
+    return RateHistory(rows)
+
+def get_currency_history():
+    """Get the process-wide rate history, loading it when stale"""
+    return currency_history_table.get(load_currency_history)
+
+def invalidate_currency_rates():
+    """Reload rates on next use after currencies change; call after committing"""
+    currency_rate_table.bump()
+    currency_history_table.bump()
+
+def record_currency_rates(base_code, rate_date, rates):
+    """
+    Store one day's rates (code -> rate_to_base in base_code) in the history,
+    replacing any already recorded for that day. The caller commits.
+    """
+    if not rates:
+        return 0
     
-    # First convert amount to base currency
-    if from_code == base_currency.code:
-        # Amount is already in base currency
-        amount_in_base = amount
-    else:
-        # Convert from source currency to base currency
-        # The rate_to_base represents how much of the base currency 
-        # equals 1 unit of this currency
-        amount_in_base = amount * from_currency.rate_to_base
-    
-    # Then convert from base currency to target currency
-    if to_code == base_currency.code:
-        # Target is base currency, so we're done
-        return amount_in_base
-    else:
-        # Convert from base currency to target currency
-        # We divide by the target currency's rate_to_base to get 
-        # the equivalent amount in the target currency
-        return amount_in_base / to_currency.rate_to_base
+    existing = {rate.code: rate for rate in CurrencyRate.query.filter_by(base_code=base_code, date=rate_date)}
+    for code, rate_to_base in rates.items():
+        if code in existing:
+            existing[code].rate_to_base = rate_to_base
+        else:
+            db.session.add(CurrencyRate(code=code, date=rate_date, rate_to_base=rate_to_base, base_code=base_code))
+    return len(rates)
 
-def create_scheduled_expenses():
-    """Create expense instances for active recurring expenses"""
-    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+def import_currency_history(days, base_code=None):
+    """
+    Bulk-load dated Frankfurter quotes, (date, base, quotes) tuples, into the
+    rate history against the base currency. Days already stored are replaced.
+    Returns (rates stored, days skipped because the base currency isn't quoted)
+    """
+    base_code = base_code or get_currency_rates().base_code
+    if not base_code:
+        raise ValueError('No base currency set')
+    
+    rows_by_day = {}
+    skipped = 0
+    for rate_date, quote_base, quotes in days:
+        rates = rates_to_base(quote_base.upper(), quotes, base_code)
+        if rates is None:
+            skipped += 1
+            continue
+        rows_by_day.setdefault(rate_date, {}).update(rates)
     
-    # Find active recurring expenses
-    active_recurring = RecurringExpense.query.filter_by(active=True).all()
+    rate_dates = sorted(rows_by_day)
+    for start in range(0, len(rate_dates), 500):
+        CurrencyRate.query.filter(
+            CurrencyRate.base_code == base_code,
+            CurrencyRate.date.in_(rate_dates[start:start + 500])
+        ).delete(synchronize_session=False)
     
-    for recurring in active_recurring:
-        # Skip if end date is set and passed
-        if recurring.end_date and recurring.end_date < today:
-            continue
-            
-        # Determine if we need to create an expense based on frequency and last created date
-        create_expense = False
-        last_date = recurring.last_created or recurring.start_date
+    rows = [
+        {'code': code, 'date': rate_date, 'rate_to_base': rate, 'base_code': base_code}
+        for rate_date in rate_dates
+        for code, rate in rows_by_day[rate_date].items()
+    ]
+    if rows:
+        db.session.execute(CurrencyRate.__table__.insert(), rows)
+    return len(rows), skipped
+
+def rebase_currency_history(old_base, new_base):
+    """
+    Re-express the rate history in a new base currency, for days the new base
+    has a rate on. Days already recorded against the new base are kept. The caller commits.
+    """
+    if not old_base or old_base == new_base:
+        return 0
+    
+    rows = CurrencyRate.query.filter_by(base_code=old_base).all()
+    new_base_rates = {row.date: row.rate_to_base for row in rows if row.code == new_base and row.rate_to_base}
+    recorded = {(code, rate_date) for code, rate_date in db.session.query(
+        CurrencyRate.code, CurrencyRate.date
+    ).filter(CurrencyRate.base_code == new_base)}
+    
+    updates = [
+        {'id': row.id, 'rate_to_base': row.rate_to_base / new_base_rates[row.date], 'base_code': new_base}
+        for row in rows
+        if row.date in new_base_rates and (row.code, row.date) not in recorded
+    ]
+    if updates:
+        db.session.bulk_update_mappings(CurrencyRate, updates)
+    return len(updates)
+
+def convert_currency(amount, from_code, to_code):
+    """Convert an amount from one currency to another"""
+    if from_code == to_code:
+        return amount
+    
+    # Converts through the base currency; returns the original amount if either currency
+    # (or the base currency) isn't known
+    return get_currency_rates().convert(amount, from_code, to_code)
+
+def convert_many(amounts, from_codes, to_code):
+    """
+    Convert a list of amounts to one currency with a single rate lookup.
+    from_codes is one currency code for all amounts, or a list parallel to amounts
+    """
+    return get_currency_rates().convert_many(amounts, from_codes, to_code)
+
+def convert_currency_on(amount, from_code, to_code, on_date):
+    """Convert an amount at the rates in effect on a date, falling back to current rates without history"""
+    if from_code == to_code:
+        return amount
+    return get_currency_history().convert(amount, from_code, to_code, on_date, get_currency_rates())
+
+def convert_many_on(amounts, from_codes, to_code, dates):
+    """Convert a list of amounts to one currency, each at the rate in effect on its date"""
+    return get_currency_history().convert_many(amounts, from_codes, to_code, dates, get_currency_rates())
+
+def expense_amount_bases(expenses):
+    """
+    Amounts of expenses in the current base currency, at the rate on each expense's date.
+    The original amount and currency are used when recorded; amounts without a currency are already in base
+    """
+    base_code = get_currency_rates().base_code
+    amounts = [expense.original_amount if expense.original_amount is not None else expense.amount for expense in expenses]
+    codes = [expense.currency_code or base_code for expense in expenses]
+    return convert_many_on(amounts, codes, base_code, [expense.date for expense in expenses])
+
+def sync_amount_base(expenses, category_splits=None):
+    """
+    Store amount_base on expenses and their category splits; the caller commits.
+    Pass category_splits for a single expense whose splits were just replaced
+    outside its category_splits relationship.
+    """
+    expenses = list(expenses)
+    for expense, amount_base in zip(expenses, expense_amount_bases(expenses)):
+        expense.amount_base = amount_base
         
-        if recurring.frequency == 'daily':
-            # Create if last was created yesterday or earlier
-            if (today - last_date).days >= 1:
-                create_expense = True
-                
-        elif recurring.frequency == 'weekly':
-            # Create if last was created 7 days ago or more
-            if (today - last_date).days >= 7:
-                create_expense = True
-                
-        elif recurring.frequency == 'monthly':
-            # Create if we're in a new month from the last creation
-            last_month = last_date.month
-            last_year = last_date.year
+        # Splits are in the same units as expense.amount
+        ratio = amount_base / expense.amount if expense.amount else 1.0
+        for split in (category_splits if category_splits is not None else expense.category_splits):
+            split.amount_base = split.amount * ratio
+
+def expense_base_ratio():
+    """
+    SQL factor taking amounts in the units of Expense.amount (participant shares,
+    category splits) to the current base currency: amount_base / amount, or 1
+    while amount_base is still to be stored
+    """
+    return db.case(
+        (Expense.amount != 0, func.coalesce(Expense.amount_base, Expense.amount) / Expense.amount),
+        else_=1.0
+    )
+
+def rebase_amounts(only_missing=False, batch_size=500):
+    """
+    Recompute amount_base on every expense and category split,
+    committing in batches, then rebuild category_period_spend, whose totals are summed
+    from amount_base. With only_missing, rows that already have one are skipped.
+    Returns the number of expenses updated
+    """
+    query = Expense.query.options(selectinload(Expense.category_splits)).order_by(Expense.id)
+    if only_missing:
+        query = query.filter(Expense.amount_base.is_(None))
+    
+    count = 0
+    last_id = 0
+    while True:
+        batch = query.filter(Expense.id > last_id).limit(batch_size).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+        sync_amount_base(batch)
+        db.session.commit()
+        count += len(batch)
+    
+    if count:
+        rebuild_category_spend()
+        db.session.commit()
+    
+    return count
+
+def mark_amounts_for_rebase():
+    """
+    Clear the stored base-currency amounts after the base currency changes, so the
+    amount_rebase job recomputes them; the caller commits
+    """
+    Expense.query.update({Expense.amount_base: None}, synchronize_session=False)
+
+def rebase_missing_amounts():
+    """
+    Recompute the stored base-currency amounts left blank by a base currency
+    change - runs on a schedule. Returns the number of expenses updated
+    """
+    with app.app_context():
+        if db.session.query(Expense.id).filter(Expense.amount_base.is_(None)).first() is None:
+            return 0
+        
+        try:
+            count = rebase_amounts(only_missing=True)
+            app.logger.info(f"Re-based stored amounts for {count} expenses")
+            return count
+        except Exception:
+            db.session.rollback()
+            raise
+
+def create_scheduled_expenses(today=None):
+    """
+    Create the expense instances due for all active recurring templates - runs on a schedule.
+    Every occurrence after a template's last created instance (or its start date) up to
+    today is created, so runs the scheduler missed are caught up. Templates are handled a
+    chunk per commit, with one query for the instances that already exist; the unique
+    (recurring_id, date) index makes an overlapping run fail instead of duplicating.
+    Returns a summary of the run
+    """
+    with app.app_context():
+        today = as_date(today or datetime.utcnow())
+        chunk_size = app.config['RECURRING_BATCH_SIZE']
+        summary = {'templates': 0, 'created': 0, 'skipped_existing': 0, 'failed': 0}
+        
+        # Templates that have started and haven't ended, loaded a chunk at a time
+        template_ids = [recurring_id for (recurring_id,) in db.session.query(RecurringExpense.id).filter(
+            RecurringExpense.active.is_(True),
+            RecurringExpense.start_date < datetime.combine(today + timedelta(days=1), datetime.min.time()),
+            or_(RecurringExpense.end_date.is_(None),
+                RecurringExpense.end_date >= func.coalesce(RecurringExpense.last_created, RecurringExpense.start_date))
+        ).order_by(RecurringExpense.id).all()]
+        
+        for chunk_ids in batches(template_ids, chunk_size):
+            templates = RecurringExpense.query.filter(RecurringExpense.id.in_(chunk_ids)).all()
+            
+            due = []
+            for recurring in templates:
+                if recurring.frequency not in FREQUENCIES:
+                    app.logger.warning(f"Skipping recurring transaction {recurring.id}: unknown frequency {recurring.frequency}")
+                    continue
+                start = as_date(recurring.start_date)
+                # The start date is the first occurrence; the add route creates it unless it was in the future
+                after = as_date(recurring.last_created) if recurring.last_created else start - timedelta(days=1)
+                end = as_date(recurring.end_date) if recurring.end_date else None
+                for occurrence_date in due_dates(start, recurring.frequency, after, today, end):
+                    due.append((recurring, datetime.combine(occurrence_date, datetime.min.time())))
+            summary['templates'] += len(templates)
+            if not due:
+                continue
             
-            current_month = today.month
-            current_year = today.year
+            # One query for the instances of these templates already in the window
+            existing = set(db.session.query(Expense.recurring_id, Expense.date).filter(
+                Expense.recurring_id.in_([recurring.id for recurring in templates]),
+                Expense.date >= min(occurrence_date for _, occurrence_date in due)
+            ).all())
             
-            if current_year > last_year or (current_year == last_year and current_month > last_month):
-                create_expense = True
-                
-        elif recurring.frequency == 'yearly':
-            # Create if we're in a new year from the last creation
-            if today.year > last_date.year:
-                create_expense = True
-        
-        # Create the expense if needed
-        if create_expense:
-            expense = recurring.create_expense_instance(today)
-            db.session.add(expense)
+            try:
+                users_by_id = load_users_for_expenses(templates)
+                expenses = []
+                for recurring, occurrence_date in due:
+                    if (recurring.id, occurrence_date) in existing:
+                        summary['skipped_existing'] += 1
+                    else:
+                        expense = recurring.new_expense_instance(occurrence_date)
+                        db.session.add(expense)
+                        sync_expense_participants(expense, users_by_id)
+                        expenses.append(expense)
+                    if recurring.last_created is None or recurring.last_created < occurrence_date:
+                        recurring.last_created = occurrence_date
+                
+                sync_amount_base(expenses)
+                db.session.commit()
+                summary['created'] += len(expenses)
+            except exc.IntegrityError as e:
+                # Another run created some of these instances first; the next run picks up the rest
+                db.session.rollback()
+                summary['failed'] += len(due)
+                app.logger.warning(f"Recurring instances already created by another run: {str(e.orig)}")
+            except Exception as e:
+                db.session.rollback()
+                summary['failed'] += len(due)
+                app.logger.error(f"Error creating recurring transactions: {str(e)}")
+        
+        app.logger.info(
+            f"Created {summary['created']} recurring transactions from {summary['templates']} templates "
+            f"({summary['skipped_existing']} already existed, {summary['failed']} failed)"
+        )
+        return summary
+
+# Expense fields the recurring detection reads; changing one makes the owner's candidates stale
+RECURRING_DETECTION_EXPENSE_FIELDS = ('user_id', 'description', 'amount', 'date', 'transaction_type', 'recurring_id')
+
+def refresh_recurring_candidates(user_id):
+    """
+    Run recurring detection over a user's whole history and bring their
+    recurring_candidates rows in line with it: changed patterns are updated in
+    place (so candidate IDs on an open page stay valid), new ones added and
+    vanished ones deleted. Commits; returns the number of candidates
+    """
+    state = RecurringDetectionState.query.get(user_id)
+    if state is None:
+        state = RecurringDetectionState(user_id=user_id)
+        db.session.add(state)
+    # Cleared before detecting, so transactions arriving meanwhile mark it stale again
+    state.stale = False
+    state.refreshed_at = datetime.utcnow()
+    db.session.commit()
     
-    # Commit all changes
-    if active_recurring:
+    detected = {}
+    for candidate in detect_recurring_transactions(user_id):
+        detected.setdefault(candidate['pattern_key'], candidate)
+    
+    existing = {candidate.pattern_key: candidate for candidate in RecurringCandidate.query.filter_by(user_id=user_id).all()}
+    for pattern_key, candidate in existing.items():
+        if pattern_key not in detected:
+            db.session.delete(candidate)
+    
+    for pattern_key, data in detected.items():
+        values = {field: data[field] for field in RecurringCandidate.DETECTED_FIELDS}
+        values['transaction_ids'] = json.dumps(data['transaction_ids'])
+        
+        candidate = existing.get(pattern_key)
+        if candidate is None:
+            candidate = RecurringCandidate(user_id=user_id, pattern_key=pattern_key)
+            db.session.add(candidate)
+        elif all(getattr(candidate, field) == value for field, value in values.items()):
+            continue
+        for field, value in values.items():
+            setattr(candidate, field, value)
+        candidate.updated_at = datetime.utcnow()
+    
+    db.session.commit()
+    return len(detected)
+
+def refresh_stale_recurring_candidates():
+    """
+    Refresh the recurring candidates of every user whose transactions changed
+    since their last refresh - runs on a schedule. Returns the number of users refreshed
+    """
+    with app.app_context():
+        user_ids = [user_id for (user_id,) in db.session.query(RecurringDetectionState.user_id).filter(
+            RecurringDetectionState.stale.is_(True)
+        ).all()]
+        
+        for user_id in user_ids:
+            try:
+                refresh_recurring_candidates(user_id)
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Error detecting recurring transactions for user {user_id}: {str(e)}")
+        
+        if user_ids:
+            app.logger.info(f"Refreshed recurring candidates for {len(user_ids)} users")
+        return len(user_ids)
+
+@event.listens_for(db.session, 'before_flush')
+def track_recurring_detection_changes(session, flush_context, instances):
+    """Note whose transactions changed, so their recurring candidates are marked stale when this session commits"""
+    user_ids = session.info.setdefault('recurring_detection_users', set())
+    
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Expense):
+            state = inspect(obj)
+            histories = [state.attrs[field].history for field in RECURRING_DETECTION_EXPENSE_FIELDS]
+            if obj in session.dirty and not any(history.has_changes() for history in histories):
+                continue
+            # Both the old and new owner's history changed (expired attributes have a blank history)
+            user_ids.update(user_id for user_id in (obj.user_id, *(histories[0].deleted or ())) if user_id)
+
+@event.listens_for(db.session, 'before_commit')
+def mark_recurring_candidates_stale(session):
+    """Mark the recurring candidates of users whose transactions this commit changes for a refresh"""
+    # before_commit runs ahead of the commit's own flush, which is what records the changes
+    session.flush()
+    user_ids = session.info.pop('recurring_detection_users', None)
+    if not user_ids:
+        return
+    
+    def write():
+        session.query(RecurringDetectionState).filter(
+            RecurringDetectionState.user_id.in_(user_ids),
+            RecurringDetectionState.stale.is_(False)
+        ).update({RecurringDetectionState.stale: True}, synchronize_session=False)
+    
+    run_in_savepoint(session, write, 'marking recurring candidates stale')
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def discard_recurring_detection_changes(session, previous_transaction):
+    if previous_transaction.nested:
+        return
+    session.info.pop('recurring_detection_users', None)
+
+def split_participant_filter(user_id):
+    """
+    SQL criterion matching expenses that are split with the given user.
+    Indexed replacement for Expense.split_with.like(f'%{user_id}%')
+    """
+    return Expense.id.in_(
+        select(ExpenseParticipant.expense_id).where(
+            ExpenseParticipant.user_id == user_id,
+            ExpenseParticipant.is_payer.is_(False)
+        )
+    )
+
+def user_expense_filter(user_id):
+    """SQL criterion for expenses the user created or is split with"""
+    return or_(
+        Expense.user_id == user_id,
+        split_participant_filter(user_id)
+    )
+
+def load_users_by_id(user_ids):
+    """Fetch the given users in one query, keyed by ID"""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return {}
+    return {user.id: user for user in User.query.filter(User.id.in_(user_ids)).all()}
+
+def load_users_for_expenses(expenses):
+    """Fetch every payer and split_with user referenced by the given expenses in one query"""
+    user_ids = set()
+    for expense in expenses:
+        user_ids.add(expense.paid_by)
+        if expense.split_with:
+            user_ids.update(user_id.strip() for user_id in expense.split_with.split(','))
+    return load_users_by_id(user_ids)
+
+def sync_expense_participants(expense, users_by_id=None):
+    """
+    Compute the split shares for an expense and store them in expense_participants.
+    Call after any change to the payer, split_with, split_details or amount;
+    the caller is responsible for committing.
+    """
+    if users_by_id is None:
+        users_by_id = load_users_for_expenses([expense])
+    splits = expense.compute_splits(users_by_id)
+
+    # Payer share in the original currency isn't part of calculate_splits(), derive it from the ratio
+    original_ratio = 1.0
+    if expense.original_amount is not None and expense.amount:
+        original_ratio = expense.original_amount / expense.amount
+
+    wanted = {}
+    if expense.paid_by in users_by_id:
+        wanted[(expense.paid_by, True)] = [splits['payer']['amount'], splits['payer']['amount'] * original_ratio]
+    for split in splits['splits']:
+        key = (split['email'], False)
+        if key in wanted:
+            # Same user listed twice in split_with - keep a single row with the combined share
+            wanted[key][0] += split['amount']
+            wanted[key][1] += split['original_amount']
+        else:
+            wanted[key] = [split['amount'], split['original_amount']]
+
+    existing = {(p.user_id, p.is_payer): p for p in expense.participants}
+
+    # Move the IOU ledger by the difference between the old and new shares
+    old_payer = next((user_id for user_id, is_payer in existing if is_payer), expense.paid_by)
+    balance_deltas = {}
+    for (user_id, is_payer), participant in existing.items():
+        if not is_payer and user_id != old_payer:
+            key = (old_payer, user_id)
+            balance_deltas[key] = balance_deltas.get(key, 0) - participant.share_amount
+    for (user_id, is_payer), (share_amount, _) in wanted.items():
+        if not is_payer and user_id != expense.paid_by:
+            key = (expense.paid_by, user_id)
+            balance_deltas[key] = balance_deltas.get(key, 0) + share_amount
+    for (creditor_id, debtor_id), delta in balance_deltas.items():
+        adjust_pairwise_balance(creditor_id, debtor_id, delta)
+
+    for (user_id, is_payer), (share_amount, share_original_amount) in wanted.items():
+        participant = existing.get((user_id, is_payer))
+        if participant:
+            participant.share_amount = share_amount
+            participant.share_original_amount = share_original_amount
+        else:
+            expense.participants.append(ExpenseParticipant(
+                user_id=user_id,
+                is_payer=is_payer,
+                share_amount=share_amount,
+                share_original_amount=share_original_amount
+            ))
+
+    for key, participant in existing.items():
+        if key not in wanted:
+            expense.participants.remove(participant)
+
+def remove_expense_participants(expense):
+    """Reverse an expense's effect on the IOU ledger ahead of deleting it"""
+    for participant in expense.participants:
+        if not participant.is_payer and participant.user_id != expense.paid_by:
+            adjust_pairwise_balance(expense.paid_by, participant.user_id, -participant.share_amount)
+
+def delete_expense_participants(*criteria):
+    """
+    Remove participant rows for the expenses matching criteria, ahead of a bulk Expense delete,
+    and take those expenses back out of the IOU ledger
+    """
+    for creditor_id, debtor_id, amount in expense_debt_rows(*criteria):
+        adjust_pairwise_balance(creditor_id, debtor_id, -(amount or 0))
+    
+    # Bulk deletes skip the ORM events that keep category_period_spend current
+    mark_category_spend_changed(*criteria)
+
+    ExpenseParticipant.query.filter(
+        ExpenseParticipant.expense_id.in_(select(Expense.id).where(*criteria))
+    ).delete(synchronize_session=False)
+
+def adjust_pairwise_balance(creditor_id, debtor_id, amount):
+    """Record that debtor_id owes creditor_id an extra amount (negative to reduce it)"""
+    if not amount or creditor_id == debtor_id:
+        return
+
+    if creditor_id < debtor_id:
+        user_a, user_b, delta = creditor_id, debtor_id, amount
+    else:
+        user_a, user_b, delta = debtor_id, creditor_id, -amount
+
+    # Increment in SQL so concurrent writers can't lose each other's updates
+    updated = PairwiseBalance.query.filter_by(user_a=user_a, user_b=user_b).update(
+        {PairwiseBalance.amount: PairwiseBalance.amount + delta,
+         PairwiseBalance.updated_at: datetime.utcnow()},
+        synchronize_session=False
+    )
+    if not updated:
+        db.session.add(PairwiseBalance(user_a=user_a, user_b=user_b, amount=delta))
+        db.session.flush()
+
+def expense_debt_rows(*criteria):
+    """(creditor, debtor, amount) totals owed through expense splits, optionally filtered"""
+    return db.session.query(
+        Expense.paid_by,
+        ExpenseParticipant.user_id,
+        func.sum(ExpenseParticipant.share_amount)
+    ).join(
+        Expense, Expense.id == ExpenseParticipant.expense_id
+    ).filter(
+        ExpenseParticipant.is_payer.is_(False),
+        ExpenseParticipant.user_id != Expense.paid_by,
+        *criteria
+    ).group_by(Expense.paid_by, ExpenseParticipant.user_id).all()
+
+def compute_pairwise_balances(user_ids=None):
+    """
+    Rebuild the IOU ledger from the full expense and settlement history.
+    Returns {(user_a, user_b): amount} in the same orientation as PairwiseBalance;
+    limited to pairs involving user_ids when given.
+    """
+    expense_criteria = []
+    settlement_query = db.session.query(
+        Settlement.payer_id,
+        Settlement.receiver_id,
+        func.sum(Settlement.amount)
+    )
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        expense_criteria.append(or_(
+            Expense.paid_by.in_(user_ids),
+            ExpenseParticipant.user_id.in_(user_ids)
+        ))
+        settlement_query = settlement_query.filter(or_(
+            Settlement.payer_id.in_(user_ids),
+            Settlement.receiver_id.in_(user_ids)
+        ))
+
+    # A settlement paid by X to Y counts like an expense X covered for Y
+    debt_rows = expense_debt_rows(*expense_criteria)
+    debt_rows += settlement_query.group_by(Settlement.payer_id, Settlement.receiver_id).all()
+
+    balances = {}
+    for creditor_id, debtor_id, amount in debt_rows:
+        if creditor_id == debtor_id or not amount:
+            continue
+        if creditor_id < debtor_id:
+            key, delta = (creditor_id, debtor_id), amount
+        else:
+            key, delta = (debtor_id, creditor_id), -amount
+        balances[key] = balances.get(key, 0) + delta
+    return balances
+
+def rebuild_pairwise_balances(user_ids=None):
+    """Replace the stored ledger (or the pairs involving user_ids) with a from-scratch computation"""
+    balances = compute_pairwise_balances(user_ids)
+
+    stale = PairwiseBalance.query
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        stale = stale.filter(or_(
+            PairwiseBalance.user_a.in_(user_ids),
+            PairwiseBalance.user_b.in_(user_ids)
+        ))
+    stale.delete(synchronize_session=False)
+
+    for (user_a, user_b), amount in balances.items():
+        db.session.add(PairwiseBalance(user_a=user_a, user_b=user_b, amount=amount))
+    db.session.flush()
+    return len(balances)
+
+def verify_pairwise_balances(tolerance=0.01):
+    """Compare the stored ledger against a full recomputation; returns the mismatching pairs"""
+    expected = compute_pairwise_balances()
+    stored = {(row.user_a, row.user_b): row.amount for row in PairwiseBalance.query.all()}
+
+    mismatches = []
+    for key in sorted(set(expected) | set(stored)):
+        expected_amount = expected.get(key, 0)
+        stored_amount = stored.get(key, 0)
+        if abs(expected_amount - stored_amount) > tolerance:
+            mismatches.append({
+                'user_a': key[0],
+                'user_b': key[1],
+                'stored': stored_amount,
+                'expected': expected_amount
+            })
+    return mismatches
+
+def backfill_expense_participants(batch_size=500):
+    """
+    Recompute and store the split shares for every existing expense.
+    Safe to re-run; returns the number of expenses processed.
+    """
+    processed = 0
+    last_id = 0
+
+    while True:
+        batch = Expense.query.options(
+            selectinload(Expense.participants)
+        ).filter(Expense.id > last_id).order_by(Expense.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        users_by_id = load_users_for_expenses(batch)
+        for expense in batch:
+            try:
+                sync_expense_participants(expense, users_by_id)
+            except Exception as e:
+                app.logger.error(f"Error syncing participants for expense {expense.id}: {str(e)}")
+            processed += 1
+
+        last_id = batch[-1].id
         db.session.commit()
+        db.session.expunge_all()
+
+    return processed
+
 def calculate_iou_data(expenses, users):
     """Calculate who owes whom money based on expenses"""
     # Initialize data structure
@@ -2315,108 +3156,109 @@ def calculate_iou_data(expenses, users):
 
 def calculate_balances(user_id):
     """Calculate balances between the current user and all other users"""
-    balances = {}
-    
-    # Step 1: Calculate balances from expenses
-    expenses = Expense.query.filter(
+    # Read the user's rows from the IOU ledger; the amount is from user_a's point of view
+    ledger_rows = PairwiseBalance.query.filter(
         or_(
-            Expense.paid_by == user_id,
-            Expense.split_with.like(f'%{user_id}%')
+            PairwiseBalance.user_a == user_id,
+            PairwiseBalance.user_b == user_id
         )
     ).all()
     
-    for expense in expenses:
-        splits = expense.calculate_splits()
-        
-        # If current user paid for the expense
-        if expense.paid_by == user_id:
-            # Add what others owe to current user
-            for split in splits['splits']:
-                other_user_id = split['email']
-                if other_user_id != user_id:
-                    if other_user_id not in balances:
-                        other_user = User.query.filter_by(id=other_user_id).first()
-                        balances[other_user_id] = {
-                            'user_id': other_user_id,
-                            'name': other_user.name if other_user else 'Unknown',
-                            'email': other_user_id,
-                            'amount': 0
-                        }
-                    balances[other_user_id]['amount'] += split['amount']
+    amounts = {}
+    for row in ledger_rows:
+        if row.user_a == user_id:
+            amounts[row.user_b] = row.amount
         else:
-            # If someone else paid and current user owes them
-            payer_id = expense.paid_by
-            
-            # Find current user's portion
-            current_user_portion = 0
-            
-            # Check if current user is in the splits
-            for split in splits['splits']:
-                if split['email'] == user_id:
-                    current_user_portion = split['amount']
-                    break
-            
-            if current_user_portion > 0:
-                if payer_id not in balances:
-                    payer = User.query.filter_by(id=payer_id).first()
-                    balances[payer_id] = {
-                        'user_id': payer_id,
-                        'name': payer.name if payer else 'Unknown',
-                        'email': payer_id,
-                        'amount': 0
-                    }
-                balances[payer_id]['amount'] -= current_user_portion
-    
-    # Step 2: Adjust balances based on settlements
-    settlements = Settlement.query.filter(
-        or_(
-            Settlement.payer_id == user_id,
-            Settlement.receiver_id == user_id
-        )
-    ).all()
+            amounts[row.user_a] = -row.amount
     
-    for settlement in settlements:
-        if settlement.payer_id == user_id:
-            # Current user paid money to someone else
-            other_user_id = settlement.receiver_id
-            if other_user_id not in balances:
-                other_user = User.query.filter_by(id=other_user_id).first()
-                balances[other_user_id] = {
-                    'user_id': other_user_id,
-                    'name': other_user.name if other_user else 'Unknown',
-                    'email': other_user_id,
-                    'amount': 0
-                }
-            # FIX: When current user pays someone, it INCREASES how much they owe the current user
-            # Change from -= to += 
-            balances[other_user_id]['amount'] += settlement.amount
-            
-        elif settlement.receiver_id == user_id:
-            # Current user received money from someone else
-            other_user_id = settlement.payer_id
-            if other_user_id not in balances:
-                other_user = User.query.filter_by(id=other_user_id).first()
-                balances[other_user_id] = {
-                    'user_id': other_user_id,
-                    'name': other_user.name if other_user else 'Unknown',
-                    'email': other_user_id,
-                    'amount': 0
-                }
-            # FIX: When current user receives money, it DECREASES how much they're owed
-            # Change from += to -=
-            balances[other_user_id]['amount'] -= settlement.amount
+    # Only look up the names we actually need, in one query
+    amounts = {other_id: amount for other_id, amount in amounts.items() if abs(amount) > 0.01}
+    users_by_id = load_users_by_id(amounts.keys())
     
-    # Return only non-zero balances
-    return [balance for balance in balances.values() if abs(balance['amount']) > 0.01]
+    return [
+        {
+            'user_id': other_id,
+            'name': users_by_id[other_id].name if other_id in users_by_id else 'Unknown',
+            'email': other_id,
+            'amount': amount
+        }
+        for other_id, amount in amounts.items()
+    ]
+
+def month_bucket(column):
+    """Year and month of a date column as integers; works on SQLite and Postgres"""
+    return (
+        db.cast(db.extract('year', column), db.Integer),
+        db.cast(db.extract('month', column), db.Integer)
+    )
+
+def load_expense_rollup(user_id, now=None):
+    """
+    Build the dashboard/transactions rollups for a user with GROUP BY queries
+    instead of summing ORM rows in Python. User shares come from the stored
+    expense_participants rows. Totals are in the current base currency: the
+    stored amount_base, with shares scaled by it.
+    """
+    year, month = month_bucket(Expense.date)
+    visible = user_expense_filter(user_id)
+    base_share = ExpenseParticipant.share_amount * expense_base_ratio()
+
+    amount_rows = db.session.query(
+        year, month, Expense.transaction_type, Expense.card_used, Account.name,
+        func.sum(func.coalesce(Expense.amount_base, Expense.amount))
+    ).outerjoin(
+        Account, Expense.account_id == Account.id
+    ).filter(visible).group_by(
+        year, month, Expense.transaction_type, Expense.card_used, Account.name
+    ).all()
+
+    # The payer only counts as a contributor when they kept a share
+    contributor_rows = db.session.query(
+        year, month, Expense.transaction_type, ExpenseParticipant.user_id,
+        func.sum(base_share)
+    ).join(
+        Expense, ExpenseParticipant.expense_id == Expense.id
+    ).filter(
+        visible,
+        or_(ExpenseParticipant.is_payer == False, ExpenseParticipant.share_amount > 0)
+    ).group_by(
+        year, month, Expense.transaction_type, ExpenseParticipant.user_id
+    ).all()
+
+    # The user's share is the whole expense when they paid, their split otherwise
+    share_rows = db.session.query(
+        year, month, Expense.transaction_type,
+        func.sum(base_share)
+    ).join(
+        Expense, ExpenseParticipant.expense_id == Expense.id
+    ).filter(
+        visible,
+        or_(
+            Expense.paid_by == user_id,
+            and_(ExpenseParticipant.user_id == user_id, ExpenseParticipant.is_payer == False)
+        )
+    ).group_by(year, month, Expense.transaction_type).all()
 
-def get_base_currency():
-    """Get the current user's default currency or fall back to base currency if not set"""
-    if current_user.is_authenticated and current_user.default_currency_code and current_user.default_currency:
+    unique_cards = [card for (card,) in db.session.query(Expense.card_used).filter(
+        visible, Expense.paid_by == user_id
+    ).distinct()]
+
+    return ExpenseRollup.from_totals(
+        user_id, amount_rows, contributor_rows, share_rows,
+        unique_cards=unique_cards, now=now
+    )
+
+def get_base_currency(user=None):
+    """
+    Get the current user's (or the given user's) default currency or fall back to base currency if not set
+    """
+    user = user or current_user
+    if user.is_authenticated and user.default_currency_code and user.default_currency:
         # User has set a default currency, use that
         return {
-            'code': current_user.default_currency.code,
-            'symbol': current_user.default_currency.symbol,
-            'name': current_user.default_currency.name
+            'code': user.default_currency.code,
+            'symbol': user.default_currency.symbol,
+            'name': user.default_currency.name
         }
     else:
         # Fall back to system base currency if user has no preference
@@ -2605,6 +3447,53 @@ def send_group_invitation_email(user, group, inviter):
         return False
     
 
+def run_startup_backfills():
+    """
+    Fill derived tables an upgraded install starts without: expense participants,
+    stored base-currency amounts, the IOU ledger and category spend totals.
+    Claimed through run_scheduled_job so gunicorn workers starting together don't
+    race; the maintenance commands (flask backfill-participants, rebase-amounts,
+    verify-balances --fix, rebuild-category-spend) do the same by hand
+    """
+    with app.app_context():
+        # Existing installs start with empty expense_participants and IOU ledger tables - fill them once
+        ledger_empty = db.session.query(PairwiseBalance.user_a).first() is None
+        if db.session.query(ExpenseParticipant.id).first() is None and db.session.query(Expense.id).first() is not None:
+            app.logger.warning("expense_participants is empty - backfilling from existing expenses")
+            try:
+                count = backfill_expense_participants()
+                app.logger.info(f"Backfilled participants for {count} expenses")
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Error backfilling expense participants: {str(e)}")
+        
+        if db.session.query(Expense.id).filter(Expense.amount_base.is_(None)).first() is not None:
+            try:
+                count = rebase_amounts(only_missing=True)
+                app.logger.info(f"Stored base-currency amounts for {count} expenses")
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Error storing base-currency amounts: {str(e)}")
+        
+        if ledger_empty:
+            try:
+                count = rebuild_pairwise_balances()
+                db.session.commit()
+                if count:
+                    app.logger.info(f"Built IOU ledger with {count} user pairs")
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Error building IOU ledger: {str(e)}")
+        
+        if db.session.query(CategoryPeriodSpend.id).first() is None and db.session.query(Expense.id).first() is not None:
+            try:
+                count = rebuild_category_spend()
+                db.session.commit()
+                app.logger.info(f"Built {count} category spend totals")
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Error building category spend totals: {str(e)}")
+
 @app.before_first_request
 def check_db_structure():
     """
@@ -2650,6 +3539,39 @@ def check_db_structure():
             db.session.commit()
             app.logger.info("Added last_login column to users table")
             
+        # Stored base-currency amounts
+        for table in ('expenses', 'category_splits'):
+            columns = [col['name'] for col in inspector.get_columns(table)]
+            if 'amount_base' not in columns:
+                app.logger.warning(f"Missing amount_base column in {table} table - adding it now")
+                db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN amount_base FLOAT'))
+                db.session.commit()
+                app.logger.info(f"Added amount_base column to {table} table")
+        
+        # Indexes backing the participant-based expense lookups (create_all doesn't add them to existing tables)
+        db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_expenses_user_date ON expenses (user_id, date)'))
+        db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_expenses_paid_by ON expenses (paid_by)'))
+        db.session.commit()
+        
+        # SimpleFin transactions are deduplicated on (user, source, external id)
+        try:
+            db.session.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_expenses_import_external_id ON expenses (user_id, import_source, external_id) WHERE import_source = 'simplefin'"))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning(f"Could not create unique index on SimpleFin transactions, remove duplicate imports first: {str(e)}")
+        
+        # Recurring instances are unique per template and date
+        try:
+            db.session.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS uq_expenses_recurring_date ON expenses (recurring_id, date) WHERE recurring_id IS NOT NULL'))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning(f"Could not create unique index on recurring instances, remove duplicate instances first: {str(e)}")
+        
+        # Backfills of derived tables run in one worker only: the first to claim this hour's run
+        run_scheduled_job('startup_backfills', 'hourly', run_startup_backfills)
+            
         app.logger.info("Database structure check completed")
 
 @app.context_processor
@@ -2780,15 +3702,15 @@ def get_transaction_details(other_user_id):
     Fetch transaction details (expenses and settlements) between current user and another user
     """
     # Query expenses involving both users
-    expenses = Expense.query.filter(
+    expenses = Expense.query.options(selectinload(Expense.participants)).filter(
         or_(
             and_(
                 Expense.user_id == current_user.id, 
-                Expense.split_with.like(f'%{other_user_id}%')
+                split_participant_filter(other_user_id)
             ),
             and_(
                 Expense.user_id == other_user_id, 
-                Expense.split_with.like(f'%{current_user.id}%')
+                split_participant_filter(current_user.id)
             )
         )
     ).order_by(Expense.date.desc()).limit(20).all()
@@ -3323,6 +4245,11 @@ def create_demo_data(user_id):
         )
         db.session.add(budget3)
     
+    # Index the demo transactions for participant lookups
+    for expense in Expense.query.filter_by(user_id=user_id).all():
+        if not expense.participants:
+            sync_expense_participants(expense)
+    
     # Commit all changes
     try:
         db.session.commit()
@@ -3362,8 +4289,12 @@ def reset_demo_data(user_id):
             """), {'expense_ids': tuple(expense_ids) if len(expense_ids) > 1 else f"({expense_ids[0]})"})
             logger.info(f"Deleted expense tag associations")
         
-        # 4. Now delete expenses
+        # 4. Now delete expenses, their participant rows and spending totals
+        delete_expense_participants(Expense.user_id == user_id)
         expense_count = Expense.query.filter_by(user_id=user_id).delete()
+        CategoryPeriodSpend.query.filter_by(user_id=user_id).delete()
+        ImportJob.query.filter_by(user_id=user_id).delete()
+        MonthlyReportDelivery.query.filter_by(user_id=user_id).delete()
         logger.info(f"Deleted {expense_count} expenses")
         
         # 5. Delete recurring expenses
@@ -3381,6 +4312,8 @@ def reset_demo_data(user_id):
         # 8. Delete ignored patterns
         pattern_count = IgnoredRecurringPattern.query.filter_by(user_id=user_id).delete()
         logger.info(f"Deleted {pattern_count} ignored patterns")
+        RecurringCandidate.query.filter_by(user_id=user_id).delete()
+        RecurringDetectionState.query.filter_by(user_id=user_id).delete()
         
         # 9. Delete SimpleFin settings
         simplefin_count = SimpleFin.query.filter_by(user_id=user_id).delete()
@@ -3393,6 +4326,9 @@ def reset_demo_data(user_id):
         ).delete(synchronize_session=False)
         logger.info(f"Deleted {settlement_count} settlements")
         
+        # Recompute the demo user's IOU ledger rows from whatever history remains
+        rebuild_pairwise_balances([user_id])
+        
         # 11. Delete all accounts
         account_count = Account.query.filter_by(user_id=user_id).delete()
         logger.info(f"Deleted {account_count} accounts")
@@ -3407,6 +4343,7 @@ def reset_demo_data(user_id):
         
         # Commit the transaction
         db.session.commit()
+        invalidate_category_rules(user_id)
         logger.info("Demo data reset successful")
         return True
     except Exception as e:
@@ -3583,26 +4520,7 @@ def login():
                 except Exception as e:
                     app.logger.error(f"Error checking SimpleFin sync status: {str(e)}")
                     # Don't show error to user to keep login smooth
-            # Investment price sync
-            if app.config.get('INVESTMENT_TRACKING_ENABLED', False):
-                try:
-                    # Start investment price sync in background thread
-                    investment_sync_thread = threading.Thread(
-                        target=sync_investment_prices,
-                        args=(user.id,)
-                    )
-                    investment_sync_thread.daemon = True
-                    investment_sync_thread.start()
-                except Exception as e:
-                    app.logger.error(f"Error starting investment price sync: {str(e)}")
-            
-            import threading
-            detection_thread = threading.Thread(
-                target=detect_recurring_transactions,
-                args=(user.id,)
-            )
-            detection_thread.daemon = True
-            detection_thread.start()
+            # Investment prices and stale recurring candidates are refreshed by the scheduled jobs
 
             db.session.commit()
             return redirect(url_for('dashboard'))
@@ -3661,174 +4579,53 @@ def logout():
 #--------------------
 # ROUTES: DASHBOARD
 #--------------------
+# Months shown in the dashboard's monthly breakdown; older months are on the transactions page
+DASHBOARD_RECENT_MONTHS = 6
+
 @app.route('/dashboard')
 @login_required_dev
 @demo_time_limited
 def dashboard():
     now = datetime.now()
     base_currency = get_base_currency()
-    # Fetch all expenses where the user is either the creator or a split participant
-    expenses = Expense.query.filter(
-        or_(
-            Expense.user_id == current_user.id,
-            Expense.split_with.like(f'%{current_user.id}%')
-        )
-    ).order_by(Expense.date.desc()).all()
-    
-    users = User.query.all()
-    groups = Group.query.join(group_users).filter(group_users.c.user_id == current_user.id).all()
-    # Synchronize investment portfolios with linked accounts
-    sync_investments_with_accounts(current_user.id)
-    # Pre-calculate expense splits to avoid repeated calculations in template
-    expense_splits = {}
-    for expense in expenses:
-        expense_splits[expense.id] = expense.calculate_splits()
-    
-    # Calculate monthly totals with contributors
-    monthly_totals = {}
-    if expenses:
-        for expense in expenses:
-            month_key = expense.date.strftime('%Y-%m')
-            if month_key not in monthly_totals:
-                monthly_totals[month_key] = {
-                    'total': 0.0,
-                    'by_card': {},
-                    'contributors': {},
-                    'by_account': {}  # New: track by account
-                }
-            
-            # Add to total - MODIFIED: Only add expenses, not income or transfers
-            if not hasattr(expense, 'transaction_type') or expense.transaction_type == 'expense':
-                monthly_totals[month_key]['total'] += expense.amount
-                
-                # Add to card totals
-                if expense.card_used not in monthly_totals[month_key]['by_card']:
-                    monthly_totals[month_key]['by_card'][expense.card_used] = 0
-                monthly_totals[month_key]['by_card'][expense.card_used] += expense.amount
-                
-                # Add to account totals if available
-                if hasattr(expense, 'account') and expense.account:
-                    account_name = expense.account.name
-                    if account_name not in monthly_totals[month_key]['by_account']:
-                        monthly_totals[month_key]['by_account'][account_name] = 0
-                    monthly_totals[month_key]['by_account'][account_name] += expense.amount
-                
-                # Calculate splits and add to contributors
-                splits = expense_splits[expense.id]
-                
-                # Add payer's portion
-                if splits['payer']['amount'] > 0:
-                    payer_email = splits['payer']['email']
-                    if payer_email not in monthly_totals[month_key]['contributors']:
-                        monthly_totals[month_key]['contributors'][payer_email] = 0
-                    monthly_totals[month_key]['contributors'][payer_email] += splits['payer']['amount']
-                
-                # Add other contributors' portions
-                for split in splits['splits']:
-                    if split['email'] not in monthly_totals[month_key]['contributors']:
-                        monthly_totals[month_key]['contributors'][split['email']] = 0
-                    monthly_totals[month_key]['contributors'][split['email']] += split['amount']
-    
-    # Calculate total expenses for current user (only their portions for the current year)
-    current_year = now.year
-    total_expenses = 0
-    total_expenses_only = 0  # NEW: For expenses only
-    # Add these calculations for income and transfers
-    total_income = 0
-    total_transfers = 0
-    monthly_labels = []
-    monthly_amounts = []
-
-    # Sort monthly totals to ensure chronological order
-    sorted_monthly_totals = sorted(monthly_totals.items(), key=lambda x: x[0])
-
-    for month, data in sorted_monthly_totals:
-        monthly_labels.append(month)
-        monthly_amounts.append(data['total'])
-        # Calculate totals for each transaction type
-    for expense in expenses:
-        if hasattr(expense, 'transaction_type'):
-            if expense.transaction_type == 'income':
-                total_income += expense.amount
-            elif expense.transaction_type == 'transfer':
-                total_transfers += expense.amount
-    
-    # Calculate derived metrics
-    net_cash_flow = total_income - total_expenses_only
-    
-    # Calculate savings rate if income is not zero
-    if total_income > 0:
-        savings_rate = (net_cash_flow / total_income) * 100
-    else:
-        savings_rate = 0
-    for expense in expenses:
-        # Skip if not in current year
-        if expense.date.year != current_year:
-            continue
-        
-        # NEW: Check if it's an expense
-        is_expense = not hasattr(expense, 'transaction_type') or expense.transaction_type == 'expense'
-            
-        splits = expense_splits[expense.id]
-        
-        if expense.paid_by == current_user.id:
-            # If user paid, add their own portion
-            total_expenses += splits['payer']['amount']
-            if is_expense:
-                total_expenses_only += splits['payer']['amount']
-            
-            # Also add what others owe them (the entire expense)
-            for split in splits['splits']:
-                total_expenses += split['amount']
-                if is_expense:
-                    total_expenses_only += split['amount']
-        else:
-            # If someone else paid, add only this user's portion
-            for split in splits['splits']:
-                if split['email'] == current_user.id:
-                    total_expenses += split['amount']
-                    if is_expense:
-                        total_expenses_only += split['amount']
-                    break
-        
-    # Calculate current month's total for the current user
-    current_month_total = 0
-    current_month_expenses_only = 0  # NEW: For expenses only
-    current_month = now.strftime('%Y-%m')
-    
-    for expense in expenses:
-        # Skip if not in current month
-        if expense.date.strftime('%Y-%m') != current_month:
-            continue
-            
-        # NEW: Check if it's an expense
-        is_expense = not hasattr(expense, 'transaction_type') or expense.transaction_type == 'expense'
-            
-        splits = expense_splits[expense.id]
-        
-        if expense.paid_by == current_user.id:
-            # If user paid, add their own portion
-            current_month_total += splits['payer']['amount']
-            if is_expense:
-                current_month_expenses_only += splits['payer']['amount']
-            
-            # Also add what others owe them (the entire expense)
-            for split in splits['splits']:
-                current_month_total += split['amount']
-                if is_expense:
-                    current_month_expenses_only += split['amount']
-        else:
-            # If someone else paid, add only this user's portion
-            for split in splits['splits']:
-                if split['email'] == current_user.id:
-                    current_month_total += split['amount']
-                    if is_expense:
-                        current_month_expenses_only += split['amount']
-                    break
-
+    # Only the months in the breakdown table are rendered row by row
+    recent_start = add_months(datetime(now.year, now.month, 1), 1 - DASHBOARD_RECENT_MONTHS)
+    expenses = Expense.query.options(selectinload(Expense.participants)).filter(
+        user_expense_filter(current_user.id),
+        Expense.date >= recent_start
+    ).order_by(Expense.date.desc()).all()
+    
+    users = User.query.all()
+    groups = Group.query.join(group_users).filter(group_users.c.user_id == current_user.id).all()
+    # Synchronize investment portfolios with linked accounts
+    sync_investments_with_accounts(current_user.id)
+    # Splits are only shown for the expense rows in the breakdown
+    expense_splits = {expense.id: expense.calculate_splits() for expense in expenses
+                      if not expense.transaction_type or expense.transaction_type == 'expense'}
+    
+    # Monthly, per-type and year/month-to-date rollups are summed in the database
+    rollup = load_expense_rollup(current_user.id, now=now)
+    first_recent_month = recent_start.strftime('%Y-%m')
+    monthly_totals = {month: totals for month, totals in rollup.expense_monthly_totals.items()
+                      if month >= first_recent_month}
+    older_months = len(rollup.expense_monthly_totals) - len(monthly_totals)
+
+    total_expenses = rollup.year_total
+    total_expenses_only = rollup.year_expense_total
+    current_month_total = rollup.month_total
+    current_month_expenses_only = rollup.month_expense_total
+    total_income = rollup.type_total('income')
+    total_transfers = rollup.type_total('transfer')
+
+    # The chart covers every month, in chronological order
+    monthly_labels = sorted(rollup.expense_monthly_totals)
+    monthly_amounts = [rollup.expense_monthly_totals[month]['total'] for month in monthly_labels]
+
+    # Calculate derived metrics: income less this year's expenses, and the savings rate
+    net_cash_flow, savings_rate = rollup.cash_flow()
 
     # Get unique cards (only where current user paid)
-    unique_cards = set(expense.card_used for expense in expenses if expense.paid_by == current_user.id)
+    unique_cards = rollup.unique_cards
     
     # Calculate balances using the settlements method
     balances = calculate_balances(current_user.id)
@@ -3879,8 +4676,9 @@ def dashboard():
     return render_template('dashboard.html', 
                          expenses=expenses,
                          expense_splits=expense_splits,
-                         top_categories = get_category_spending(expenses, expense_splits),
+                         top_categories = get_category_spending(current_user.id),
                          monthly_totals=monthly_totals,
+                         older_months=older_months,
                          total_expenses=total_expenses,
                          total_expenses_only=total_expenses_only,  # NEW: For expenses only
                          current_month_total=current_month_total,
@@ -3909,44 +4707,44 @@ def dashboard():
 
 from datetime import datetime
 
-def get_category_spending(expenses, expense_splits):
-    current_month = datetime.now().month
-    current_year = datetime.now().year
+def get_category_spending(user_id):
+    """Top categories for this month's expenses, summed in the database"""
+    now = datetime.now()
+    month_start = datetime(now.year, now.month, 1)
+    next_month = (month_start + timedelta(days=32)).replace(day=1)
+    
+    current_month_expenses = [
+        user_expense_filter(user_id),
+        Expense.transaction_type == 'expense',
+        Expense.date >= month_start,
+        Expense.date < next_month
+    ]
+    category_columns = (Category.id, Category.name, Category.color, Category.icon)
+    
+    # Expenses split across categories count each split under its own category
+    split_rows = db.session.query(
+        *category_columns, func.sum(CategorySplit.amount)
+    ).join(
+        CategorySplit, CategorySplit.category_id == Category.id
+    ).join(
+        Expense, CategorySplit.expense_id == Expense.id
+    ).filter(*current_month_expenses).group_by(*category_columns).all()
+    
+    # Everything else counts under the expense's own category
+    direct_rows = db.session.query(
+        *category_columns, func.sum(Expense.amount)
+    ).join(
+        Expense, Expense.category_id == Category.id
+    ).filter(
+        *current_month_expenses,
+        ~Expense.category_splits.any()
+    ).group_by(*category_columns).all()
     
     category_totals = {}
-    
-    for expense in expenses:
-        # Skip non-expenses
-        if hasattr(expense, 'transaction_type') and expense.transaction_type != 'expense':
-            continue
-        
-        # Filter expenses for the current month and year
-        if expense.date.month != current_month or expense.date.year != current_year:
-            continue
-        
-        # Handle category splits first
-        if expense.category_splits:
-            for split in expense.category_splits:
-                if split.category:
-                    category_name = split.category.name
-                    if category_name not in category_totals:
-                        category_totals[category_name] = {
-                            'amount': 0,
-                            'color': split.category.color,
-                            'icon': split.category.icon
-                        }
-                    category_totals[category_name]['amount'] += split.amount
-        
-        # Handle regular category if no splits
-        elif expense.category:
-            category_name = expense.category.name
-            if category_name not in category_totals:
-                category_totals[category_name] = {
-                    'amount': 0,
-                    'color': expense.category.color,
-                    'icon': expense.category.icon
-                }
-            category_totals[category_name]['amount'] += expense.amount
+    for _, name, color, icon, amount in split_rows + direct_rows:
+        if name not in category_totals:
+            category_totals[name] = {'amount': 0, 'color': color, 'icon': icon}
+        category_totals[name]['amount'] += amount or 0
     
     # Sort and return top categories
     sorted_categories = sorted(
@@ -4170,6 +4968,8 @@ def add_expense():
             )
             
             db.session.add(expense)
+            sync_expense_participants(expense)
+            sync_amount_base([expense])
             
             # NEW CODE: Update account balances
             if account_id:
@@ -4249,7 +5049,8 @@ def delete_expense(expense_id):
                     if destination_account:
                         destination_account.balance -= expense.amount
         
-        # Delete the expense
+        # Delete the expense (participant rows cascade, the IOU ledger is reversed first)
+        remove_expense_participants(expense)
         db.session.delete(expense)
         db.session.commit()
         
@@ -4371,10 +5172,22 @@ def update_expense(expense_id):
             # Keep existing date if conversion fails
             pass
         
+        # The form edits the base-currency amount and keeps the transaction's currency.
+        # amount_base (and any later re-base) is converted from original_amount, so
+        # recompute it from the new amount at the rate on the transaction date, as the
+        # form says; otherwise the edit would be lost the next time amounts are re-based
+        if amount_difference and expense.original_amount is not None and expense.currency_code:
+            expense.original_amount = convert_currency_on(
+                expense.amount, get_currency_rates().base_code, expense.currency_code, expense.date
+            )
+        
         # Handle category splits toggle - this determines which category approach to use
         enable_category_split = request.form.get('enable_category_split') == 'on'
         expense.has_category_splits = enable_category_split
         
+        # Existing splits are replaced below; keep the new ones for their base amounts
+        new_category_splits = []
+        
         if enable_category_split:
             # When using splits, the main category becomes optional
             expense.category_id = None
@@ -4400,6 +5213,7 @@ def update_expense(expense_id):
                             amount=amount
                         )
                         db.session.add(category_split)
+                        new_category_splits.append(category_split)
                 
                 # Validate that splits add up to the total
                 total_splits = sum(float(split.get('amount', 0)) for split in splits)
@@ -4501,6 +5315,10 @@ def update_expense(expense_id):
                         if new_dest_account:
                             new_dest_account.balance += expense.amount
         
+        # Amount may have changed, so refresh the stored shares and base amount
+        sync_expense_participants(expense)
+        sync_amount_base([expense], category_splits=new_category_splits)
+        
         # Save changes
         db.session.commit()
         flash('Transaction updated successfully!')
@@ -4954,92 +5772,83 @@ def update_recurring(recurring_id):
 
 
 
+def load_recurring_candidate(candidate_id):
+    """The current user's stored candidate for a page candidate ID, as a dict, or None"""
+    try:
+        row_id = int(candidate_id.rsplit('_', 1)[-1])
+    except ValueError:
+        return None
+    candidate = RecurringCandidate.query.filter_by(id=row_id, user_id=current_user.id).first()
+    return candidate.to_dict() if candidate else None
+
 @app.route('/detect_recurring_transactions')
 @login_required_dev
 def get_recurring_transactions():
-    """API endpoint to detect recurring transactions for the current user"""
+    """API endpoint listing the current user's detected recurring transactions"""
     try:
-        # Default to 60 days lookback and 2 min occurrences
-        lookback_days = int(request.args.get('lookback_days', 60))
-        min_occurrences = int(request.args.get('min_occurrences', 2))
-        
-        # Detect recurring transactions - no extra context needed
-        # since we're already in a request context
-        candidates = detect_recurring_transactions(
-            current_user.id, 
-            lookback_days=lookback_days,
-            min_occurrences=min_occurrences
-        )
+        # Candidates are precomputed; only a user's first visit runs detection here.
+        # Stale candidates are served until the recurring_detection job refreshes them
+        if RecurringDetectionState.query.get(current_user.id) is None:
+            try:
+                refresh_recurring_candidates(current_user.id)
+            except exc.IntegrityError:
+                # A concurrent first visit got there first; read what it stored
+                db.session.rollback()
+        
+        candidates = RecurringCandidate.query.filter_by(user_id=current_user.id).order_by(
+            RecurringCandidate.confidence.desc()
+        ).all()
         
         # Get base currency symbol for formatting
         base_currency = get_base_currency()
         currency_symbol = base_currency['symbol'] if isinstance(base_currency, dict) else base_currency.symbol
         
         # Get all ignored patterns for this user
-        ignored_patterns = IgnoredRecurringPattern.query.filter_by(user_id=current_user.id).all()
-        ignored_keys = [pattern.pattern_key for pattern in ignored_patterns]
+        ignored_keys = {pattern_key for (pattern_key,) in db.session.query(IgnoredRecurringPattern.pattern_key).filter_by(
+            user_id=current_user.id
+        ).all()}
+        candidates = [candidate for candidate in candidates if candidate.pattern_key not in ignored_keys]
+        
+        # Account and category names in one query each
+        account_ids = {candidate.account_id for candidate in candidates if candidate.account_id}
+        category_ids = {candidate.category_id for candidate in candidates if candidate.category_id}
+        accounts = {account.id: account for account in Account.query.filter(Account.id.in_(account_ids)).all()} if account_ids else {}
+        categories = {category.id: category for category in Category.query.filter(Category.id.in_(category_ids)).all()} if category_ids else {}
         
         # Prepare response data
         candidate_data = []
         for candidate in candidates:
-            # Create a unique pattern key for this candidate
-            pattern_key = f"{candidate['description']}_{candidate['amount']}_{candidate['frequency']}"
-            
-            # Skip if this pattern is in the ignored list
-            if pattern_key in ignored_keys:
-                continue
-                
-            # Create a candidate ID that's stable across requests
-            candidate_id = f"candidate_{hash(pattern_key) & 0xffffffff}"
-                
-            # Create a serializable version of the candidate
             candidate_dict = {
-                'id': candidate_id,  # Use a stable ID based on pattern
-                'description': candidate['description'],
-                'amount': candidate['amount'],
-                'currency_code': candidate['currency_code'],
-                'frequency': candidate['frequency'],
-                'confidence': candidate['confidence'],
-                'occurrences': candidate['occurrences'],
-                'next_date': candidate['next_date'].isoformat(),
-                'avg_interval': candidate['avg_interval'],
-                'transaction_type': candidate['transaction_type'],
+                'id': candidate.candidate_id,
+                'description': candidate.description,
+                'amount': candidate.amount,
+                'currency_code': candidate.currency_code,
+                'frequency': candidate.frequency,
+                'confidence': candidate.confidence,
+                'occurrences': candidate.occurrences,
+                'next_date': candidate.next_date.isoformat(),
+                'avg_interval': candidate.avg_interval,
+                'transaction_type': candidate.transaction_type,
                 # Include account and category info if available
-                'account_id': candidate['account_id'],
-                'category_id': candidate['category_id'],
+                'account_id': candidate.account_id,
+                'category_id': candidate.category_id,
                 'account_name': None,
                 'category_name': None
             }
             
             # Add account name if available
-            if candidate['account_id']:
-                account = Account.query.get(candidate['account_id'])
-                if account:
-                    candidate_dict['account_name'] = account.name
+            account = accounts.get(candidate.account_id)
+            if account:
+                candidate_dict['account_name'] = account.name
             
             # Add category name if available
-            if candidate['category_id']:
-                category = Category.query.get(candidate['category_id'])
-                if category:
-                    candidate_dict['category_name'] = category.name
-                    candidate_dict['category_icon'] = category.icon
-                    candidate_dict['category_color'] = category.color
+            category = categories.get(candidate.category_id)
+            if category:
+                candidate_dict['category_name'] = category.name
+                candidate_dict['category_icon'] = category.icon
+                candidate_dict['category_color'] = category.color
             
             candidate_data.append(candidate_dict)
-            
-            # Store candidate in session for later reference
-            # Use the stable candidate ID as the session key
-            session_key = f'recurring_candidate_{candidate_id}'
-            session[session_key] = {
-                'description': candidate['description'],
-                'amount': candidate['amount'],
-                'currency_code': candidate['currency_code'],
-                'frequency': candidate['frequency'],
-                'account_id': candidate['account_id'],
-                'category_id': candidate['category_id'],
-                'transaction_type': candidate['transaction_type'],
-                'transaction_ids': candidate['transaction_ids']
-            }
         
         return jsonify({
             'success': True,
@@ -5048,6 +5857,7 @@ def get_recurring_transactions():
         })
         
     except Exception as e:
+        db.session.rollback()
         app.logger.error(f"Error detecting recurring transactions: {str(e)}")
         return jsonify({
             'success': False,
@@ -5060,9 +5870,8 @@ def get_recurring_transactions():
 def recurring_candidate_history(candidate_id):
     """Get transaction history for a recurring candidate"""
     try:
-        # Get stored candidate data from session
-        session_key = f'recurring_candidate_{candidate_id}'
-        candidate_data = session.get(session_key)
+        # Get the stored candidate
+        candidate_data = load_recurring_candidate(candidate_id)
         
         if not candidate_data:
             return jsonify({
@@ -5077,26 +5886,30 @@ def recurring_candidate_history(candidate_id):
         base_currency = get_base_currency()
         currency_symbol = base_currency['symbol'] if isinstance(base_currency, dict) else base_currency.symbol
         
-        # Fetch the actual transactions
+        # Fetch the actual transactions, in one query over the full history
         transactions = []
-        for tx_id in transaction_ids:
-            expense = Expense.query.get(tx_id)
-            if expense and expense.user_id == current_user.id:
-                tx_data = {
-                    'id': expense.id,
-                    'description': expense.description,
-                    'amount': expense.amount,
-                    'date': expense.date.isoformat(),
-                    'account_name': expense.account.name if expense.account else None
-                }
-                
-                # Add category information if available
-                if hasattr(expense, 'category') and expense.category:
-                    tx_data['category_name'] = expense.category.name
-                    tx_data['category_icon'] = expense.category.icon
-                    tx_data['category_color'] = expense.category.color
-                
-                transactions.append(tx_data)
+        expenses = Expense.query.options(
+            selectinload(Expense.account), selectinload(Expense.category)
+        ).filter(
+            Expense.id.in_(transaction_ids),
+            Expense.user_id == current_user.id
+        ).all() if transaction_ids else []
+        for expense in expenses:
+            tx_data = {
+                'id': expense.id,
+                'description': expense.description,
+                'amount': expense.amount,
+                'date': expense.date.isoformat(),
+                'account_name': expense.account.name if expense.account else None
+            }
+            
+            # Add category information if available
+            if hasattr(expense, 'category') and expense.category:
+                tx_data['category_name'] = expense.category.name
+                tx_data['category_icon'] = expense.category.icon
+                tx_data['category_color'] = expense.category.color
+            
+            transactions.append(tx_data)
         
         # Sort transactions by date (newest first)
         transactions.sort(key=lambda x: x['date'], reverse=True)
@@ -5185,9 +5998,8 @@ def convert_to_recurring(candidate_id):
         else:
             # Standard conversion (not edit)
             
-            # Get candidate data from session
-            session_key = f'recurring_candidate_{candidate_id}'
-            candidate_data = session.get(session_key)
+            # Get the stored candidate
+            candidate_data = load_recurring_candidate(candidate_id)
             
             if not candidate_data:
                 return jsonify({
@@ -5223,9 +6035,8 @@ def convert_to_recurring(candidate_id):
 def ignore_recurring_candidate(candidate_id):
     """Mark a recurring transaction pattern as ignored"""
     try:
-        # Get candidate data from session
-        session_key = f'recurring_candidate_{candidate_id}'
-        candidate_data = session.get(session_key)
+        # Get the stored candidate
+        candidate_data = load_recurring_candidate(candidate_id)
         
         if not candidate_data:
             return jsonify({
@@ -5233,8 +6044,7 @@ def ignore_recurring_candidate(candidate_id):
                 'message': 'Candidate details not found. Please refresh the page and try again.'
             }), 404
         
-        # Create pattern key for this candidate
-        pattern_key = f"{candidate_data['description']}_{candidate_data['amount']}_{candidate_data['frequency']}"
+        pattern_key = candidate_data['pattern_key']
         
         # Check if already ignored
         existing = IgnoredRecurringPattern.query.filter_by(
@@ -5577,6 +6387,7 @@ def delete_group(group_id):
         expense_count = session.get('delete_group_expense_count', 0)
         
         # Delete associated expenses first
+        delete_expense_participants(Expense.group_id == group_id)
         Expense.query.filter_by(group_id=group_id).delete()
         
         # Delete the group
@@ -5684,13 +6495,21 @@ def admin_delete_user(user_id):
         
         # 3. Delete expenses
         app.logger.info("Deleting expenses...")
+        delete_expense_participants(Expense.user_id == user_id)
+        ExpenseParticipant.query.filter_by(user_id=user_id).delete()
         Expense.query.filter_by(user_id=user_id).delete()
+        CategoryPeriodSpend.query.filter_by(user_id=user_id).delete()
+        ImportJob.query.filter_by(user_id=user_id).delete()
+        MonthlyReportDelivery.query.filter_by(user_id=user_id).delete()
         
         # 4. Delete settlements
         app.logger.info("Deleting settlements...")
         Settlement.query.filter(
             or_(Settlement.payer_id == user_id, Settlement.receiver_id == user_id)
         ).delete(synchronize_session=False)
+        PairwiseBalance.query.filter(
+            or_(PairwiseBalance.user_a == user_id, PairwiseBalance.user_b == user_id)
+        ).delete(synchronize_session=False)
         
         # 5. Delete category mappings
         app.logger.info("Deleting category mappings...")
@@ -5703,6 +6522,8 @@ def admin_delete_user(user_id):
         # 7. Delete ignored recurring patterns
         app.logger.info("Deleting ignored patterns...")
         IgnoredRecurringPattern.query.filter_by(user_id=user_id).delete()
+        RecurringCandidate.query.filter_by(user_id=user_id).delete()
+        RecurringDetectionState.query.filter_by(user_id=user_id).delete()
         
         # 8. Handle user's accounts
         app.logger.info("Deleting accounts...")
@@ -5750,6 +6571,7 @@ def admin_delete_user(user_id):
         
         # Commit all changes
         db.session.commit()
+        invalidate_category_rules(user_id)
         app.logger.info(f"User {user_id} deleted successfully")
         flash('User deleted successfully!')
         
@@ -5885,10 +6707,12 @@ def add_settlement():
         )
         
         db.session.add(settlement)
+        adjust_pairwise_balance(settlement.payer_id, settlement.receiver_id, settlement.amount)
         db.session.commit()
         flash('Settlement recorded successfully!')
         
     except Exception as e:
+        db.session.rollback()
         flash(f'Error: {str(e)}')
         
     return redirect(url_for('settlements'))
@@ -5945,6 +6769,7 @@ def add_currency():
     
     try:
         db.session.commit()
+        invalidate_currency_rates()
         flash(f'Currency {code} added successfully')
     except Exception as e:
         db.session.rollback()
@@ -5977,6 +6802,7 @@ def update_currency(code):
     
     try:
         db.session.commit()
+        invalidate_currency_rates()
         flash(f'Currency {code} updated successfully')
     except Exception as e:
         db.session.rollback()
@@ -6019,6 +6845,7 @@ def delete_currency(code):
         # Remove the currency
         db.session.delete(currency)
         db.session.commit()
+        invalidate_currency_rates()
         
         return jsonify({
             'success': True, 
@@ -6063,6 +6890,9 @@ def set_base_currency(code):
         if current_base_currency:
             # Unset current base currency
             current_base_currency.is_base = False
+            
+            # Keep the rate history usable against the new base
+            rebase_currency_history(current_base_currency.code, code)
         
         # Set new base currency
         new_base_currency.is_base = True
@@ -6077,8 +6907,12 @@ def set_base_currency(code):
             # Log the error but don't prevent the base currency change
             app.logger.error(f"Error updating rates after base currency change: {str(rate_update_error)}")
         
+        # Stored base-currency amounts are recomputed by the amount_rebase job
+        mark_amounts_for_rebase()
+        
         # Commit changes
         db.session.commit()
+        invalidate_currency_rates()
         
         flash(f'Base currency successfully changed to {code}.', 'success')
     except Exception as e:
@@ -6132,127 +6966,150 @@ def set_default_currency():
 # ROUTES: Transactions
 #--------------------
 
+TRANSACTIONS_PAGE_SIZE = 50
+TRANSACTIONS_MAX_PAGE_SIZE = 200
+
+def transaction_list_filters(user_id, args):
+    """
+    Build the SQL filters for the transactions list from request args.
+    Raises ValueError for malformed dates or amounts.
+    """
+    filters = [user_expense_filter(user_id)]
+    
+    start_date = args.get('startDate')
+    end_date = args.get('endDate')
+    if start_date:
+        filters.append(Expense.date >= datetime.strptime(start_date, '%Y-%m-%d'))
+    if end_date:
+        # The end date is inclusive, so include the whole day
+        filters.append(Expense.date < datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1))
+    
+    transaction_type = args.get('transactionType', 'all')
+    if transaction_type == 'expense':
+        # Legacy rows without a type are expenses
+        filters.append(or_(Expense.transaction_type == 'expense', Expense.transaction_type.is_(None)))
+    elif transaction_type in ('income', 'transfer'):
+        filters.append(Expense.transaction_type == transaction_type)
+    
+    category_id = args.get('categoryId', 'all')
+    if category_id == 'none':
+        filters.append(Expense.category_id.is_(None))
+    elif category_id and category_id != 'all':
+        filters.append(Expense.category_id == int(category_id))
+    
+    account_id = args.get('accountId', 'all')
+    if account_id and account_id != 'all':
+        account_id = int(account_id)
+        filters.append(or_(Expense.account_id == account_id, Expense.destination_account_id == account_id))
+    
+    card_used = args.get('cardUsed', 'all')
+    if card_used and card_used != 'all':
+        filters.append(Expense.card_used == card_used)
+    
+    min_amount = args.get('minAmount')
+    max_amount = args.get('maxAmount')
+    if min_amount:
+        filters.append(func.abs(Expense.amount) >= float(min_amount))
+    if max_amount:
+        filters.append(func.abs(Expense.amount) <= float(max_amount))
+    
+    description = args.get('description', '').strip()
+    if description:
+        filters.append(Expense.description.ilike(f'%{description}%'))
+    
+    # Free-text search box; ">100" and "<100" compare amounts
+    search = args.get('search', '').strip()
+    if search:
+        if search[0] in '<>' and search[1:].strip():
+            try:
+                amount = float(search[1:])
+            except ValueError:
+                amount = None
+            if amount is not None:
+                amount_filter = func.abs(Expense.amount) > amount if search[0] == '>' else func.abs(Expense.amount) < amount
+                filters.append(amount_filter)
+                return filters
+        filters.append(or_(
+            Expense.description.ilike(f'%{search}%'),
+            Expense.card_used.ilike(f'%{search}%')
+        ))
+    
+    return filters
+
+def encode_transaction_cursor(expense):
+    """Keyset cursor for the row after which the next page starts"""
+    return f"{expense.date.isoformat()}|{expense.id}"
+
+def decode_transaction_cursor(cursor):
+    """Turn a cursor back into a filter on (date, id), newest first"""
+    date_part, id_part = cursor.rsplit('|', 1)
+    cursor_date = datetime.fromisoformat(date_part)
+    cursor_id = int(id_part)
+    return or_(
+        Expense.date < cursor_date,
+        and_(Expense.date == cursor_date, Expense.id < cursor_id)
+    )
+
+def load_transaction_page(filters, cursor=None, limit=TRANSACTIONS_PAGE_SIZE):
+    """
+    Fetch one page of transactions ordered by (date, id) descending.
+    Returns (expenses, next_cursor); next_cursor is None on the last page.
+    """
+    query = Expense.query.options(
+        selectinload(Expense.participants),
+        selectinload(Expense.category_splits),
+        selectinload(Expense.account),
+        selectinload(Expense.destination_account),
+        selectinload(Expense.category)
+    ).filter(*filters)
+    
+    if cursor:
+        query = query.filter(decode_transaction_cursor(cursor))
+    
+    # Fetch one extra row to know whether another page exists
+    expenses = query.order_by(Expense.date.desc(), Expense.id.desc()).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(expenses) > limit:
+        expenses = expenses[:limit]
+        next_cursor = encode_transaction_cursor(expenses[-1])
+    
+    return expenses, next_cursor
+
 @app.route('/transactions')
 @login_required_dev
 @demo_time_limited
 def transactions():
-    """Display all transactions with filtering capabilities"""
-    # Fetch all expenses where the user is either the creator or a split participant
+    """Display the first page of transactions; later pages load from transactions_data"""
     base_currency = get_base_currency()
-    expenses = Expense.query.filter(
-        or_(
-            Expense.user_id == current_user.id,
-            Expense.split_with.like(f'%{current_user.id}%')
-        )
-    ).order_by(Expense.date.desc()).all()
+    
+    # Only the newest page is rendered here; the rest is fetched as the user scrolls
+    filters = transaction_list_filters(current_user.id, {})
+    expenses, next_cursor = load_transaction_page(filters)
+    total_count = db.session.query(func.count(Expense.id)).filter(*filters).scalar()
     
     # Get all user accounts
     accounts = Account.query.filter_by(user_id=current_user.id).all()
     
     users = User.query.all()
     
-    # Pre-calculate all expense splits to avoid repeated calculations
-    expense_splits = {}
-    for expense in expenses:
-        expense_splits[expense.id] = expense.calculate_splits()
-    
-    # Calculate total expenses for current user (similar to dashboard calculation)
-    now = datetime.now()
-    current_year = now.year
-    total_expenses = 0
-
-    for expense in expenses:
-        # Skip if not in current year
-        if expense.date.year != current_year:
-            continue
-            
-        splits = expense_splits[expense.id]
-        
-        if expense.paid_by == current_user.id:
-            # If user paid, add their own portion
-            total_expenses += splits['payer']['amount']
-            
-            # Also add what others owe them (the entire expense)
-            for split in splits['splits']:
-                total_expenses += split['amount']
-        else:
-            # If someone else paid, add only this user's portion
-            for split in splits['splits']:
-                if split['email'] == current_user.id:
-                    total_expenses += split['amount']
-                    break
+    # Splits are only needed for the rows on this page
+    expense_splits = {expense.id: expense.calculate_splits() for expense in expenses}
     
-    # Calculate current month total (similar to dashboard calculation)
-    current_month_total = 0
-    current_month = now.strftime('%Y-%m')
+    # Monthly and year/month-to-date rollups are summed in the database
+    rollup = load_expense_rollup(current_user.id)
+    monthly_totals = rollup.monthly_totals
+    total_expenses = rollup.year_total
+    current_month_total = rollup.month_total
+    unique_cards = rollup.unique_cards
 
-    for expense in expenses:
-        # Skip if not in current month
-        if expense.date.strftime('%Y-%m') != current_month:
-            continue
-            
-        splits = expense_splits[expense.id]
-        
-        if expense.paid_by == current_user.id:
-            # If user paid, add their own portion
-            current_month_total += splits['payer']['amount']
-            
-            # Also add what others owe them (the entire expense)
-            for split in splits['splits']:
-                current_month_total += split['amount']
-        else:
-            # If someone else paid, add only this user's portion
-            for split in splits['splits']:
-                if split['email'] == current_user.id:
-                    current_month_total += split['amount']
-                    break
-    
-    # Calculate monthly totals for statistics
-    monthly_totals = {}
-    unique_cards = set()
-    
     currencies = Currency.query.all()
-    for expense in expenses:
-        month_key = expense.date.strftime('%Y-%m')
-        if month_key not in monthly_totals:
-            monthly_totals[month_key] = {
-                'total': 0.0,
-                'by_card': {},
-                'contributors': {}
-            }
-            
-        # Add to monthly totals
-        monthly_totals[month_key]['total'] += expense.amount
-        
-        # Add card to total
-        if expense.card_used not in monthly_totals[month_key]['by_card']:
-            monthly_totals[month_key]['by_card'][expense.card_used] = 0
-        monthly_totals[month_key]['by_card'][expense.card_used] += expense.amount
-        
-        # Track unique cards where current user paid
-        if expense.paid_by == current_user.id:
-            unique_cards.add(expense.card_used)
-        
-        # Add contributors' data
-        splits = expense_splits[expense.id]
-        
-        # Add payer's portion
-        if splits['payer']['amount'] > 0:
-            user_id = splits['payer']['email']
-            if user_id not in monthly_totals[month_key]['contributors']:
-                monthly_totals[month_key]['contributors'][user_id] = 0
-            monthly_totals[month_key]['contributors'][user_id] += splits['payer']['amount']
-        
-        # Add other contributors' portions
-        for split in splits['splits']:
-            user_id = split['email']
-            if user_id not in monthly_totals[month_key]['contributors']:
-                monthly_totals[month_key]['contributors'][user_id] = 0
-            monthly_totals[month_key]['contributors'][user_id] += split['amount']
     
     return render_template('transactions.html', 
                         expenses=expenses,
                         expense_splits=expense_splits,
+                        next_cursor=next_cursor,
+                        total_count=total_count,
                         monthly_totals=monthly_totals,
                         total_expenses=total_expenses,
                         current_month_total=current_month_total,
@@ -6262,6 +7119,50 @@ def transactions():
                         currencies=currencies,
                         accounts=accounts)
 
+@app.route('/transactions/data')
+@login_required_dev
+@demo_time_limited
+def transactions_data():
+    """Return a filtered page of transactions as JSON, keyset-paginated on (date, id)"""
+    try:
+        filters = transaction_list_filters(current_user.id, request.args)
+        limit = min(max(request.args.get('limit', TRANSACTIONS_PAGE_SIZE, type=int), 1), TRANSACTIONS_MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+        
+        expenses, next_cursor = load_transaction_page(filters, cursor, limit)
+    except (ValueError, TypeError) as e:
+        return jsonify({'success': False, 'message': f'Invalid filter: {str(e)}'}), 400
+    
+    expense_splits = {expense.id: expense.calculate_splits() for expense in expenses}
+    
+    response = {
+        'success': True,
+        'html': render_template('partials/transaction_rows.html',
+                                expenses=expenses,
+                                expense_splits=expense_splits,
+                                base_currency=get_base_currency()),
+        'transactions': [
+            {
+                'id': expense.id,
+                'date': expense.date.strftime('%Y-%m-%d'),
+                'description': expense.description,
+                'amount': expense.amount,
+                'transaction_type': expense.transaction_type or 'expense',
+                'category_id': expense.category_id,
+                'account_id': expense.account_id,
+                'card_used': expense.card_used
+            }
+            for expense in expenses
+        ],
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    }
+    
+    # The total only needs counting once, for the first page of a filter
+    if not cursor:
+        response['total'] = db.session.query(func.count(Expense.id)).filter(*filters).scalar()
+    
+    return jsonify(response)
 
 
 @app.route('/get_transaction_form_html')
@@ -6556,285 +7457,319 @@ def delete_account(account_id):
             'message': f'Error: {str(e)}'
         }), 500
     
-@app.route('/import_csv', methods=['POST'])
-@login_required_dev
-def import_csv():
-    """Import transactions from a CSV file"""
-    if 'csv_file' not in request.files:
-        flash('No file provided')
-        return redirect(url_for('advanced'))
-    
-    csv_file = request.files['csv_file']
-    
-    if csv_file.filename == '':
-        flash('No file selected')
-        return redirect(url_for('advanced'))
-    
-    # Case-insensitive extension check
-    if not csv_file.filename.lower().endswith('.csv'):
-        flash('File must be a CSV')
-        return redirect(url_for('advanced'))
-    
-    # Define base_currency for any functions that might need it
-    base_currency = get_base_currency()
-    
-    imported_expenses = []
-    
-    try:
-        # Get form parameters
-        account_id = request.form.get('account_id')
-        date_format = request.form.get('date_format', 'MM/DD/YYYY')
-        date_column = request.form.get('date_column', 'Date')
-        amount_column = request.form.get('amount_column', 'Amount')
-        description_column = request.form.get('description_column', 'Description')
-        category_column = request.form.get('category_column')
-        type_column = request.form.get('type_column')
-        id_column = request.form.get('id_column')
-        
-        detect_duplicates = 'detect_duplicates' in request.form
-        auto_categorize = 'auto_categorize' in request.form
-        negative_is_expense = 'negative_is_expense' in request.form
-        # NEW: Get the delimiter selection
-        delimiter_type = request.form.get('delimiter', 'comma')
-        delimiter = ','  # Default to comma
-        # Read file content
-        
-        if delimiter_type == 'tab':
-            delimiter = '\t'
-        elif delimiter_type == 'semicolon':
-            delimiter = ';'
-        elif delimiter_type == 'pipe':
-            delimiter = '|'
-        elif delimiter_type == 'custom':
-            custom_delimiter = request.form.get('custom_delimiter', ',')
-            if custom_delimiter:
-                delimiter = custom_delimiter
-        file_content = csv_file.read().decode('utf-8')
-        # Parse CSV
-        import csv
-        import io
-        from datetime import datetime
-        
-        csv_reader = csv.DictReader(io.StringIO(file_content), delimiter=delimiter)
-        
-        # Get account if specified
-        account = None
-        if account_id:
-            account = Account.query.get(account_id)
-            if account and account.user_id != current_user.id:
-                flash('Invalid account selected')
-                return redirect(url_for('advanced'))
-        
-        # Use the enhanced determine_transaction_type function that accepts account_id
-        def determine_transaction_type_for_import(row, current_account_id=None):
-            """Determine transaction type based on row data from CSV import"""
-            type_column = request.form.get('type_column')
-            negative_is_expense = 'negative_is_expense' in request.form
-            
-            # Check if there's a specific transaction type column
-            if type_column and type_column in row:
-                type_value = row[type_column].strip().lower()
-                
-                # Map common terms to transaction types
-                if type_value in ['expense', 'debit', 'purchase', 'payment', 'withdrawal']:
-                    return 'expense'
-                elif type_value in ['income', 'credit', 'deposit', 'refund']:
-                    return 'income'
-                elif type_value in ['transfer', 'move', 'xfer']:
-                    return 'transfer'
-            
-            # If no type column or unknown value, try to determine from description
-            description = row.get(description_column, '').strip()
-            if description:
-                # Common transfer keywords
-                transfer_keywords = ['transfer', 'xfer', 'move', 'moved to', 'sent to', 'to account', 'between accounts']
-                # Common income keywords
-                income_keywords = ['salary', 'deposit', 'refund', 'interest', 'dividend', 'payment received']
-                # Common expense keywords
-                expense_keywords = ['payment', 'purchase', 'fee', 'subscription', 'bill']
-                
-                desc_lower = description.lower()
-                
-                # Check for keywords in description
-                if any(keyword in desc_lower for keyword in transfer_keywords):
-                    return 'transfer'
-                elif any(keyword in desc_lower for keyword in income_keywords):
-                    return 'income'
-                elif any(keyword in desc_lower for keyword in expense_keywords):
-                    return 'expense'
-            
-            # If still undetermined, use amount sign
-            amount_str = row[amount_column].strip().replace('$', '').replace(',', '')
-            try:
-                amount = float(amount_str)
-                # Determine type based on amount sign and settings
-                if amount < 0 and negative_is_expense:
-                    return 'expense'
-                elif amount > 0 and negative_is_expense:
-                    return 'income'
-                elif amount < 0 and not negative_is_expense:
-                    return 'income'  # In some systems, negative means money coming in
-                else:
-                    return 'expense'  # Default to expense for positive amounts
-            except ValueError:
-                # If amount can't be parsed, default to expense
-                return 'expense'
-                
-        # Get existing cards used
-        existing_cards = db.session.query(Expense.card_used).filter_by(
-            user_id=current_user.id
-        ).distinct().all()
-        existing_cards = [card[0] for card in existing_cards if card[0]]
-        
-        # Use the most frequent card as default if available
-        default_card = "Imported Card"
-        if existing_cards:
-            from collections import Counter
-            card_counter = Counter()
-            for card in existing_cards:
-                card_counter[card] += 1
-            default_card = card_counter.most_common(1)[0][0]
-        
-        # Define date parser based on selected format
-        def parse_date(date_str):
-            if date_format == 'MM/DD/YYYY':
-                return datetime.strptime(date_str, '%m/%d/%Y')
-            elif date_format == 'DD/MM/YYYY':
-                return datetime.strptime(date_str, '%d/%m/%Y')
-            elif date_format == 'YYYY-MM-DD':
-                return datetime.strptime(date_str, '%Y-%m-%d')
-            elif date_format == 'YYYY/MM/DD':
-                return datetime.strptime(date_str, '%Y/%m/%d')
-            else:
-                return datetime.strptime(date_str, '%m/%d/%Y')  # Default
-        
-        # Process each row
-        imported_count = 0
-        duplicate_count = 0
-        
-        for row in csv_reader:
+# Most imported transactions listed on the results page
+IMPORT_RESULTS_LIMIT = 500
+
+def import_csv_rows(user_id, stream, options, account=None, progress=None):
+    """
+    Import the transactions in a CSV file object for a user, a batch of rows per commit.
+    Duplicate external IDs are checked once per batch, categories resolved once per batch
+    and transfer balances applied per batch. progress(result, stream) is called after each
+    batch. Returns the counts and the IDs of the imported expenses.
+    """
+    batch_size = app.config['CSV_IMPORT_BATCH_SIZE']
+    parser = CsvRowParser(options)
+    result = {'processed_rows': 0, 'imported_count': 0, 'duplicate_count': 0, 'error_count': 0, 'expense_ids': []}
+    
+    # Accounts are looked up once for balance updates, and compiled once for transfer detection
+    accounts = {user_account.id: user_account for user_account in Account.query.filter_by(user_id=user_id).all()}
+    account_id = account.id if account else None
+    classifier = transaction_classifier(user_id, options.negative_is_expense)
+    
+    # Get existing cards used; use the most frequent card as default if available
+    existing_cards = [card for (card,) in db.session.query(Expense.card_used).filter_by(
+        user_id=user_id
+    ).distinct().all() if card]
+    default_card = "Imported Card"
+    if existing_cards:
+        from collections import Counter
+        default_card = Counter(existing_cards).most_common(1)[0][0]
+    
+    # Imported rows are always paid by the importing user - look them up once for the split shares
+    import_users = load_users_by_id([user_id])
+    seen_external_ids = set()
+    
+    for rows in batches(iter_csv_rows(stream, options.delimiter), batch_size):
+        result['processed_rows'] += len(rows)
+        
+        parsed = []
+        for row in rows:
             try:
-                # Skip if missing required fields
-                if not all(key in row for key in [date_column, amount_column, description_column]):
-                    continue
-                
-                # Extract data
-                date_str = row[date_column].strip()
-                amount_str = row[amount_column].strip().replace('$', '').replace(',', '')
-                description = row[description_column].strip()
-                
-                # Skip if empty data
-                if not date_str or not amount_str or not description:
+                fields = parser.parse(row)
+            except Exception as row_error:
+                app.logger.error(f"Error processing CSV row: {str(row_error)}")
+                result['error_count'] += 1
+                continue
+            if fields:
+                parsed.append(fields)
+        
+        # Set-based duplicate check: one query for the batch's external IDs
+        if options.detect_duplicates:
+            external_ids = {fields['external_id'] for fields in parsed if fields['external_id']}
+            existing_ids = set()
+            if external_ids:
+                existing_ids = {external_id for (external_id,) in db.session.query(Expense.external_id).filter(
+                    Expense.user_id == user_id,
+                    Expense.import_source == 'csv',
+                    Expense.external_id.in_(external_ids)
+                ).all()}
+            
+            unique_rows = []
+            for fields in parsed:
+                external_id = fields['external_id']
+                if external_id and (external_id in existing_ids or external_id in seen_external_ids):
+                    result['duplicate_count'] += 1
                     continue
+                if external_id:
+                    seen_external_ids.add(external_id)
+                unique_rows.append(fields)
+            parsed = unique_rows
+        
+        try:
+            transactions = []
+            to_categorize = []
+            balance_changes = {}
+            
+            # Internal transfers out of the selected account, then the type column, keywords and sign
+            classifications = classifier.classify_many(dict(fields, account_id=account_id) for fields in parsed)
+            
+            for fields, (transaction_type, destination_account_id) in zip(parsed, classifications):
+                amount = fields['amount']
                 
-                # Parse date
-                transaction_date = parse_date(date_str)
-                
-                # Parse amount (handle negative values)
-                try:
-                    amount = float(amount_str)
-                except ValueError:
-                    continue  # Skip if amount can't be parsed
-                
-                # Try to detect if this is an internal transfer
-                is_transfer, source_account_id, destination_account_id = False, None, None
-                if account and account.id:
-                    is_transfer, source_account_id, destination_account_id = detect_internal_transfer(
-                        description, amount, account.id
-                    )
-                
-                if is_transfer:
-                    # This is an internal transfer
-                    transaction_type = 'transfer'
-                    # Use the detected accounts, falling back to the selected account
-                    source_account_id = source_account_id or account.id
-                    # If we couldn't determine the destination, it stays None
-                else:
-                    # Use the function defined within this scope
-                    transaction_type = determine_transaction_type_for_import(row, account.id if account else None)
-                
-                # Get external ID if available
-                external_id = row.get(id_column) if id_column and id_column in row else None
-                
-                # Check for duplicates if enabled
-                if detect_duplicates and external_id:
-                    existing = Expense.query.filter_by(
-                        user_id=current_user.id,
-                        external_id=external_id,
-                        import_source='csv'
-                    ).first()
-                    
-                    if existing:
-                        duplicate_count += 1
-                        continue
-                
-                # Get category from CSV or auto-categorize (but not for transfers)
-                category_id = None
-                if transaction_type != 'transfer':
-                    category_name = None
-                    if category_column and category_column in row:
-                        category_name = row[category_column].strip()
-                    
-                    # Use enhanced get_category_id that supports auto-categorization
-                    category_id = get_category_id(
-                        category_name, 
-                        description if auto_categorize else None, 
-                        current_user.id
-                    )
-                
-                # Create new transaction
                 transaction = Expense(
-                    description=description,
+                    description=fields['description'],
                     amount=abs(amount),  # Always store positive amount
-                    date=transaction_date,
-                    card_used=default_card,  # Use most common card or a default
+                    date=fields['date'],
+                    card_used=default_card,
                     transaction_type=transaction_type,
                     split_method='equal',
-                    paid_by=current_user.id,
-                    user_id=current_user.id,
-                    category_id=category_id,
-                    account_id=source_account_id or (account.id if account else None),
+                    paid_by=user_id,
+                    user_id=user_id,
+                    account_id=account_id,
                     destination_account_id=destination_account_id,
-                    external_id=external_id,
-                    import_source='csv'
+                    external_id=fields['external_id'],
+                    import_source='csv',
+                    category_splits=[]  # New rows have none; saves sync_amount_base a lazy load (and flush) per row
                 )
-                
-                # Add to session
                 db.session.add(transaction)
-                imported_expenses.append(transaction)
-                imported_count += 1
+                sync_expense_participants(transaction, import_users)
+                transactions.append(transaction)
                 
-                # If this is a transfer and we've identified a destination account,
-                # update the balances of both accounts
-                if transaction_type == 'transfer' and transaction.account_id and transaction.destination_account_id:
-                    from_account = Account.query.get(transaction.account_id)
-                    to_account = Account.query.get(transaction.destination_account_id)
-                    
-                    if from_account and to_account and from_account.user_id == current_user.id and to_account.user_id == current_user.id:
-                        from_account.balance -= amount
-                        to_account.balance += amount
-                
-            except Exception as row_error:
-                app.logger.error(f"Error processing CSV row: {str(row_error)}")
-                continue
+                # Category from CSV or auto-categorize (but not for transfers), resolved for the batch below
+                if transaction_type != 'transfer':
+                    to_categorize.append((transaction, fields['category_name'],
+                                          fields['description'] if options.auto_categorize else None))
+                
+                # Transfers between two of the user's accounts move the balance across
+                if (transaction_type == 'transfer' and transaction.account_id in accounts
+                        and transaction.destination_account_id in accounts):
+                    balance_changes[transaction.account_id] = balance_changes.get(transaction.account_id, 0) - amount
+                    balance_changes[transaction.destination_account_id] = balance_changes.get(transaction.destination_account_id, 0) + amount
+            
+            category_ids = get_category_ids(
+                [(category_name, description) for _, category_name, description in to_categorize],
+                user_id,
+                create_missing=options.auto_categorize
+            )
+            for (transaction, _, _), category_id in zip(to_categorize, category_ids):
+                transaction.category_id = category_id
+            
+            sync_amount_base(transactions)
+            for changed_account_id, change in balance_changes.items():
+                accounts[changed_account_id].balance += change
+            
+            db.session.flush()
+            expense_ids = [transaction.id for transaction in transactions]
+            db.session.commit()
+            
+            result['expense_ids'].extend(expense_ids)
+            result['imported_count'] += len(expense_ids)
+        except Exception as batch_error:
+            db.session.rollback()
+            app.logger.error(f"Error saving CSV rows: {str(batch_error)}")
+            result['error_count'] += len(parsed)
+        
+        if progress:
+            progress(result, stream)
+    
+    if account and result['imported_count'] > 0:
+        # Update the last sync time
+        account.last_sync = datetime.utcnow()
+        db.session.commit()
+    
+    return result
+
+def import_job_path(job_id):
+    """Where an import job's upload is kept until it has been imported"""
+    return os.path.join(app.instance_path, 'imports', f'{job_id}.csv')
+
+def claim_import_job(job_id):
+    """Move a queued import to running for this process; False if another process claimed it first"""
+    claimed = ImportJob.query.filter_by(id=job_id, status='queued').update({
+        ImportJob.status: 'running',
+        ImportJob.holder: holder_id(),
+        ImportJob.heartbeat_at: datetime.utcnow()
+    }, synchronize_session=False)
+    db.session.commit()
+    return claimed == 1
+
+def fail_stale_import_jobs(job_id=None):
+    """
+    Fail running imports (all, or one) whose process stopped reporting progress
+    for CSV_IMPORT_STALE_MINUTES, e.g. after a worker restart. Batches already
+    committed stay imported. Returns the number of imports failed
+    """
+    cutoff = datetime.utcnow() - timedelta(minutes=app.config['CSV_IMPORT_STALE_MINUTES'])
+    query = ImportJob.query.filter(
+        ImportJob.status == 'running',
+        or_(ImportJob.heartbeat_at.is_(None), ImportJob.heartbeat_at < cutoff)
+    )
+    if job_id is not None:
+        query = query.filter(ImportJob.id == job_id)
+    
+    stale = query.all()
+    for job in stale:
+        app.logger.warning(f"Import job {job.id} on {job.holder} stopped after {job.processed_rows or 0} rows, marking it failed")
+        job.status = 'failed'
+        job.message = (f"The import stopped after {job.processed_rows or 0} rows, which were saved. "
+                       f"Remove them from the file before importing the rest.")
+        job.finished_at = datetime.utcnow()
+        try:
+            os.remove(import_job_path(job.id))
+        except OSError:
+            pass
+    if stale:
+        db.session.commit()
+    return len(stale)
+
+def run_import_job(job_id):
+    """Import the saved CSV upload of an ImportJob this process has claimed, recording progress as it goes"""
+    path = import_job_path(job_id)
+    with app.app_context():
+        job = ImportJob.query.get(job_id)
+        if job is None:
+            return
+        
+        def progress(result, stream=None):
+            if stream is not None:
+                job.processed_bytes = stream.tell()
+            job.processed_rows = result['processed_rows']
+            job.imported_count = result['imported_count']
+            job.duplicate_count = result['duplicate_count']
+            job.error_count = result['error_count']
+            job.heartbeat_at = datetime.utcnow()
+            db.session.commit()
+        
+        try:
+            account = Account.query.get(job.account_id) if job.account_id else None
+            options = CsvImportOptions.from_dict(json.loads(job.options))
+            with open(path, 'rb') as stream:
+                result = import_csv_rows(job.user_id, stream, options, account, progress)
+            
+            progress(result)
+            job.status = 'done'
+            job.processed_bytes = job.total_bytes
+            job.message = f"Imported {result['imported_count']} transactions. Skipped {result['duplicate_count']} duplicates."
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error importing CSV for job {job_id}: {str(e)}")
+            job = ImportJob.query.get(job_id)
+            job.status = 'failed'
+            job.message = str(e)
+        finally:
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def run_queued_import_jobs():
+    """
+    Run queued CSV imports, oldest first, and fail the ones whose process died - runs
+    on a schedule. Several processes may poll; each import is claimed by one of them.
+    Returns the number of imports run
+    """
+    with app.app_context():
+        fail_stale_import_jobs()
         
-        # Commit all transactions
-        db.session.commit()
+        count = 0
+        while True:
+            job_id = db.session.query(ImportJob.id).filter_by(status='queued').order_by(ImportJob.created_at).limit(1).scalar()
+            if job_id is None:
+                return count
+            if claim_import_job(job_id):
+                run_import_job(job_id)
+                count += 1
+
+@app.route('/import_csv', methods=['POST'])
+@login_required_dev
+def import_csv():
+    """Import transactions from a CSV file; large files are imported in the background"""
+    if 'csv_file' not in request.files:
+        flash('No file provided')
+        return redirect(url_for('advanced'))
+    
+    csv_file = request.files['csv_file']
+    
+    if csv_file.filename == '':
+        flash('No file selected')
+        return redirect(url_for('advanced'))
+    
+    # Case-insensitive extension check
+    if not csv_file.filename.lower().endswith('.csv'):
+        flash('File must be a CSV')
+        return redirect(url_for('advanced'))
+    
+    # Define base_currency for any functions that might need it
+    base_currency = get_base_currency()
+    
+    try:
+        options = CsvImportOptions.from_form(request.form)
         
-        # Update account balance if specified
-        if account and imported_count > 0:
-            # Update the last sync time
-            account.last_sync = datetime.utcnow()
+        # Get account if specified
+        account = None
+        account_id = request.form.get('account_id')
+        if account_id:
+            account = Account.query.get(account_id)
+            if account and account.user_id != current_user.id:
+                flash('Invalid account selected')
+                return redirect(url_for('advanced'))
+        
+        # Large uploads (or on request) are saved and imported by a background job
+        upload_size = request.content_length or 0
+        if 'background_import' in request.form or upload_size > app.config['CSV_IMPORT_BACKGROUND_BYTES']:
+            job = ImportJob(
+                user_id=current_user.id,
+                filename=csv_file.filename,
+                account_id=account.id if account else None,
+                options=json.dumps(options.to_dict())
+            )
+            db.session.add(job)
+            db.session.flush()
+            
+            path = import_job_path(job.id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            csv_file.save(path)
+            job.total_bytes = os.path.getsize(path)
+            
+            # Queued for the csv_imports scheduled job, which survives web workers being recycled
             db.session.commit()
+            return render_template('import_status.html', job=job.to_dict())
+        
+        result = import_csv_rows(current_user.id, csv_file.stream, options, account)
         
         # Flash success message
-        flash(f'Successfully imported {imported_count} transactions. Skipped {duplicate_count} duplicates.')
+        flash(f"Successfully imported {result['imported_count']} transactions. Skipped {result['duplicate_count']} duplicates.")
         
         # Redirect to a page showing the imported transactions
+        expenses = Expense.query.filter(
+            Expense.id.in_(result['expense_ids'][:IMPORT_RESULTS_LIMIT])
+        ).order_by(Expense.id).all()
         return render_template('import_results.html', 
-                               expenses=imported_expenses,
-                               count=imported_count,
-                               duplicate_count=duplicate_count,
+                               expenses=expenses,
+                               count=result['imported_count'],
+                               duplicate_count=result['duplicate_count'],
                                base_currency=base_currency)  # Pass base_currency here
         
     except Exception as e:
@@ -6844,6 +7779,17 @@ def import_csv():
     
     return redirect(url_for('advanced'))
 
+@app.route('/import_csv/status/<job_id>')
+@login_required_dev
+def import_csv_status(job_id):
+    """Progress of a background CSV import"""
+    job = ImportJob.query.get_or_404(job_id)
+    if job.user_id != current_user.id:
+        return jsonify({'success': False, 'message': 'Import not found'}), 404
+    if fail_stale_import_jobs(job_id):
+        job = ImportJob.query.get(job_id)
+    return jsonify({'success': True, 'job': job.to_dict()})
+
 #--------------------
 # ROUTES: simplefun
 #--------------------
@@ -7024,6 +7970,9 @@ def simplefin_add_accounts():
         # Get the user's default currency
         default_currency = current_user.default_currency_code or 'USD'
         
+        # Imported rows are always paid by the current user - look them up once for the split shares
+        import_users = load_users_by_id([current_user.id])
+        
         # Process and add each selected account
         for sf_account in selected_accounts:
             # Check if account already exists
@@ -7065,40 +8014,18 @@ def simplefin_add_accounts():
                 accounts_added += 1
                 account_obj = new_account
             
-            # Create transaction objects using the enhanced client method
+            # Create transaction objects using the enhanced client method; the classifier is
+            # built per account so transfers can point at the accounts added so far
             transaction_objects, import_count = simplefin_client.create_transactions_from_account(
                 sf_account,
                 account_obj,
                 current_user.id,
-                detect_internal_transfer,  # Your transfer detection function
-                auto_categorize_transaction,  # Your auto-categorization function
-                get_category_id  # Your function to find/create categories
+                categorize_many_func=categorize_many,  # Categorizes the account's transactions in one batch
+                classifier=transaction_classifier(current_user.id)
             )
             
-            # Check for existing transactions to avoid duplicates
-            transaction_objects_filtered = []
-            for transaction in transaction_objects:
-                existing = Expense.query.filter_by(
-                    user_id=current_user.id,
-                    external_id=transaction.external_id,
-                    import_source='simplefin'
-                ).first()
-                
-                if not existing:
-                    transaction_objects_filtered.append(transaction)
-            
-            # Add filtered transactions to the session
-            for transaction in transaction_objects_filtered:
-                db.session.add(transaction)
-                transactions_added += 1
-                
-                # Handle account balance updates for transfers
-                if transaction.transaction_type == 'transfer' and transaction.destination_account_id:
-                    # Find the destination account
-                    to_account = Account.query.get(transaction.destination_account_id)
-                    if to_account and to_account.user_id == current_user.id:
-                        # For transfers, add to destination account balance
-                        to_account.balance += transaction.amount
+            # Add the transactions we don't have yet
+            transactions_added += len(add_simplefin_transactions(transaction_objects, current_user.id, import_users))
         
         # Commit all changes
         db.session.commit()
@@ -7181,34 +8108,12 @@ def sync_account(account_id):
             sf_account,
             account,
             current_user.id,
-            detect_internal_transfer,
-            auto_categorize_transaction,
-            get_category_id
+            categorize_many_func=categorize_many,
+            classifier=transaction_classifier(current_user.id)
         )
         
-        # Track new transactions
-        new_transactions = 0
-        
         # Filter out existing transactions and add new ones
-        for transaction in transaction_objects:
-            # Check if transaction already exists
-            existing = Expense.query.filter_by(
-                user_id=current_user.id,
-                external_id=transaction.external_id,
-                import_source='simplefin'
-            ).first()
-            
-            if not existing:
-                db.session.add(transaction)
-                new_transactions += 1
-                
-                # Handle account balance updates for transfers
-                if transaction.transaction_type == 'transfer' and transaction.destination_account_id:
-                    # Find the destination account
-                    to_account = Account.query.get(transaction.destination_account_id)
-                    if to_account and to_account.user_id == current_user.id:
-                        # For transfers, add to destination account balance
-                        to_account.balance += transaction.amount
+        new_transactions = len(add_simplefin_transactions(transaction_objects, current_user.id))
         
         # Commit changes
         db.session.commit()
@@ -7381,123 +8286,245 @@ def run_scheduled_simplefin_sync():
     
     try:
         # Run the sync function
-        sync_all_simplefin_accounts()
-        flash('SimpleFin scheduled sync completed successfully!')
+        summary = sync_all_simplefin_accounts()
+        message = (f"SimpleFin scheduled sync completed in {summary['wall_time']}s: "
+                   f"{summary['users_synced']} users synced, {summary['transactions_added']} transactions added.")
+        if summary['failures']:
+            message += f" {len(summary['failures'])} users failed, see the logs for details."
+        flash(message)
     except Exception as e:
         app.logger.error(f"Error running scheduled SimpleFin sync: {str(e)}")
         flash(f'Error running scheduled sync: {str(e)}')
     
     return redirect(url_for('admin'))
 
+# Keeps the external ID lookup under SQLite's bound-parameter limit
+SIMPLEFIN_DEDUP_CHUNK_SIZE = 500
+
+def add_simplefin_transactions(transaction_objects, user_id, users_by_id=None):
+    """
+    Add fetched SimpleFin transactions that aren't stored yet.
+    Existing external IDs are looked up in one query and deduplicated in memory;
+    the new rows are inserted together when the session flushes.
+    Returns the list of transactions added
+    """
+    fetched_ids = list({transaction.external_id for transaction in transaction_objects if transaction.external_id})
+    existing_ids = set()
+    for start in range(0, len(fetched_ids), SIMPLEFIN_DEDUP_CHUNK_SIZE):
+        existing_ids.update(row[0] for row in db.session.query(Expense.external_id).filter(
+            Expense.user_id == user_id,
+            Expense.import_source == 'simplefin',
+            Expense.external_id.in_(fetched_ids[start:start + SIMPLEFIN_DEDUP_CHUNK_SIZE])
+        ))
+    
+    new_transactions = []
+    for transaction in transaction_objects:
+        if transaction.external_id:
+            if transaction.external_id in existing_ids:
+                continue
+            # The same transaction can show up twice in one fetch
+            existing_ids.add(transaction.external_id)
+        new_transactions.append(transaction)
+    
+    if not new_transactions:
+        return []
+    
+    if users_by_id is None:
+        users_by_id = load_users_by_id([user_id])
+    
+    # Destination accounts for transfers, loaded together
+    destination_ids = {transaction.destination_account_id for transaction in new_transactions
+                       if transaction.transaction_type == 'transfer' and transaction.destination_account_id}
+    destination_accounts = {}
+    if destination_ids:
+        destination_accounts = {account.id: account for account in Account.query.filter(
+            Account.id.in_(destination_ids),
+            Account.user_id == user_id
+        )}
+    
+    db.session.add_all(new_transactions)
+    sync_amount_base(new_transactions)
+    for transaction in new_transactions:
+        sync_expense_participants(transaction, users_by_id)
+        
+        # Handle account balance updates for transfers
+        if transaction.transaction_type == 'transfer' and transaction.destination_account_id:
+            to_account = destination_accounts.get(transaction.destination_account_id)
+            if to_account:
+                # For transfers, add to destination account balance
+                to_account.balance += transaction.amount
+    
+    return new_transactions
+
+def apply_simplefin_accounts(user_id, accounts, users_by_id=None):
+    """
+    Write one user's fetched SimpleFin accounts: update balances of the
+    connected accounts and add their new transactions. The caller commits.
+    Returns (accounts_updated, transactions_added)
+    """
+    # Find all SimpleFin accounts for this user
+    user_accounts = Account.query.filter_by(
+        user_id=user_id,
+        import_source='simplefin'
+    ).all()
+    
+    # Create a mapping of external IDs to account objects
+    account_map = {acc.external_id: acc for acc in user_accounts if acc.external_id}
+    
+    accounts_updated = 0
+    
+    # Fetched transactions across all of the user's accounts, deduplicated together
+    fetched_transactions = []
+    
+    # One classifier for all of the user's accounts (this also runs in the scheduled sync, outside a request)
+    classifier = transaction_classifier(user_id)
+    
+    # Update each account
+    for sf_account in accounts:
+        external_id = sf_account.get('id')
+        if not external_id:
+            continue
+        
+        # Find the corresponding account
+        if external_id in account_map:
+            account = account_map[external_id]
+            
+            # Update account details
+            account.balance = sf_account.get('balance', account.balance)
+            account.last_sync = datetime.utcnow()
+            accounts_updated += 1
+            
+            # Create transaction objects using the enhanced client method
+            transaction_objects, _ = simplefin_client.create_transactions_from_account(
+                sf_account,
+                account,
+                user_id,
+                categorize_many_func=categorize_many,
+                classifier=classifier
+            )
+            
+            fetched_transactions.extend(transaction_objects)
+    
+    # Filter out existing transactions and add new ones
+    transactions_added = len(add_simplefin_transactions(fetched_transactions, user_id, users_by_id))
+    
+    return accounts_updated, transactions_added
+
 # Function to sync all SimpleFin accounts for all users
 def sync_all_simplefin_accounts():
-    """Sync all SimpleFin accounts for all users - runs on a schedule"""
+    """
+    Sync all SimpleFin accounts for all users - runs on a schedule.
+    Bridge requests for different users run concurrently on a bounded thread pool;
+    database writes stay on this thread, one user at a time, each with its own commit.
+    Returns a summary of the run
+    """
     with app.app_context():
         app.logger.info("Starting scheduled SimpleFin sync for all users")
+        started = time.monotonic()
+        
+        summary = {
+            'users_synced': 0,
+            'users_skipped': 0,
+            'accounts_updated': 0,
+            'transactions_added': 0,
+            'failures': [],
+            'wall_time': 0.0
+        }
+        
+        def record_failure(user_id, error):
+            summary['failures'].append({'user_id': user_id, 'error': error})
+            app.logger.error(f"SimpleFin sync failed for user {user_id}: {error}")
         
         try:
             # Get all users with SimpleFin settings
             settings_list = SimpleFin.query.filter_by(enabled=True).all()
+            users = {user.id: user for user in User.query.filter(
+                User.id.in_([settings.user_id for settings in settings_list])
+            )}
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error in scheduled SimpleFin sync: {str(e)}")
+            summary['failures'].append({'user_id': None, 'error': str(e)})
+            return summary
+        
+        # Work out whose data to fetch
+        due = {}
+        for settings in settings_list:
+            # Skip if last sync was less than 12 hours ago (to prevent excessive syncing)
+            if settings.last_sync and (datetime.utcnow() - settings.last_sync).total_seconds() < 43200:  # 12 hours
+                summary['users_skipped'] += 1
+                continue
             
-            for settings in settings_list:
-                # Skip if last sync was less than 12 hours ago (to prevent excessive syncing)
-                if settings.last_sync and (datetime.utcnow() - settings.last_sync).total_seconds() < 43200:  # 12 hours
-                    continue
-                
-                # Get the user
-                user = User.query.filter_by(id=settings.user_id).first()
-                if not user:
-                    continue
-                
-                # Decode the access URL
-                try:
-                    access_url = base64.b64decode(settings.access_url.encode()).decode()
-                except:
-                    app.logger.error(f"Error decoding access URL for user {settings.user_id}")
-                    continue
-                
-                # Fetch accounts and transactions (last 3 days for scheduled sync)
-                raw_data = simplefin_client.get_accounts_with_transactions(access_url, days_back=3)
-                
-                if not raw_data:
-                    app.logger.error(f"Failed to fetch SimpleFin data for user {settings.user_id}")
-                    continue
-                
-                # Process the raw data
-                accounts = simplefin_client.process_raw_accounts(raw_data)
-                
-                # Find all SimpleFin accounts for this user
-                user_accounts = Account.query.filter_by(
-                    user_id=settings.user_id,
-                    import_source='simplefin'
-                ).all()
-                
-                # Create a mapping of external IDs to account objects
-                account_map = {acc.external_id: acc for acc in user_accounts if acc.external_id}
-                
-                # Track statistics
-                accounts_updated = 0
-                transactions_added = 0
+            if settings.user_id not in users:
+                summary['users_skipped'] += 1
+                continue
+            
+            # Decode the access URL
+            try:
+                access_url = base64.b64decode(settings.access_url.encode()).decode()
+            except Exception:
+                record_failure(settings.user_id, 'Could not decode access URL')
+                continue
+            
+            due[settings.user_id] = (settings, access_url)
+        
+        if due:
+            workers = max(1, min(app.config['SIMPLEFIN_SYNC_WORKERS'], len(due)))
+            timeout = app.config['SIMPLEFIN_SYNC_TIMEOUT']
+            
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='simplefin-sync') as pool:
+                # Fetch accounts and transactions (last 3 days for scheduled sync); no database access in the workers
+                futures = {
+                    pool.submit(simplefin_client.get_accounts_with_transactions, access_url, 3, timeout): user_id
+                    for user_id, (_, access_url) in due.items()
+                }
                 
-                # Update each account
-                for sf_account in accounts:
-                    external_id = sf_account.get('id')
-                    if not external_id:
+                # Write each user's data as soon as it arrives
+                for future in as_completed(futures):
+                    user_id = futures[future]
+                    settings = due[user_id][0]
+                    
+                    try:
+                        raw_data = future.result()
+                    except Exception as e:
+                        record_failure(user_id, f"Error fetching SimpleFin data: {str(e)}")
                         continue
                     
-                    # Find the corresponding account
-                    if external_id in account_map:
-                        account = account_map[external_id]
-                        
-                        # Update account details
-                        account.balance = sf_account.get('balance', account.balance)
-                        account.last_sync = datetime.utcnow()
-                        accounts_updated += 1
-                        
-                        # Create transaction objects using the enhanced client method
-                        transaction_objects, _ = simplefin_client.create_transactions_from_account(
-                            sf_account,
-                            account,
-                            settings.user_id,
-                            detect_internal_transfer,
-                            auto_categorize_transaction,
-                            get_category_id
+                    if not raw_data:
+                        record_failure(user_id, 'Failed to fetch SimpleFin data')
+                        continue
+                    
+                    try:
+                        accounts_updated, transactions_added = apply_simplefin_accounts(
+                            user_id,
+                            simplefin_client.process_raw_accounts(raw_data),
+                            {user_id: users[user_id]}
                         )
                         
-                        # Filter out existing transactions and add new ones
-                        for transaction in transaction_objects:
-                            # Check if transaction already exists
-                            existing = Expense.query.filter_by(
-                                user_id=settings.user_id,
-                                external_id=transaction.external_id,
-                                import_source='simplefin'
-                            ).first()
-                            
-                            if not existing:
-                                db.session.add(transaction)
-                                transactions_added += 1
-                                
-                                # Handle account balance updates for transfers
-                                if transaction.transaction_type == 'transfer' and transaction.destination_account_id:
-                                    # Find the destination account
-                                    to_account = Account.query.get(transaction.destination_account_id)
-                                    if to_account and to_account.user_id == settings.user_id:
-                                        # For transfers, add to destination account balance
-                                        to_account.balance += transaction.amount
-                
-                # Commit changes for this user
-                if accounts_updated > 0 or transactions_added > 0:
-                    db.session.commit()
-                    
-                    # Update the SimpleFin settings last_sync time
-                    settings.last_sync = datetime.utcnow()
-                    db.session.commit()
+                        # Update the SimpleFin settings last_sync time
+                        if accounts_updated > 0 or transactions_added > 0:
+                            settings.last_sync = datetime.utcnow()
+                        
+                        # Commit changes for this user only
+                        db.session.commit()
+                    except Exception as e:
+                        db.session.rollback()
+                        record_failure(user_id, str(e))
+                        continue
                     
-                    app.logger.info(f"SimpleFin sync for user {settings.user_id}: {accounts_updated} accounts updated, {transactions_added} transactions added")
-                
-        except Exception as e:
-            db.session.rollback()
-            app.logger.error(f"Error in scheduled SimpleFin sync: {str(e)}")
+                    summary['users_synced'] += 1
+                    summary['accounts_updated'] += accounts_updated
+                    summary['transactions_added'] += transactions_added
+                    app.logger.info(f"SimpleFin sync for user {user_id}: {accounts_updated} accounts updated, {transactions_added} transactions added")
+        
+        summary['wall_time'] = round(time.monotonic() - started, 2)
+        app.logger.info(
+            f"Scheduled SimpleFin sync finished in {summary['wall_time']}s: "
+            f"{summary['users_synced']} users synced, {summary['users_skipped']} skipped, "
+            f"{summary['accounts_updated']} accounts updated, {summary['transactions_added']} transactions added, "
+            f"{len(summary['failures'])} failures"
+        )
+        return summary
 
 
 def sync_simplefin_for_user(user_id):
@@ -7521,79 +8548,20 @@ def sync_simplefin_for_user(user_id):
                 return
             
             # Fetch accounts and transactions (last 3 days for a login sync)
-            simplefin_instance = simplefin_client
-            raw_data = simplefin_instance.get_accounts_with_transactions(access_url, days_back=3)
+            raw_data = simplefin_client.get_accounts_with_transactions(
+                access_url, days_back=3, timeout=app.config['SIMPLEFIN_SYNC_TIMEOUT']
+            )
             
             if not raw_data:
                 app.logger.error(f"Failed to fetch SimpleFin data for user {user_id}")
                 return
             
-            # Process the raw data
-            accounts = simplefin_instance.process_raw_accounts(raw_data)
-            
-            # Find all SimpleFin accounts for this user
-            user_accounts = Account.query.filter_by(
-                user_id=user_id,
-                import_source='simplefin'
-            ).all()
-            
-            # Create a mapping of external IDs to account objects
-            account_map = {acc.external_id: acc for acc in user_accounts if acc.external_id}
-            
-            # Track statistics
-            accounts_updated = 0
-            transactions_added = 0
-            
-            # Update each account
-            for sf_account in accounts:
-                external_id = sf_account.get('id')
-                if not external_id:
-                    continue
-                
-                # Find the corresponding account
-                if external_id in account_map:
-                    account = account_map[external_id]
-                    
-                    # Update account details
-                    account.balance = sf_account.get('balance', account.balance)
-                    account.last_sync = datetime.utcnow()
-                    accounts_updated += 1
-                    
-                    # Create transaction objects
-                    transaction_objects, _ = simplefin_instance.create_transactions_from_account(
-                        sf_account,
-                        account,
-                        user_id,
-                        detect_internal_transfer,
-                        auto_categorize_transaction,
-                        get_category_id
-                    )
-                    
-                    # Filter out existing transactions and add new ones
-                    for transaction in transaction_objects:
-                        # Check if transaction already exists
-                        existing = Expense.query.filter_by(
-                            user_id=user_id,
-                            external_id=transaction.external_id,
-                            import_source='simplefin'
-                        ).first()
-                        
-                        if not existing:
-                            db.session.add(transaction)
-                            transactions_added += 1
-                            
-                            # Handle account balance updates for transfers
-                            if transaction.transaction_type == 'transfer' and transaction.destination_account_id:
-                                # Find the destination account
-                                to_account = Account.query.get(transaction.destination_account_id)
-                                if to_account and to_account.user_id == user_id:
-                                    # For transfers, add to destination account balance
-                                    to_account.balance += transaction.amount
+            # Process the raw data and write it
+            accounts = simplefin_client.process_raw_accounts(raw_data)
+            accounts_updated, transactions_added = apply_simplefin_accounts(user_id, accounts)
             
             # Commit changes for this user
             if accounts_updated > 0 or transactions_added > 0:
-                db.session.commit()
-                
                 # Update the SimpleFin settings last_sync time
                 settings.last_sync = datetime.utcnow()
                 db.session.commit()
@@ -7667,16 +8635,11 @@ def bulk_categorize_transactions():
         total_count = len(uncategorized)
         categorized_count = 0
         
-        # Process each transaction
-        for expense in uncategorized:
-            # Skip if no description
-            if not expense.description:
-                continue
-                
-            # Try to auto-categorize
-            category_id = auto_categorize_transaction(expense.description, current_user.id)
-            
-            # If we found a category, update the transaction
+        # Match every description against the rules in one pass
+        category_ids = categorize_many([expense.description for expense in uncategorized], current_user.id)
+        
+        # Update the transactions we found a category for
+        for expense, category_id in zip(uncategorized, category_ids):
             if category_id:
                 expense.category_id = category_id
                 categorized_count += 1
@@ -7738,6 +8701,7 @@ def add_category_mapping():
     
     db.session.add(mapping)
     db.session.commit()
+    invalidate_category_rules(current_user.id)
     
     flash('Category mapping rule added successfully.')
     return redirect(url_for('manage_category_mappings'))
@@ -7761,6 +8725,7 @@ def edit_category_mapping(mapping_id):
     mapping.priority = int(request.form.get('priority', 0))
     
     db.session.commit()
+    invalidate_category_rules(current_user.id)
     
     flash('Category mapping updated successfully.')
     return redirect(url_for('manage_category_mappings'))
@@ -7779,6 +8744,7 @@ def toggle_category_mapping(mapping_id):
     # Toggle active status
     mapping.active = not mapping.active
     db.session.commit()
+    invalidate_category_rules(current_user.id)
     
     status = "activated" if mapping.active else "deactivated"
     flash(f'Category mapping {status} successfully.')
@@ -7798,6 +8764,7 @@ def delete_category_mapping(mapping_id):
     
     db.session.delete(mapping)
     db.session.commit()
+    invalidate_category_rules(current_user.id)
     
     flash('Category mapping deleted successfully.')
     return redirect(url_for('manage_category_mappings'))
@@ -7881,6 +8848,7 @@ def learn_from_transaction_history():
     
     if created_count > 0:
         db.session.commit()
+        invalidate_category_rules(current_user.id)
         flash(f'Created {created_count} new category mapping rules from your transaction history.')
     else:
         flash('No new mapping patterns were found in your transaction history.')
@@ -8010,6 +8978,7 @@ def upload_category_mappings():
         # Commit all successfully parsed mappings
         if imported_count > 0:
             db.session.commit()
+            invalidate_category_rules(current_user.id)
             
         flash(f'Successfully imported {imported_count} mappings. Skipped {skipped_count} rows.')
         
@@ -8118,11 +9087,8 @@ def export_transactions():
         from flask import send_file
         
         # Build query with SQLAlchemy
-        query = Expense.query.filter(
-            or_(
-                Expense.user_id == user_id,
-                Expense.split_with.like(f'%{user_id}%')
-            )
+        query = Expense.query.options(selectinload(Expense.participants)).filter(
+            user_expense_filter(user_id)
         )
         
         # Apply filters
@@ -8386,6 +9352,7 @@ def delete_category(category_id):
             app.logger.info(f"Handling {len(category.subcategories)} subcategories")
             for subcategory in category.subcategories:
                 # Update or delete related records for subcategory
+                mark_category_spend_changed(Expense.category_id == subcategory.id)
                 Expense.query.filter_by(category_id=subcategory.id).update({
                     'category_id': other_category.id if other_category else None
                 })
@@ -8399,6 +9366,7 @@ def delete_category(category_id):
                 db.session.delete(subcategory)
         
         # Update or delete main category's related records
+        mark_category_spend_changed(Expense.category_id == category_id)
         Expense.query.filter_by(category_id=category_id).update({
             'category_id': other_category.id if other_category else None
         })
@@ -8415,6 +9383,7 @@ def delete_category(category_id):
         
         # Commit changes
         db.session.commit()
+        invalidate_category_rules(category.user_id)
         
         app.logger.info(f"Category {category.name} (ID: {category_id}) deleted successfully")
         flash('Category deleted successfully')
@@ -8696,10 +9665,265 @@ def get_budget(budget_id):
         }), 500
 
 
+CATEGORY_SPEND_EXPENSE_FIELDS = ('user_id', 'date', 'category_id', 'has_category_splits', 'amount')
+CATEGORY_SPEND_SPLIT_FIELDS = ('expense_id', 'category_id', 'amount')
+CATEGORY_SPEND_CHUNK_SIZE = 1000
+
+def category_day_spend(*criteria):
+    """
+    Sum each expense owner's portion per category per day, for the expenses matching
+    criteria: {user_id: {(category_id, date): amount}}. The portion is the owner's
+    split share, or their payer share when they paid and aren't in the split, in the
+    current base currency; category splits count that portion of the split amount.
+    """
+    year, month = month_bucket(Expense.date)
+    day = db.cast(db.extract('day', Expense.date), db.Integer)
+    
+    sharer = aliased(ExpenseParticipant)
+    payer = aliased(ExpenseParticipant)
+    portion = func.coalesce(sharer.share_amount, payer.share_amount, 0) * expense_base_ratio()
+    split_portion = db.case((Expense.amount > 0, CategorySplit.amount * portion / Expense.amount), else_=0)
+    
+    def with_portion(query):
+        return query.outerjoin(
+            sharer, and_(sharer.expense_id == Expense.id, sharer.user_id == Expense.user_id, sharer.is_payer == False)
+        ).outerjoin(
+            payer, and_(payer.expense_id == Expense.id, payer.user_id == Expense.user_id, payer.is_payer == True)
+        ).filter(*criteria)
+    
+    # Expenses without category splits count towards their own category
+    direct_rows = with_portion(
+        db.session.query(Expense.user_id, Expense.category_id, year, month, day, func.sum(portion))
+    ).filter(
+        Expense.category_id.isnot(None),
+        Expense.has_category_splits.isnot(True)
+    ).group_by(Expense.user_id, Expense.category_id, year, month, day).all()
+    
+    split_rows = with_portion(
+        db.session.query(Expense.user_id, CategorySplit.category_id, year, month, day, func.sum(split_portion)).join(
+            Expense, CategorySplit.expense_id == Expense.id
+        )
+    ).group_by(Expense.user_id, CategorySplit.category_id, year, month, day).all()
+    
+    spend = {}
+    for user_id, category_id, row_year, row_month, row_day, amount in direct_rows + split_rows:
+        totals = spend.setdefault(user_id, {})
+        key = (category_id, date(int(row_year), int(row_month), int(row_day)))
+        totals[key] = totals.get(key, 0.0) + (amount or 0)
+    return spend
+
+def insert_category_spend(user_id, rows, session=None):
+    """Insert (category_id, grain, period_start, amount) rows for a user"""
+    session = session or db.session
+    rows = [{'user_id': user_id, 'category_id': category_id, 'grain': grain,
+             'period_start': period_start, 'amount': amount}
+            for category_id, grain, period_start, amount in rows]
+    for start in range(0, len(rows), CATEGORY_SPEND_CHUNK_SIZE):
+        session.execute(CategoryPeriodSpend.__table__.insert(), rows[start:start + CATEGORY_SPEND_CHUNK_SIZE])
+
+def refresh_category_spend(months, session=None):
+    """
+    Recompute category_period_spend for a set of (user_id, month start) pairs:
+    day and month rows from the expenses in those months, then the week rows
+    overlapping them from the day rows
+    """
+    session = session or db.session
+    months_by_user = {}
+    for user_id, month in months:
+        if user_id is not None and month is not None:
+            months_by_user.setdefault(user_id, set()).add(month)
+    
+    for user_id, user_months in months_by_user.items():
+        ranges = [(month, (month + timedelta(days=32)).replace(day=1)) for month in sorted(user_months)]
+        
+        spend = category_day_spend(
+            Expense.user_id == user_id,
+            or_(*[and_(Expense.date >= datetime.combine(start, datetime.min.time()),
+                       Expense.date < datetime.combine(end, datetime.min.time()))
+                  for start, end in ranges])
+        ).get(user_id, {})
+        
+        # Day and month rows for the touched months
+        user_rows = CategoryPeriodSpend.query.filter(CategoryPeriodSpend.user_id == user_id)
+        user_rows.filter(
+            CategoryPeriodSpend.grain == 'day',
+            or_(*[and_(CategoryPeriodSpend.period_start >= start, CategoryPeriodSpend.period_start < end)
+                  for start, end in ranges])
+        ).delete(synchronize_session=False)
+        user_rows.filter(
+            CategoryPeriodSpend.grain == 'month',
+            CategoryPeriodSpend.period_start.in_(user_months)
+        ).delete(synchronize_session=False)
+        insert_category_spend(user_id, period_rows(spend, ('day', 'month')), session)
+        
+        # Weeks overlapping those months, summed from the day rows (weeks can cross months)
+        weeks = set()
+        for start, end in ranges:
+            week = week_start(start)
+            while week < end:
+                weeks.add(week)
+                week += timedelta(days=7)
+        
+        day_rows = session.query(
+            CategoryPeriodSpend.category_id, CategoryPeriodSpend.period_start, CategoryPeriodSpend.amount
+        ).filter(
+            CategoryPeriodSpend.user_id == user_id,
+            CategoryPeriodSpend.grain == 'day',
+            CategoryPeriodSpend.period_start >= min(weeks),
+            CategoryPeriodSpend.period_start < max(weeks) + timedelta(days=7)
+        ).all()
+        week_totals = {(category_id, day): amount for category_id, day, amount in day_rows
+                       if week_start(day) in weeks}
+        
+        user_rows.filter(
+            CategoryPeriodSpend.grain == 'week',
+            CategoryPeriodSpend.period_start.in_(weeks)
+        ).delete(synchronize_session=False)
+        insert_category_spend(user_id, period_rows(week_totals, ('week',)), session)
+
+def rebuild_category_spend(user_id=None):
+    """
+    Rebuild category_period_spend from scratch, for one user or everyone;
+    the caller commits. Returns the number of rows written
+    """
+    criteria = [Expense.user_id == user_id] if user_id else []
+    stale = CategoryPeriodSpend.query
+    if user_id:
+        stale = stale.filter(CategoryPeriodSpend.user_id == user_id)
+    stale.delete(synchronize_session=False)
+    
+    count = 0
+    for spend_user_id, day_totals in category_day_spend(*criteria).items():
+        rows = period_rows(day_totals)
+        insert_category_spend(spend_user_id, rows)
+        count += len(rows)
+    return count
+
+def mark_category_spend_changed(*criteria):
+    """
+    Queue the months of the expenses matching criteria for a category_period_spend
+    refresh at the next commit. Call ahead of bulk updates and deletes, which the
+    session events don't see.
+    """
+    year, month = month_bucket(Expense.date)
+    rows = db.session.query(Expense.user_id, year, month).filter(*criteria).distinct().all()
+    months = db.session().info.setdefault('category_spend_months', set())
+    months.update((user_id, date(int(row_year), int(row_month), 1)) for user_id, row_year, row_month in rows)
+
+@event.listens_for(db.session, 'before_flush')
+def track_category_spend_changes(session, flush_context, instances):
+    """Note which users' months need their category spend refreshed when this session commits"""
+    months = session.info.setdefault('category_spend_months', set())
+    expense_ids = session.info.setdefault('category_spend_expense_ids', set())
+    
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Expense):
+            state = inspect(obj)
+            histories = [state.attrs[field].history for field in CATEGORY_SPEND_EXPENSE_FIELDS]
+            if obj in session.dirty and not any(history.has_changes() for history in histories):
+                continue
+            # Both the old and new owner/month lose or gain the expense
+            # Histories of expired attributes are blank, with deleted None
+            user_ids = {obj.user_id, *(histories[0].deleted or ())}
+            days = {obj.date, *(histories[1].deleted or ())}
+            months.update((user_id, month_start(day.date() if isinstance(day, datetime) else day))
+                          for user_id in user_ids for day in days if user_id and day)
+        elif isinstance(obj, (CategorySplit, ExpenseParticipant)):
+            # A split's amount_base alone changes in a re-base, which rebuilds the totals itself
+            if isinstance(obj, CategorySplit) and obj in session.dirty and not any(
+                    inspect(obj).attrs[field].history.has_changes() for field in CATEGORY_SPEND_SPLIT_FIELDS):
+                continue
+            if obj.expense_id is not None:
+                expense_ids.add(obj.expense_id)
+            elif obj.expense is not None and obj.expense.date is not None:
+                months.add((obj.expense.user_id, month_start(obj.expense.date.date())))
+
+@event.listens_for(db.session, 'before_commit')
+def write_category_spend_changes(session):
+    """Refresh the category spend rows for everything this commit changes"""
+    # before_commit runs ahead of the commit's own flush, which is what records the changes
+    session.flush()
+    if not session.info.get('category_spend_months') and not session.info.get('category_spend_expense_ids'):
+        return
+    months = session.info.pop('category_spend_months', set())
+    expense_ids = list(session.info.pop('category_spend_expense_ids', set()))
+    
+    def write():
+        year, month = month_bucket(Expense.date)
+        for start in range(0, len(expense_ids), CATEGORY_SPEND_CHUNK_SIZE):
+            rows = session.query(Expense.user_id, year, month).filter(
+                Expense.id.in_(expense_ids[start:start + CATEGORY_SPEND_CHUNK_SIZE])
+            ).distinct().all()
+            months.update((user_id, date(int(row_year), int(row_month), 1)) for user_id, row_year, row_month in rows)
+        
+        refresh_category_spend(months, session)
+    
+    run_in_savepoint(session, write, 'updating category spend totals')
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def discard_category_spend_changes(session, previous_transaction):
+    # A savepoint rolling back leaves the rest of the transaction's changes to commit
+    if previous_transaction.nested:
+        return
+    session.info.pop('category_spend_months', None)
+    session.info.pop('category_spend_expense_ids', None)
+
+def load_budget_spending(user_id):
+    """
+    Build a BudgetSpending for a user from category_period_spend: the current
+    week, month and day rows plus this year's month rows, in one query
+    """
+    spending = BudgetSpending(
+        subcategory_rows=db.session.query(Category.id, Category.parent_id).filter(
+            Category.user_id == user_id,
+            Category.parent_id.isnot(None)
+        ).all()
+    )
+    week = spending.periods['weekly'][0].date()
+    month = spending.periods['monthly'][0].date()
+    today = spending.periods['daily'][0].date()
+    year_start, year_end = (day.date() for day in spending.periods['yearly'])
+    
+    rows = db.session.query(
+        CategoryPeriodSpend.category_id, CategoryPeriodSpend.grain,
+        CategoryPeriodSpend.period_start, CategoryPeriodSpend.amount
+    ).filter(
+        CategoryPeriodSpend.user_id == user_id,
+        or_(
+            and_(CategoryPeriodSpend.grain == 'week', CategoryPeriodSpend.period_start == week),
+            and_(CategoryPeriodSpend.grain == 'day', CategoryPeriodSpend.period_start == today),
+            and_(CategoryPeriodSpend.grain == 'month',
+                 CategoryPeriodSpend.period_start >= year_start,
+                 CategoryPeriodSpend.period_start <= year_end)
+        )
+    ).all()
+    
+    for category_id, grain, period_start, amount in rows:
+        if grain == 'week':
+            spending.add(category_id, 'weekly', amount)
+        elif grain == 'day':
+            spending.add(category_id, 'daily', amount)
+        else:
+            spending.add(category_id, 'yearly', amount)
+            if period_start == month:
+                spending.add(category_id, 'monthly', amount)
+    
+    return spending
+
+def get_budget_spending(user_id):
+    """Return the user's BudgetSpending, loaded once per request"""
+    if not has_request_context():
+        return load_budget_spending(user_id)
+    
+    memo = g.setdefault('budget_spending', {})
+    if user_id not in memo:
+        memo[user_id] = load_budget_spending(user_id)
+    return memo[user_id]
+
 def get_budget_summary():
     """Get budget summary for current user"""
     # Get all active budgets
-    active_budgets = Budget.query.filter_by(
+    active_budgets = Budget.query.options(selectinload(Budget.category)).filter_by(
         user_id=current_user.id,
         active=True
     ).all()
@@ -8714,29 +9938,24 @@ def get_budget_summary():
     }
     
     for budget in active_budgets:
-        status = budget.get_status()
+        spent = budget.calculate_spent_amount()
+        status = budget_status(budget.amount, spent)
         if status == 'over':
             budget_summary['over_budget'] += 1
-            budget_summary['alert_budgets'].append({
-                'id': budget.id,
-                'name': budget.name or budget.category.name,
-                'percentage': budget.get_progress_percentage(),
-                'status': status,
-                'amount': budget.amount,
-                'spent': budget.calculate_spent_amount()
-            })
         elif status == 'approaching':
             budget_summary['approaching_limit'] += 1
-            budget_summary['alert_budgets'].append({
-                'id': budget.id,
-                'name': budget.name or budget.category.name,
-                'percentage': budget.get_progress_percentage(),
-                'status': status,
-                'amount': budget.amount,
-                'spent': budget.calculate_spent_amount()
-            })
         else:
             budget_summary['under_budget'] += 1
+            continue
+        
+        budget_summary['alert_budgets'].append({
+            'id': budget.id,
+            'name': budget.name or budget.category.name,
+            'percentage': progress_percentage(budget.amount, spent),
+            'status': status,
+            'amount': budget.amount,
+            'spent': spent
+        })
     
     # Sort alert budgets by percentage (highest first)
     budget_summary['alert_budgets'] = sorted(
@@ -8777,13 +9996,16 @@ def get_subcategory_spending(budget_id):
         
         subcategories = []
         
-        # Get period dates for this budget
-        period_start, period_end = budget.get_current_period_dates()
+        # Spending per category in this budget's current period
+        spending = get_budget_spending(current_user.id)
+        
+        def category_spent(category_id):
+            return spending.spent(category_id, budget.period, include_subcategories=False)
         
         # If this budget includes the parent category directly
         if not budget.include_subcategories:
             # Only include the parent category itself
-            spent = calculate_category_spending(category.id, period_start, period_end)
+            spent = category_spent(category.id)
             
             subcategories.append({
                 'id': category.id,
@@ -8795,7 +10017,7 @@ def get_subcategory_spending(budget_id):
         else:
             # Include all subcategories
             for subcategory in category.subcategories:
-                spent = calculate_category_spending(subcategory.id, period_start, period_end)
+                spent = category_spent(subcategory.id)
                 
                 subcategories.append({
                     'id': subcategory.id,
@@ -8806,7 +10028,7 @@ def get_subcategory_spending(budget_id):
                 })
                 
             # If the parent category itself has direct expenses, add it too
-            spent = calculate_category_spending(category.id, period_start, period_end, include_subcategories=False)
+            spent = category_spent(category.id)
             
             if spent > 0:
                 subcategories.append({
@@ -8835,76 +10057,6 @@ def get_subcategory_spending(budget_id):
             'message': f'Error: {str(e)}'
         }), 500
 
-def calculate_category_spending(category_id, start_date, end_date, include_subcategories=True):
-    """Calculate total spending for a category within a date range"""
-    
-    # Get the category
-    category = Category.query.get(category_id)
-    if not category:
-        return 0
-    
-    total_spent = 0
-    
-    # 1. Get direct expenses (transactions directly assigned to this category without splits)
-    direct_expenses = Expense.query.filter(
-        Expense.user_id == current_user.id,
-        Expense.category_id == category_id,
-        Expense.date >= start_date,
-        Expense.date <= end_date,
-        Expense.has_category_splits == False  # Important: only include non-split expenses
-    ).all()
-    
-    # Add up direct expenses
-    for expense in direct_expenses:
-        # Use amount_base if available (for currency conversion), otherwise use amount
-        amount = getattr(expense, 'amount_base', expense.amount)
-        total_spent += amount
-    
-    # 2. Get category splits assigned to this category
-    category_splits = CategorySplit.query.join(Expense).filter(
-        Expense.user_id == current_user.id,
-        CategorySplit.category_id == category_id,
-        Expense.date >= start_date,
-        Expense.date <= end_date
-    ).all()
-    
-    # Add up split amounts
-    for split in category_splits:
-        # Use split amount directly - these should already be in the correct currency
-        total_spent += split.amount
-    
-    # 3. Include subcategories if requested and if this is a parent category
-    if include_subcategories and not category.parent_id:
-        subcategory_ids = [subcat.id for subcat in category.subcategories]
-        
-        for subcategory_id in subcategory_ids:
-            # For each subcategory, repeat the process
-            # Process direct expenses
-            subcat_direct = Expense.query.filter(
-                Expense.user_id == current_user.id,
-                Expense.category_id == subcategory_id,
-                Expense.date >= start_date,
-                Expense.date <= end_date,
-                Expense.has_category_splits == False
-            ).all()
-            
-            for expense in subcat_direct:
-                amount = getattr(expense, 'amount_base', expense.amount)
-                total_spent += amount
-            
-            # Process split expenses
-            subcat_splits = CategorySplit.query.join(Expense).filter(
-                Expense.user_id == current_user.id,
-                CategorySplit.category_id == subcategory_id,
-                Expense.date >= start_date,
-                Expense.date <= end_date
-            ).all()
-            
-            for split in subcat_splits:
-                total_spent += split.amount
-    
-    return total_spent
-
 # Add to utility_processor to make budget info available in templates
 @app.context_processor
 def utility_processor():
@@ -8945,7 +10097,28 @@ def utility_processor():
 def inject_app_version():
     """Make app version available to all templates"""
     return {
-        'app_version': APP_VERSION
+        'app_version': APP_VERSION
+    }
+
+def budget_spend_by_month(user_id, start_date, end_date, category_ids=None):
+    """
+    Sum a user's spending per 'YYYY-MM' month between two dates, optionally
+    limited to a set of categories, from the monthly category_period_spend rows
+    """
+    query = db.session.query(
+        CategoryPeriodSpend.period_start, func.sum(CategoryPeriodSpend.amount)
+    ).filter(
+        CategoryPeriodSpend.user_id == user_id,
+        CategoryPeriodSpend.grain == 'month',
+        CategoryPeriodSpend.period_start >= start_date.date(),
+        CategoryPeriodSpend.period_start < end_date.date()
+    )
+    if category_ids is not None:
+        query = query.filter(CategoryPeriodSpend.category_id.in_(category_ids))
+    
+    return {
+        bucket_key(period_start.year, period_start.month): amount or 0
+        for period_start, amount in query.group_by(CategoryPeriodSpend.period_start).all()
     }
 
 @app.route('/budgets/trends-data')
@@ -8973,172 +10146,17 @@ def budget_trends_data():
         response['labels'].append(month_label)
         current_date = (current_date.replace(day=28) + timedelta(days=4)).replace(day=1)
     
+    # Spending for the whole range is grouped by month in one pass
+    range_start = start_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    range_end = (end_date.replace(day=28) + timedelta(days=4)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    
     # If no budget selected, return all budgets aggregated by month
     if not budget_id:
         # Get all active budgets
         budgets = Budget.query.filter_by(user_id=current_user.id, active=True).all()
         app.logger.debug(f"Found {len(budgets)} active budgets")
         
-        # For each month, calculate total budget and spending
-        for i, month in enumerate(response['labels']):
-            month_date = datetime.strptime(month, '%b %Y')
-            month_start = month_date.replace(day=1)
-            if month_date.month == 12:
-                month_end = month_date.replace(year=month_date.year+1, month=1, day=1) - timedelta(days=1)
-            else:
-                month_end = month_date.replace(month=month_date.month+1, day=1) - timedelta(days=1)
-            
-            # Sum all budgets for this month
-            monthly_budget = 0
-            for budget in budgets:
-                if budget.period == 'monthly':
-                    monthly_budget += budget.amount
-                elif budget.period == 'yearly':
-                    monthly_budget += budget.amount / 12
-                elif budget.period == 'weekly':
-                    # Calculate weeks in this month
-                    weeks_in_month = (month_end - month_start).days / 7
-                    monthly_budget += budget.amount * weeks_in_month
-            
-            response['budget'].append(monthly_budget)
-            app.logger.debug(f"Month {month}: Budget amount = {monthly_budget}")
-            
-            # Calculate actual spending for this month
-            monthly_spent = 0
-            
-            # 1. Get regular expenses without splits (no category splits, no user splits)
-            direct_expenses = Expense.query.filter(
-                Expense.user_id == current_user.id,
-                Expense.date >= month_start,
-                Expense.date <= month_end,
-                Expense.has_category_splits == False,
-                Expense.split_with.is_(None) | (Expense.split_with == '')
-            ).all()
-            
-            # Add up direct expenses (no splits)
-            direct_total = 0
-            for expense in direct_expenses:
-                amount = getattr(expense, 'amount_base', expense.amount)
-                direct_total += amount
-            
-            monthly_spent += direct_total
-            app.logger.debug(f"Month {month}: Direct expenses (no splits) = {direct_total}")
-            
-            # 2. Get expenses that have user splits but no category splits
-            user_split_expenses = Expense.query.filter(
-                Expense.user_id == current_user.id,
-                Expense.date >= month_start,
-                Expense.date <= month_end,
-                Expense.has_category_splits == False,
-                Expense.split_with.isnot(None) & (Expense.split_with != '')
-            ).all()
-            
-            # Calculate user's portion for each user split expense
-            user_split_total = 0
-            for expense in user_split_expenses:
-                # Get split information with error handling
-                try:
-                    split_info = expense.calculate_splits()
-                    if not split_info:
-                        continue
-                    
-                    # Calculate user's portion
-                    user_amount = 0
-                    
-                    # Check if user is payer and not in split list
-                    if expense.paid_by == current_user.id and (
-                        not expense.split_with or 
-                        current_user.id not in expense.split_with.split(',')
-                    ):
-                        user_amount = split_info['payer']['amount']
-                    else:
-                        # Look for user in splits
-                        for split in split_info['splits']:
-                            if split['email'] == current_user.id:
-                                user_amount = split['amount']
-                                break
-                    
-                    user_split_total += user_amount
-                    
-                except Exception as e:
-                    app.logger.error(f"Error calculating splits for expense {expense.id}: {str(e)}")
-                    # Fallback: Just divide by number of participants (including payer)
-                    participants = 1  # Start with payer
-                    if expense.split_with:
-                        participants += len(expense.split_with.split(','))
-                    
-                    if participants > 0:
-                        user_split_total += expense.amount / participants
-            
-            monthly_spent += user_split_total
-            app.logger.debug(f"Month {month}: User split expenses = {user_split_total}")
-            
-            # 3. Get expenses with category splits
-            split_expenses = Expense.query.filter(
-                Expense.user_id == current_user.id,
-                Expense.date >= month_start,
-                Expense.date <= month_end,
-                Expense.has_category_splits == True
-            ).all()
-            
-            # Process each split expense
-            category_split_total = 0
-            for split_expense in split_expenses:
-                # Get category splits for this expense
-                category_splits = CategorySplit.query.filter_by(expense_id=split_expense.id).all()
-                
-                # Calculate the base amount from category splits
-                split_amount = sum(split.amount for split in category_splits)
-                
-                # If expense also has user splits, calculate user's portion
-                if split_expense.split_with and split_expense.split_with.strip():
-                    try:
-                        split_info = split_expense.calculate_splits()
-                        if not split_info:
-                            # If no split info, treat as full amount
-                            category_split_total += split_amount
-                            continue
-                        
-                        # Calculate user's percentage of the total expense
-                        user_percentage = 0
-                        
-                        # Check if user is payer and not in split list
-                        if split_expense.paid_by == current_user.id and current_user.id not in split_expense.split_with.split(','):
-                            user_percentage = split_info['payer']['amount'] / split_expense.amount if split_expense.amount > 0 else 0
-                        else:
-                            # Look for user in splits
-                            for split in split_info['splits']:
-                                if split['email'] == current_user.id:
-                                    user_percentage = split['amount'] / split_expense.amount if split_expense.amount > 0 else 0
-                                    break
-                        
-                        # Apply user's percentage to the category amount
-                        category_split_total += split_amount * user_percentage
-                        
-                    except Exception as e:
-                        app.logger.error(f"Error calculating splits for expense {split_expense.id}: {str(e)}")
-                        # Fallback: Just divide by number of participants
-                        participants = 1  # Start with payer
-                        if split_expense.split_with:
-                            participants += len(split_expense.split_with.split(','))
-                        
-                        if participants > 0:
-                            category_split_total += split_amount / participants
-                else:
-                    # No user splits, use the full category split amount
-                    category_split_total += split_amount
-            
-            monthly_spent += category_split_total
-            app.logger.debug(f"Month {month}: Category split expenses = {category_split_total}")
-            
-            # Add the calculated amounts to the response
-            response['actual'].append(monthly_spent)
-            
-            # Set color based on whether spending exceeds budget
-            color = '#ef4444' if monthly_spent > monthly_budget else '#22c55e'
-            response['colors'].append(color)
-            
-            app.logger.debug(f"Month {month}: Total monthly spent = {monthly_spent}")
+        spent_by_month = budget_spend_by_month(current_user.id, range_start, range_end)
     else:
         # Get specific budget
         budget = Budget.query.get_or_404(budget_id)
@@ -9148,187 +10166,46 @@ def budget_trends_data():
             return jsonify({'error': 'Unauthorized'}), 403
         
         app.logger.debug(f"Processing trends for single budget {budget_id}: {budget.name or 'Unnamed'}, amount={budget.amount}")
+        budgets = [budget]
         
-        # Process each month
-        for i, month in enumerate(response['labels']):
-            month_date = datetime.strptime(month, '%b %Y')
-            month_start = month_date.replace(day=1)
-            if month_date.month == 12:
-                month_end = month_date.replace(year=month_date.year+1, month=1, day=1) - timedelta(days=1)
-            else:
-                month_end = month_date.replace(month=month_date.month+1, day=1) - timedelta(days=1)
-            
-            # Get budget amount for this month
-            monthly_budget = 0
+        # Create list of categories to include
+        category_ids = [budget.category_id]
+        if budget.include_subcategories and budget.category:
+            category_ids.extend([subcat.id for subcat in budget.category.subcategories])
+        
+        spent_by_month = budget_spend_by_month(current_user.id, range_start, range_end, category_ids)
+    
+    # For each month, calculate total budget and spending
+    for month in response['labels']:
+        month_date = datetime.strptime(month, '%b %Y')
+        month_start = month_date.replace(day=1)
+        if month_date.month == 12:
+            month_end = month_date.replace(year=month_date.year+1, month=1, day=1) - timedelta(days=1)
+        else:
+            month_end = month_date.replace(month=month_date.month+1, day=1) - timedelta(days=1)
+        
+        # Sum all budgets for this month
+        monthly_budget = 0
+        for budget in budgets:
             if budget.period == 'monthly':
-                monthly_budget = budget.amount
+                monthly_budget += budget.amount
             elif budget.period == 'yearly':
-                monthly_budget = budget.amount / 12
+                monthly_budget += budget.amount / 12
             elif budget.period == 'weekly':
                 # Calculate weeks in this month
                 weeks_in_month = (month_end - month_start).days / 7
-                monthly_budget = budget.amount * weeks_in_month
-                
-            response['budget'].append(monthly_budget)
-            app.logger.debug(f"Month {month}: Budget amount = {monthly_budget}")
-            
-            # Create list of categories to include
-            category_ids = [budget.category_id]
-            if budget.include_subcategories and budget.category:
-                category_ids.extend([subcat.id for subcat in budget.category.subcategories])
-            
-            # Calculate spending for this category
-            monthly_spent = 0
-            
-            # 1. Get direct expenses (not split by category, not split by user)
-            direct_expenses = Expense.query.filter(
-                Expense.user_id == current_user.id,
-                Expense.date >= month_start,
-                Expense.date <= month_end,
-                Expense.category_id.in_(category_ids),
-                Expense.has_category_splits == False,
-                Expense.split_with.is_(None) | (Expense.split_with == '')
-            ).all()
-            
-            # Add up direct expenses
-            direct_total = 0
-            for expense in direct_expenses:
-                amount = getattr(expense, 'amount_base', expense.amount)
-                direct_total += amount
-            
-            monthly_spent += direct_total
-            app.logger.debug(f"Month {month}: Direct expenses (no splits) = {direct_total}")
-            
-            # 2. Get expenses with user splits but not category splits
-            user_split_expenses = Expense.query.filter(
-                Expense.user_id == current_user.id,
-                Expense.date >= month_start,
-                Expense.date <= month_end,
-                Expense.category_id.in_(category_ids),
-                Expense.has_category_splits == False,
-                Expense.split_with.isnot(None) & (Expense.split_with != '')
-            ).all()
-            
-            # Process user split expenses
-            user_split_total = 0
-            for expense in user_split_expenses:
-                try:
-                    # Get split information
-                    split_info = expense.calculate_splits()
-                    if not split_info:
-                        continue
-                    
-                    # Calculate user's portion
-                    user_amount = 0
-                    
-                    # Check if user is payer and not in split list
-                    if expense.paid_by == current_user.id and (
-                        not expense.split_with or 
-                        current_user.id not in expense.split_with.split(',')
-                    ):
-                        user_amount = split_info['payer']['amount']
-                    else:
-                        # Look for user in splits
-                        for split in split_info['splits']:
-                            if split['email'] == current_user.id:
-                                user_amount = split['amount']
-                                break
-                    
-                    user_split_total += user_amount
-                    
-                except Exception as e:
-                    app.logger.error(f"Error calculating splits for expense {expense.id}: {str(e)}")
-                    # Fallback: Just divide by number of participants (including payer)
-                    participants = 1  # Start with payer
-                    if expense.split_with:
-                        participants += len(expense.split_with.split(','))
-                    
-                    if participants > 0:
-                        user_split_total += expense.amount / participants
-            
-            monthly_spent += user_split_total
-            app.logger.debug(f"Month {month}: User split expenses = {user_split_total}")
-            
-            # 3. Get category splits for these categories
-            category_splits = CategorySplit.query.join(Expense).filter(
-                Expense.user_id == current_user.id,
-                Expense.date >= month_start,
-                Expense.date <= month_end,
-                CategorySplit.category_id.in_(category_ids)
-            ).all()
-            
-            # Group by expense to avoid double counting
-            expense_splits = {}
-            for split in category_splits:
-                if split.expense_id not in expense_splits:
-                    expense_splits[split.expense_id] = []
-                expense_splits[split.expense_id].append(split)
-            
-            # Process each expense with category splits
-            category_split_total = 0
-            for expense_id, splits in expense_splits.items():
-                try:
-                    # Get the expense
-                    expense = Expense.query.get(expense_id)
-                    if not expense:
-                        continue
-                    
-                    # Calculate total relevant split amount
-                    relevant_amount = sum(split.amount for split in splits)
-                    
-                    # If expense also has user splits, calculate user's portion
-                    if expense.split_with and expense.split_with.strip():
-                        split_info = expense.calculate_splits()
-                        if not split_info:
-                            # If no split info, treat as full amount
-                            category_split_total += relevant_amount
-                            continue
-                        
-                        # Calculate user's percentage of the total expense
-                        user_percentage = 0
-                        
-                        # Check if user is payer and not in split list
-                        if expense.paid_by == current_user.id and current_user.id not in expense.split_with.split(','):
-                            user_percentage = split_info['payer']['amount'] / expense.amount if expense.amount > 0 else 0
-                        else:
-                            # Look for user in splits
-                            for split in split_info['splits']:
-                                if split['email'] == current_user.id:
-                                    user_percentage = split['amount'] / expense.amount if expense.amount > 0 else 0
-                                    break
-                        
-                        # Apply user's percentage to the category amount
-                        user_portion = relevant_amount * user_percentage
-                        category_split_total += user_portion
-                        app.logger.debug(f"Expense {expense_id}: User percentage {user_percentage}, Amount {relevant_amount}, User portion {user_portion}")
-                        
-                    else:
-                        # No user splits, use the full category split amount
-                        category_split_total += relevant_amount
-                        
-                except Exception as e:
-                    app.logger.error(f"Error processing expense {expense_id} with category splits: {str(e)}")
-                    # Fallback: Just divide by number of participants
-                    expense = Expense.query.get(expense_id)
-                    if expense and expense.split_with:
-                        participants = 1 + len(expense.split_with.split(','))
-                        relevant_amount = sum(split.amount for split in splits)
-                        category_split_total += relevant_amount / participants
-                    else:
-                        # If no split info or can't get expense, add full amount
-                        category_split_total += sum(split.amount for split in splits)
-            
-            monthly_spent += category_split_total
-            app.logger.debug(f"Month {month}: Category split expenses = {category_split_total}")
-            
-            # Add the calculated amounts to the response
-            response['actual'].append(monthly_spent)
-            
-            # Set color based on whether spending exceeds budget
-            color = '#ef4444' if monthly_spent > monthly_budget else '#22c55e'
-            response['colors'].append(color)
-            
-            app.logger.debug(f"Month {month}: Total monthly spent = {monthly_spent}, Budget = {monthly_budget}")
+                monthly_budget += budget.amount * weeks_in_month
+        
+        response['budget'].append(monthly_budget)
+        
+        monthly_spent = spent_by_month.get(bucket_key(month_date.year, month_date.month), 0)
+        response['actual'].append(monthly_spent)
+        
+        # Set color based on whether spending exceeds budget
+        color = '#ef4444' if monthly_spent > monthly_budget else '#22c55e'
+        response['colors'].append(color)
+        
+        app.logger.debug(f"Month {month}: Total monthly spent = {monthly_spent}, Budget = {monthly_budget}")
             
     # Debug log the final response data
     app.logger.debug(f"Budget trends response: labels={response['labels']}")
@@ -9701,20 +10578,17 @@ def generate_monthly_report_data(user_id, year, month):
         end_date = datetime(year, month + 1, 1) - timedelta(days=1)
     
     # Get base currency
-    base_currency = get_base_currency()
+    base_currency = get_base_currency(user)
     currency_symbol = base_currency['symbol'] if isinstance(base_currency, dict) else base_currency.symbol
     
     # Get user's expenses for the month
     query_filters = [
-        or_(
-            Expense.user_id == user_id,
-            Expense.split_with.like(f'%{user_id}%')
-        ),
+        user_expense_filter(user_id),
         Expense.date >= start_date,
         Expense.date <= end_date
     ]
     
-    expenses_raw = Expense.query.filter(and_(*query_filters)).order_by(Expense.date).all()
+    expenses_raw = Expense.query.options(selectinload(Expense.participants)).filter(and_(*query_filters)).order_by(Expense.date).all()
     
     # Calculate user's portion of expenses
     expenses = []
@@ -9822,15 +10696,12 @@ def generate_monthly_report_data(user_id, year, month):
         prev_end_date = datetime(prev_year, prev_month + 1, 1) - timedelta(days=1)
     
     prev_query_filters = [
-        or_(
-            Expense.user_id == user_id,
-            Expense.split_with.like(f'%{user_id}%')
-        ),
+        user_expense_filter(user_id),
         Expense.date >= prev_start_date,
         Expense.date <= prev_end_date
     ]
     
-    prev_expenses = Expense.query.filter(and_(*prev_query_filters)).all()
+    prev_expenses = Expense.query.options(selectinload(Expense.participants)).filter(and_(*prev_query_filters)).all()
     prev_total = 0
     
     for expense in prev_expenses:
@@ -9871,32 +10742,43 @@ def generate_monthly_report_data(user_id, year, month):
     }
 
 
+def render_monthly_report(user_id, year, month):
+    """Build the monthly expense report email for a user; None if there is no report data"""
+    # Generate report data
+    report_data = generate_monthly_report_data(user_id, year, month)
+    if not report_data:
+        return None
+    
+    # Create the email
+    subject = f"Your Monthly Expense Report for {report_data['month_name']} {report_data['year']}"
+    
+    # Render the email templates
+    html_content = render_template('email/monthly_report.html', **report_data)
+    text_content = render_template('email/monthly_report.txt', **report_data)
+    
+    return Message(
+        subject=subject,
+        recipients=[report_data['user'].id],
+        body=text_content,
+        html=html_content
+    )
+
+def render_monthly_report_in_worker(user_id, year, month):
+    """render_monthly_report() for a worker thread, in its own app context and database session"""
+    # The email links are external URLs, which need a request to build them from
+    with app.test_request_context(base_url=app.config['APP_URL']):
+        return render_monthly_report(user_id, year, month)
+
 def send_monthly_report(user_id, year, month):
     """Generate and send monthly expense report email"""
     try:
-        # Generate report data
-        report_data = generate_monthly_report_data(user_id, year, month)
-        if not report_data:
+        msg = render_monthly_report(user_id, year, month)
+        if not msg:
             app.logger.error(f"Failed to generate report data for user {user_id}")
             return False
         
-        # Create the email
-        subject = f"Your Monthly Expense Report for {report_data['month_name']} {report_data['year']}"
-        
-        # Render the email templates
-        html_content = render_template('email/monthly_report.html', **report_data)
-        text_content = render_template('email/monthly_report.txt', **report_data)
-        
-        # Send the email
-        msg = Message(
-            subject=subject,
-            recipients=[report_data['user'].id],
-            body=text_content,
-            html=html_content
-        )
-        
         mail.send(msg)
-        app.logger.info(f"Monthly report sent to {report_data['user'].id} for {report_data['month_name']} {report_data['year']}")
+        app.logger.info(f"Monthly report sent to {user_id} for {calendar.month_name[month]} {year}")
         return True
         
     except Exception as e:
@@ -9952,8 +10834,27 @@ def generate_monthly_report():
     return render_template('generate_report.html', months=months)
 
 
+def record_report_delivery(user_id, period, status, attempts=0, error=None):
+    """Write a user's outcome in the delivery log of a report run; the caller commits"""
+    delivery = MonthlyReportDelivery.query.filter_by(user_id=user_id, period=period).first()
+    if delivery is None:
+        delivery = MonthlyReportDelivery(user_id=user_id, period=period, attempts=0)
+        db.session.add(delivery)
+    delivery.status = status
+    delivery.attempts = (delivery.attempts or 0) + attempts
+    delivery.error = error
+    delivery.updated_at = datetime.utcnow()
+    if status == 'sent':
+        delivery.sent_at = delivery.updated_at
+
 def send_automatic_monthly_reports():
-    """Send monthly reports to all users who have opted in"""
+    """
+    Send last month's report to all users who have opted in - runs on a schedule.
+    Reports are built on a bounded thread pool and sent from this thread through one
+    SMTP connection per batch, as they are ready. Each user's outcome goes in the
+    monthly_report_deliveries log; users already sent this month's report are skipped,
+    so a rerun only retries the rest. Returns a summary of the run
+    """
     with app.app_context():
         # Get the previous month
         today = datetime.now()
@@ -9963,19 +10864,65 @@ def send_automatic_monthly_reports():
         else:
             report_month = today.month - 1
             report_year = today.year
+        period = f"{report_year}-{report_month:02d}"
         
-        # Get users who have opted in (you'd need to add this field to User model)
-        # For now, we'll assume all users want reports
-        users = User.query.all()
-        
-        app.logger.info(f"Starting to send monthly reports for {calendar.month_name[report_month]} {report_year}")
+        summary = {'period': period, 'sent': 0, 'failed': 0, 'no_data': 0, 'connections': 0, 'wall_time': 0.0}
+        started = time.monotonic()
         
-        success_count = 0
-        for user in users:
-            if send_monthly_report(user.id, report_year, report_month):
-                success_count += 1
+        already_sent = select(MonthlyReportDelivery.user_id).where(
+            MonthlyReportDelivery.period == period,
+            MonthlyReportDelivery.status == 'sent'
+        )
+        user_ids = [user_id for (user_id,) in db.session.query(User.id).filter(
+            User.monthly_report_enabled.isnot(False),
+            User.id.notin_(already_sent)
+        ).order_by(User.id).all()]
+        
+        app.logger.info(f"Starting to send monthly reports for {calendar.month_name[report_month]} {report_year} to {len(user_ids)} users")
+        if not user_ids:
+            return summary
+        
+        workers = max(1, min(app.config['MONTHLY_REPORT_WORKERS'], len(user_ids)))
+        batch_size = app.config['MONTHLY_REPORT_BATCH_SIZE']
+        
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='monthly-reports') as pool, \
+                BatchMailer(mail, batch_size, app.config['MONTHLY_REPORT_SEND_RETRIES'], logger=app.logger) as mailer:
+            futures = {
+                pool.submit(render_monthly_report_in_worker, user_id, report_year, report_month): user_id
+                for user_id in user_ids
+            }
+            
+            # Send each report as soon as it is rendered
+            for future in as_completed(futures):
+                user_id = futures[future]
+                status, attempts, error = 'no_data', 0, None
+                try:
+                    msg = future.result()
+                    if msg is not None:
+                        attempts = mailer.send(msg)
+                        status = 'sent'
+                except Exception as e:
+                    status, error = 'failed', str(e)[:500]
+                    app.logger.error(f"Error sending monthly report to {user_id}: {str(e)}")
+                summary[status] += 1
+                
+                # Commit each outcome right away, so a crash mid-batch can't lose a 'sent' row and re-mail the user
+                try:
+                    record_report_delivery(user_id, period, status, attempts, error)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Error recording monthly report delivery for {user_id}: {str(e)}")
+            
+            summary['connections'] = mailer.connections_opened
         
-        app.logger.info(f"Sent {success_count}/{len(users)} monthly reports")
+        summary['wall_time'] = round(time.monotonic() - started, 2)
+        app.logger.info(
+            f"Sent {summary['sent']}/{len(user_ids)} monthly reports for {period} "
+            f"({summary['failed']} failed, {summary['no_data']} without data) "
+            f"over {summary['connections']} connections in {summary['wall_time']}s"
+        )
+        return summary
 
 
 #--------------------
@@ -10511,48 +11458,44 @@ def update_prices():
         app.logger.info(f"Portfolio {portfolio.id} ({portfolio.name}) initial value: {initial_value}")
     
     # --------- UPDATE INVESTMENT PRICES -----------
-    # Track unique symbols to avoid redundant API calls
-    processed_symbols = set()
+    # Fetch every unique symbol at once, in batched API calls
     updated_count = 0
+    investments_by_symbol = {}
+    for investment in all_investments:
+        investments_by_symbol.setdefault(investment.symbol, []).append(investment)
+    
+    stocks_data = get_stocks_data(investments_by_symbol, api_key)
     
     # Update prices for each unique symbol
-    for investment in all_investments:
-        # Skip if we've already processed this symbol
-        if investment.symbol in processed_symbols:
-            continue
-            
-        processed_symbols.add(investment.symbol)
-        
-        # Get stock data using cached function
-        stock_data = get_stock_data(investment.symbol, api_key)
+    for symbol, investments in investments_by_symbol.items():
+        stock_data = stocks_data.get(symbol)
         
         if stock_data and 'price' in stock_data:
-            # Find all investments with this symbol and update them
-            for inv in all_investments:
-                if inv.symbol == investment.symbol:
-                    # Store old price for logging
-                    old_price = inv.current_price
-                    old_value = inv.current_value
-                    
-                    # Update to new price
-                    inv.current_price = stock_data['price']
-                    inv.last_update = datetime.utcnow()
-                    
-                    # Calculate new value after price update
-                    new_value = inv.current_value
-                    value_change = new_value - old_value
-                    
-                    # Log the individual investment updates
-                    app.logger.info(f"Updated {inv.symbol}: Price {old_price} → {inv.current_price}, " +
-                                   f"Value {old_value} → {new_value} (change: {value_change})")
+            # Update all investments with this symbol
+            for inv in investments:
+                # Store old price for logging
+                old_price = inv.current_price
+                old_value = inv.current_value
+                
+                # Update to new price
+                inv.current_price = stock_data['price']
+                inv.last_update = datetime.utcnow()
+                
+                # Calculate new value after price update
+                new_value = inv.current_value
+                value_change = new_value - old_value
+                
+                # Log the individual investment updates
+                app.logger.info(f"Updated {inv.symbol}: Price {old_price} → {inv.current_price}, " +
+                               f"Value {old_value} → {new_value} (change: {value_change})")
+                
+                # Update sector and industry if available
+                if 'sector' in stock_data and stock_data['sector']:
+                    inv.sector = stock_data['sector']
+                if 'industry' in stock_data and stock_data['industry']:
+                    inv.industry = stock_data['industry']
                     
-                    # Update sector and industry if available
-                    if 'sector' in stock_data and stock_data['sector']:
-                        inv.sector = stock_data['sector']
-                    if 'industry' in stock_data and stock_data['industry']:
-                        inv.industry = stock_data['industry']
-                        
-                    updated_count += 1
+                updated_count += 1
     
     # --------- CALCULATE NEW PORTFOLIO VALUES -----------
     # After updating all prices, calculate each portfolio's new value
@@ -10656,48 +11599,67 @@ def investment_transactions():
     return render_template('investments/transactions.html',
                           transactions=all_transactions)
 
-# Helper function to get stock data from FMP API
-def get_stock_data(symbol, api_key):
+# Most symbols requested in one FMP quote or profile call
+FMP_BATCH_SIZE = 100
+
+# Helper functions to get stock data from FMP API
+def get_stocks_data(symbols, api_key):
     """
-    Get stock data from Financial Modeling Prep API with caching
-    Reduces API calls by caching responses for 24 hours
+    Get stock data for many symbols from Financial Modeling Prep API with caching.
+    Quotes and profiles are each fetched with one request per FMP_BATCH_SIZE
+    uncached symbols; profiles are cached for FMP_PROFILE_CACHE_HOURS.
+    Returns a dict of symbol -> stock data, leaving out symbols with no quote.
     """
+    # Get base API URL from app config
+    api_url = app.config['FMP_API_URL']
+    symbols = list(dict.fromkeys(symbols))
+    
     try:
-        # Get base API URL from app config
-        api_url = app.config['FMP_API_URL']
-        
-        # Get quote data with caching
-        quote_endpoint = f"quote/{symbol}"
-        quote_data = fmp_cache.get(api_url, quote_endpoint, api_key)
-        
-        if not quote_data or len(quote_data) == 0:
-            return None
-            
-        stock_data = {
-            'symbol': quote_data[0]['symbol'],
-            'name': quote_data[0]['name'],
-            'price': quote_data[0]['price'],
-            'change': quote_data[0]['change'],
-            'percent_change': quote_data[0]['changesPercentage'],
-            'market_cap': quote_data[0].get('marketCap')
-        }
-        
-        # Get profile data for sector and industry (also cached)
-        profile_endpoint = f"profile/{symbol}"
-        profile_data = fmp_cache.get(api_url, profile_endpoint, api_key)
-        
-        if profile_data and len(profile_data) > 0:
-            stock_data['sector'] = profile_data[0].get('sector')
-            stock_data['industry'] = profile_data[0].get('industry')
-            stock_data['description'] = profile_data[0].get('description')
-            stock_data['website'] = profile_data[0].get('website')
-        
-        return stock_data
-        
+        quotes = fmp_cache.get_batch(api_url, 'quote', symbols, api_key, chunk_size=FMP_BATCH_SIZE)
     except Exception as e:
-        app.logger.error(f"Error fetching stock data for {symbol}: {str(e)}")
-        return None
+        app.logger.error(f"Error fetching stock quotes for {', '.join(symbols)}: {str(e)}")
+        return {}
+    
+    stocks = {}
+    for symbol, quote_data in quotes.items():
+        if not quote_data:
+            continue
+        try:
+            stocks[symbol] = {
+                'symbol': quote_data[0]['symbol'],
+                'name': quote_data[0]['name'],
+                'price': quote_data[0]['price'],
+                'change': quote_data[0]['change'],
+                'percent_change': quote_data[0]['changesPercentage'],
+                'market_cap': quote_data[0].get('marketCap')
+            }
+        except (KeyError, TypeError) as e:
+            app.logger.error(f"Error reading stock quote for {symbol}: {str(e)}")
+    
+    # Get profile data for sector and industry (cached much longer than quotes)
+    try:
+        profiles = fmp_cache.get_batch(api_url, 'profile', list(stocks), api_key,
+                                       chunk_size=FMP_BATCH_SIZE,
+                                       expire_seconds=app.config['FMP_PROFILE_CACHE_HOURS'] * 3600)
+    except Exception as e:
+        # Prices are still usable without the profile details
+        app.logger.error(f"Error fetching stock profiles for {', '.join(stocks)}: {str(e)}")
+        profiles = {}
     
+    for symbol, profile_data in profiles.items():
+        if profile_data:
+            stocks[symbol]['sector'] = profile_data[0].get('sector')
+            stocks[symbol]['industry'] = profile_data[0].get('industry')
+            stocks[symbol]['description'] = profile_data[0].get('description')
+            stocks[symbol]['website'] = profile_data[0].get('website')
+    
+    return stocks
+
+def get_stock_data(symbol, api_key):
+    """
+    Get stock data for one symbol from Financial Modeling Prep API with caching
+    """
+    return get_stocks_data([symbol], api_key).get(symbol)
 
 
 @app.route('/edit_portfolio/<int:portfolio_id>', methods=['POST'])
@@ -10908,85 +11870,121 @@ def add_investment_transaction(portfolio_id, investment_id):
     flash(f'Transaction added successfully!', 'success')
     return redirect(url_for('portfolio_details', portfolio_id=portfolio_id))
 
-def sync_investment_prices(user_id):
+def portfolio_values_by_account():
+    """Return {portfolio id: (linked account id, total value)} for portfolios linked to an account"""
+    rows = db.session.query(
+        Portfolio.id,
+        Portfolio.account_id,
+        func.coalesce(func.sum(Investment.shares * Investment.current_price), 0)
+    ).outerjoin(
+        Investment, Investment.portfolio_id == Portfolio.id
+    ).filter(
+        Portfolio.account_id.isnot(None)
+    ).group_by(Portfolio.id, Portfolio.account_id).all()
+    return {portfolio_id: (account_id, value) for portfolio_id, account_id, value in rows}
+
+def refresh_all_investment_prices():
     """
-    Sync investment prices for a user with caching to reduce API calls
+    Refresh prices for every user's investments - runs on a schedule.
+    With the FMP_API_KEY from the environment each distinct symbol is fetched
+    once, through the cache, and every investment with that symbol is updated
+    in one statement. Without it, each user's symbols are fetched with their
+    own API key and only their investments are updated; users without a key
+    are skipped. Then the balances of accounts linked to portfolios follow the
+    change in value.
+    Returns a summary of the run
     """
     with app.app_context():
-        app.logger.info(f"Starting investment price sync for user {user_id} on login")
+        summary = {'symbols': 0, 'symbols_updated': 0, 'investments_updated': 0, 'accounts_updated': 0}
+        if not app.config['INVESTMENT_TRACKING_ENABLED']:
+            return summary
+        
+        app.logger.info("Starting scheduled investment price refresh")
+        started = time.monotonic()
         
         try:
-            # Check if investment tracking is enabled
-            if not app.config['INVESTMENT_TRACKING_ENABLED']:
-                return
-            
-            # Check if user has API key
-            api_settings = UserApiSettings.query.filter_by(user_id=user_id).first()
-            if not api_settings or not api_settings.fmp_api_key:
-                return
-            
-            # Get API key
-            api_key = api_settings.get_api_key()
-            
-            # Get last sync time
-            last_sync = api_settings.last_used
-            
-            # Only sync if last sync was more than 6 hours ago (or never)
-            if last_sync and (datetime.utcnow() - last_sync).total_seconds() < 21600:  # 6 hours
-                return
-            
-            # Get all user's investments
-            portfolios = Portfolio.query.filter_by(user_id=user_id).all()
-            all_investments = []
-            for portfolio in portfolios:
-                all_investments.extend(portfolio.investments)
-            
-            if not all_investments:
-                return
-            
-            # Update prices for each investment (using cache)
-            updated_count = 0
-            
-            # Track unique symbols to avoid redundant API calls for the same symbol
-            processed_symbols = set()
-            
-            for investment in all_investments:
-                # Skip if we've already processed this symbol
-                if investment.symbol in processed_symbols:
+            # Distinct symbols held by each user
+            holdings = db.session.query(Portfolio.user_id, Investment.symbol).join(
+                Investment, Investment.portfolio_id == Portfolio.id
+            ).distinct().all()
+            symbols_by_user = {}
+            for user_id, symbol in holdings:
+                symbols_by_user.setdefault(user_id, []).append(symbol)
+            all_symbols = set(symbol for _, symbol in holdings)
+            summary['symbols'] = len(all_symbols)
+            if not all_symbols:
+                return summary
+            
+            # With the shared key every symbol is fetched once and updated for everyone;
+            # otherwise each user's symbols are fetched with, and update, only their own key's holdings
+            fetch_plan = []
+            used_settings = []
+            if app.config['FMP_API_KEY']:
+                fetch_plan.append((app.config['FMP_API_KEY'], sorted(all_symbols), None))
+            else:
+                api_settings = UserApiSettings.query.filter(
+                    UserApiSettings.user_id.in_(symbols_by_user),
+                    UserApiSettings.fmp_api_key.isnot(None)
+                ).order_by(UserApiSettings.id).all()
+                for settings in api_settings:
+                    fetch_plan.append((settings.get_api_key(), symbols_by_user[settings.user_id], settings.user_id))
+                    used_settings.append(settings)
+                skipped = len(symbols_by_user) - len(api_settings)
+                if skipped:
+                    app.logger.info(f"No FMP API key available for {skipped} users, skipping their investments")
+            
+            values_before = portfolio_values_by_account()
+            
+            # One UPDATE per symbol, across every user's investments or just the key owner's
+            now = datetime.utcnow()
+            symbols_updated = set()
+            for api_key, symbols, user_id in fetch_plan:
+                stocks_data = get_stocks_data(symbols, api_key)
+                for symbol, stock_data in stocks_data.items():
+                    if stock_data.get('price') is None:
+                        continue
+                    values = {'current_price': stock_data['price'], 'last_update': now}
+                    if stock_data.get('sector'):
+                        values['sector'] = stock_data['sector']
+                    if stock_data.get('industry'):
+                        values['industry'] = stock_data['industry']
+                    query = Investment.query.filter(Investment.symbol == symbol)
+                    if user_id is not None:
+                        query = query.filter(Investment.portfolio_id.in_(
+                            db.session.query(Portfolio.id).filter(Portfolio.user_id == user_id)
+                        ))
+                    summary['investments_updated'] += query.update(values, synchronize_session=False)
+                    symbols_updated.add(symbol)
+            summary['symbols_updated'] = len(symbols_updated)
+            
+            # Linked account balances follow the change in portfolio value
+            values_after = portfolio_values_by_account()
+            changes = {}
+            for portfolio_id, (account_id, value_before) in values_before.items():
+                value_change = values_after.get(portfolio_id, (account_id, value_before))[1] - value_before
+                changes[account_id] = changes.get(account_id, 0) + value_change
+            
+            for account in Account.query.filter(Account.id.in_(changes)).all():
+                value_change = changes[account.id]
+                # Only update if there's a significant change (to avoid floating point issues)
+                if abs(value_change) <= 0.01 or account.import_source == 'simplefin':
                     continue
-                
-                processed_symbols.add(investment.symbol)
-                
-                # Get stock data using cached function
-                stock_data = get_stock_data(investment.symbol, api_key)
-                
-                if stock_data and 'price' in stock_data:
-                    # Find all investments with this symbol and update them
-                    for inv in all_investments:
-                        if inv.symbol == investment.symbol:
-                            inv.current_price = stock_data['price']
-                            inv.last_update = datetime.utcnow()
-                            
-                            # Update sector and industry if available
-                            if 'sector' in stock_data and stock_data['sector']:
-                                inv.sector = stock_data['sector']
-                            if 'industry' in stock_data and stock_data['industry']:
-                                inv.industry = stock_data['industry']
-                                
-                            updated_count += 1
-            
-            # Update last sync time
-            api_settings.last_used = datetime.utcnow()
-            db.session.commit()
+                account.balance += value_change
+                summary['accounts_updated'] += 1
+                app.logger.info(f"Updated account {account.name} (ID: {account.id}) balance by {value_change} after price refresh")
             
-            # Log cache stats
-            cache_stats = fmp_cache.get_stats()
-            app.logger.info(f"Investment price sync stats: {cache_stats}")
-            app.logger.info(f"Investment price sync on login for user {user_id}: {updated_count} investments updated")
+            for settings in used_settings:
+                settings.last_used = now
             
+            db.session.commit()
         except Exception as e:
             db.session.rollback()
-            app.logger.error(f"Error in investment price sync on login: {str(e)}")
+            app.logger.error(f"Error in scheduled investment price refresh: {str(e)}")
+            summary['error'] = str(e)
+        
+        summary['wall_time'] = round(time.monotonic() - started, 2)
+        app.logger.info(f"Investment price refresh finished: {summary}, cache stats: {fmp_cache.get_stats()}")
+        return summary
 
 
 
@@ -10994,6 +11992,9 @@ def sync_investment_prices(user_id):
 # # cache management
 #--------------------
 
+# Most cache entries listed on the cache management page
+CACHE_PAGE_ENTRIES = 200
+
 @app.route('/api_cache')
 @login_required_dev
 def api_cache():
@@ -11015,48 +12016,28 @@ def api_cache():
     # Get cache expiry time
     cache_expiry = f"{fmp_cache.expire_seconds // 3600} hours"
     
-    # Get cache files
+    # Entry counts, and the most recent entries
+    summary = fmp_cache.summary()
     cache_files = []
-    if os.path.exists(fmp_cache.cache_dir):
-        for filename in os.listdir(fmp_cache.cache_dir):
-            if filename.endswith('.json'):
-                filepath = os.path.join(fmp_cache.cache_dir, filename)
-                
-                # Get file size
-                size_bytes = os.path.getsize(filepath)
-                if size_bytes < 1024:
-                    size = f"{size_bytes} B"
-                elif size_bytes < 1024 * 1024:
-                    size = f"{size_bytes / 1024:.1f} KB"
-                else:
-                    size = f"{size_bytes / (1024 * 1024):.1f} MB"
-                
-                # Get last modified time
-                modified = datetime.fromtimestamp(os.path.getmtime(filepath))
-                
-                # Check if expired
-                is_expired = False
-                try:
-                    with open(filepath, 'r') as f:
-                        data = json.load(f)
-                    timestamp = data.get('timestamp', 0)
-                    is_expired = (time.time() - timestamp) >= fmp_cache.expire_seconds
-                except Exception:
-                    is_expired = True
-                
-                # Add to list
-                cache_files.append({
-                    'key': filename.replace('.json', ''),
-                    'size': size,
-                    'modified': modified.strftime('%Y-%m-%d %H:%M:%S'),
-                    'expired': is_expired
-                })
-    
-    # Sort by modification time (newest first)
-    cache_files.sort(key=lambda x: x['modified'], reverse=True)
+    for entry in fmp_cache.list_entries(limit=CACHE_PAGE_ENTRIES):
+        size_bytes = entry['size_bytes']
+        if size_bytes < 1024:
+            size = f"{size_bytes} B"
+        elif size_bytes < 1024 * 1024:
+            size = f"{size_bytes / 1024:.1f} KB"
+        else:
+            size = f"{size_bytes / (1024 * 1024):.1f} MB"
+        
+        cache_files.append({
+            'key': entry['key'],
+            'size': size,
+            'modified': datetime.fromtimestamp(entry['fetched_at']).strftime('%Y-%m-%d %H:%M:%S'),
+            'expired': entry['expired']
+        })
     
     return render_template('cache_management.html',
                           stats=stats,
+                          summary=summary,
                           cache_expiry=cache_expiry,
                           cache_files=cache_files)
 
@@ -11112,10 +12093,7 @@ def stats():
     
     # Build the filter query - only expenses where user is involved
     query_filters = [
-        or_(
-            Expense.user_id == current_user.id,
-            Expense.split_with.like(f'%{current_user.id}%')
-        ),
+        user_expense_filter(current_user.id),
         Expense.date >= start_date,
         Expense.date <= end_date
     ]
@@ -11128,7 +12106,7 @@ def stats():
             query_filters.append(Expense.group_id == group_id)
     
     # Execute the query with all filters
-    expenses = Expense.query.filter(and_(*query_filters)).order_by(Expense.date.desc()).all()
+    expenses = Expense.query.options(selectinload(Expense.participants)).filter(and_(*query_filters)).order_by(Expense.date.desc()).all()
     
     # Get all settlements in the date range
     settlement_filters = [
@@ -11167,22 +12145,12 @@ def stats():
         else:
             current_date = current_date.replace(month=current_date.month + 1)
     
+    # Work out each expense's splits and the user's portion in one pass
+    rollup = ExpenseRollup(expenses, current_user.id)
+    
     for expense in expenses:
-        # Calculate splits for this expense
-        splits = expense.calculate_splits()
-        
         # Create a record of the user's portion only
-        user_portion = 0
-        
-        if expense.paid_by == current_user.id:
-            # If current user paid, include their own portion
-            user_portion = splits['payer']['amount']
-        else:
-            # If someone else paid, find current user's portion from splits
-            for split in splits['splits']:
-                if split['email'] == current_user.id:
-                    user_portion = split['amount']
-                    break
+        user_portion = rollup.user_portions[expense.id]
         
         # Only add to list if user has a portion
         if user_portion > 0:
@@ -11233,14 +12201,16 @@ def stats():
             # Add to user's total
             total_user_expenses += user_portion
 
-            # Add to monthly spending or income based on transaction type
-            month_key = expense_data['date'].strftime('%Y-%m')
-            if month_key in monthly_spending:
-                # Separate income and expense transactions
-                if expense_data.get('transaction_type') == 'income':
-                    monthly_income[month_key] += expense_data['user_portion']
-                else:  # 'expense' or 'transfer' or None (legacy expenses)
-                    monthly_spending[month_key] += expense_data['user_portion']
+    # Add to monthly spending or income based on transaction type
+    for month_key in monthly_spending:
+        portions = rollup.portion_by_month.get(month_key, {})
+        # Separate income and expense transactions
+        monthly_income[month_key] = portions.get('income', 0)
+        # 'expense' or 'transfer' or None (legacy expenses)
+        monthly_spending[month_key] = sum(
+            amount for transaction_type, amount in portions.items()
+            if transaction_type != 'income'
+        )
 
     # Prepare chart data in correct order
     for month_key in sorted(monthly_spending.keys()):
@@ -11250,33 +12220,15 @@ def stats():
     # Calculate spending trend compared to previous period
     previous_period_start = start_date - (end_date - start_date)
     previous_period_filters = [
-        or_(
-            Expense.user_id == current_user.id,
-            Expense.split_with.like(f'%{current_user.id}%')
-        ),
+        user_expense_filter(current_user.id),
         Expense.date >= previous_period_start,
         Expense.date < start_date
     ]
     
-    # Initialize previous_total before querying
-    previous_total = 0
-    
-    previous_expenses = Expense.query.filter(and_(*previous_period_filters)).all()
+    previous_expenses = Expense.query.options(selectinload(Expense.participants)).filter(and_(*previous_period_filters)).all()
     
     # Process previous expenses and calculate total
-    for expense in previous_expenses:
-        splits = expense.calculate_splits()
-        user_portion = 0
-        
-        if expense.paid_by == current_user.id:
-            user_portion = splits['payer']['amount']
-        else:
-            for split in splits['splits']:
-                if split['email'] == current_user.id:
-                    user_portion = split['amount']
-                    break
-        
-        previous_total += user_portion
+    previous_total = ExpenseRollup(previous_expenses, current_user.id).portion_total
     
     # Then calculate spending trend
     if previous_total > 0:
@@ -11345,7 +12297,7 @@ def stats():
     chronological_items = []
     
     for expense in expenses:
-        splits = expense.calculate_splits()
+        splits = rollup.splits[expense.id]
         
         # If current user paid
         if expense.paid_by == current_user.id:
@@ -11734,24 +12686,18 @@ def handle_comparison_request():
     
     # Get expenses for both periods - reuse your existing query logic
     primary_query_filters = [
-        or_(
-            Expense.user_id == current_user.id,
-            Expense.split_with.like(f'%{current_user.id}%')
-        ),
+        user_expense_filter(current_user.id),
         Expense.date >= primary_start_date,
         Expense.date <= primary_end_date
     ]
-    primary_expenses_raw = Expense.query.filter(and_(*primary_query_filters)).order_by(Expense.date).all()
+    primary_expenses_raw = Expense.query.options(selectinload(Expense.participants)).filter(and_(*primary_query_filters)).order_by(Expense.date).all()
     
     comparison_query_filters = [
-        or_(
-            Expense.user_id == current_user.id,
-            Expense.split_with.like(f'%{current_user.id}%')
-        ),
+        user_expense_filter(current_user.id),
         Expense.date >= comparison_start_date,
         Expense.date <= comparison_end_date
     ]
-    comparison_expenses_raw = Expense.query.filter(and_(*comparison_query_filters)).order_by(Expense.date).all()
+    comparison_expenses_raw = Expense.query.options(selectinload(Expense.participants)).filter(and_(*comparison_query_filters)).order_by(Expense.date).all()
     
     # Process expenses to get user's portion
     primary_expenses = []
@@ -11760,17 +12706,9 @@ def handle_comparison_request():
     comparison_total = 0
     
     # Process primary period expenses
+    primary_rollup = ExpenseRollup(primary_expenses_raw, current_user.id)
     for expense in primary_expenses_raw:
-        splits = expense.calculate_splits()
-        user_portion = 0
-        
-        if expense.paid_by == current_user.id:
-            user_portion = splits['payer']['amount']
-        else:
-            for split in splits['splits']:
-                if split['email'] == current_user.id:
-                    user_portion = split['amount']
-                    break
+        user_portion = primary_rollup.user_portions[expense.id]
         
         if user_portion > 0:
             expense_data = {
@@ -11786,17 +12724,9 @@ def handle_comparison_request():
             primary_total += user_portion
     
     # Process comparison period expenses
+    comparison_rollup = ExpenseRollup(comparison_expenses_raw, current_user.id)
     for expense in comparison_expenses_raw:
-        splits = expense.calculate_splits()
-        user_portion = 0
-        
-        if expense.paid_by == current_user.id:
-            user_portion = splits['payer']['amount']
-        else:
-            for split in splits['splits']:
-                if split['email'] == current_user.id:
-                    user_portion = split['amount']
-                    break
+        user_portion = comparison_rollup.user_portions[expense.id]
         
         if user_portion > 0:
             expense_data = {
@@ -12148,6 +13078,94 @@ with app.app_context():
     except Exception as e:
         print(f"ERROR CREATING TABLES: {str(e)}")
 
+#--------------------
+# MAINTENANCE COMMANDS
+#--------------------
+
+@app.cli.command('backfill-participants')
+def backfill_participants_command():
+    """Rebuild expense_participants rows for all existing expenses"""
+    count = backfill_expense_participants()
+    print(f"Synced participants for {count} expenses")
+
+@app.cli.command('recompute-splits')
+def recompute_splits_command():
+    """Recompute the stored split shares of every expense from its split_details"""
+    count = backfill_expense_participants()
+    print(f"Recomputed splits for {count} expenses")
+
+@app.cli.command('verify-balances')
+@click.option('--fix', is_flag=True, help='Rebuild the ledger from scratch if it has drifted')
+def verify_balances_command(fix):
+    """Rebuild the IOU ledger in memory and diff it against the stored pairwise balances"""
+    mismatches = verify_pairwise_balances()
+    for mismatch in mismatches:
+        print(f"{mismatch['user_b']} -> {mismatch['user_a']}: "
+              f"stored {mismatch['stored']:.2f}, expected {mismatch['expected']:.2f}")
+
+    if not mismatches:
+        print("IOU ledger matches expense and settlement history")
+    elif fix:
+        count = rebuild_pairwise_balances()
+        db.session.commit()
+        print(f"Rebuilt IOU ledger with {count} user pairs")
+    else:
+        print(f"{len(mismatches)} mismatched pairs - rerun with --fix to rebuild")
+
+@app.cli.command('rebuild-category-spend')
+@click.option('--user', 'user_id', default=None, help='Only rebuild this user\'s totals')
+def rebuild_category_spend_command(user_id):
+    """Rebuild the per-category day/week/month spending totals from the expenses"""
+    count = rebuild_category_spend(user_id)
+    db.session.commit()
+    print(f"Rebuilt {count} category spend totals")
+
+@app.cli.command('refresh-recurring-candidates')
+@click.option('--user', 'user_id', default=None, help='Only refresh this user\'s candidates')
+def refresh_recurring_candidates_command(user_id):
+    """Re-run recurring transaction detection over the full history and store the candidates"""
+    user_ids = [user_id] if user_id else [uid for (uid,) in db.session.query(User.id).all()]
+    count = sum(refresh_recurring_candidates(uid) for uid in user_ids)
+    print(f"Stored {count} recurring candidates for {len(user_ids)} users")
+
+@app.cli.command('rebase-amounts')
+@click.option('--missing-only', is_flag=True, help='Only fill in rows without a stored base amount')
+def rebase_amounts_command(missing_only):
+    """Recompute stored base-currency amounts for expenses and category splits, and the category spend totals"""
+    count = rebase_amounts(only_missing=missing_only)
+    print(f"Re-based stored amounts for {count} expenses")
+
+@app.cli.command('import-currency-rates')
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--base', 'quote_base', default=None, help='Base currency of CSV quotes when the file has no base column')
+def import_currency_rates_command(paths, quote_base):
+    """Backfill the exchange-rate history from Frankfurter JSON or CSV files"""
+    total_rates = 0
+    for path in paths:
+        with open(path, newline='', encoding='utf-8') as rate_file:
+            if path.lower().endswith('.json'):
+                days = list(parse_frankfurter_json(json.load(rate_file)))
+            else:
+                days = list(parse_rates_csv(rate_file, quote_base))
+        
+        count, skipped = import_currency_history(days)
+        db.session.commit()
+        total_rates += count
+        print(f"{path}: stored {count} rates for {len(days) - skipped} days"
+              + (f", skipped {skipped} days without a rate for the base currency" if skipped else ""))
+    
+    invalidate_currency_rates()
+    print(f"Imported {total_rates} exchange rates - run 'flask rebase-amounts' to apply them to stored amounts")
+
+@app.cli.command('migrate-fmp-cache')
+def migrate_fmp_cache_command():
+    """Move FMP responses cached as JSON files into the SQLite cache"""
+    if fmp_cache.backend != 'sqlite':
+        print("Set FMP_CACHE_BACKEND=sqlite before migrating the FMP cache")
+        return
+    migrated, removed = fmp_cache.migrate_json_files()
+    print(f"Migrated {migrated} cached responses, removed {removed} JSON files")
+
 # Register OIDC routes
 if oidc_enabled:
     register_oidc_routes(app, User, db)        
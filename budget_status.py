@@ -0,0 +1,150 @@
+r"""29a41de6a866d56c36aba5159f45257c"""
+"""
+Budget periods and spending, for every budget of a user at once.
+
+Budget.calculate_spent_amount() used to run its own expense and category
+split queries, then calculate_splits() per expense, and get_status() and
+get_progress_percentage() each ran it again. BudgetSpending holds the user's
+spending per category for each budget period, read from the
+category_period_spend table, so any budget's spent amount, progress and
+status are lookups. That table holds each user's spending per category per
+day, week and month; period_rows() rolls day totals up into it.
+"""
+from datetime import datetime, timedelta
+
+PERIODS = ('weekly', 'monthly', 'yearly', 'daily')
+
+# Grains of the category_period_spend table, each keyed by the first day of the period
+GRAINS = ('day', 'week', 'month')
+
+
+def period_key(period):
+    """Return the PERIODS entry a budget period falls under; unknown periods cover the current day"""
+    return period if period in PERIODS else 'daily'
+
+
+def period_dates(period, today=None):
+    """Get start and end dates for the current budget period"""
+    today = (today or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if period == 'weekly':
+        # Start of the week (Monday)
+        start_of_week = today - timedelta(days=today.weekday())
+        end_of_week = start_of_week + timedelta(days=6, hours=23, minutes=59, seconds=59)
+        return start_of_week, end_of_week
+
+    elif period == 'monthly':
+        # Start of the month
+        start_of_month = today.replace(day=1)
+        # End of the month
+        if today.month == 12:
+            end_of_month = today.replace(year=today.year + 1, month=1, day=1) - timedelta(seconds=1)
+        else:
+            end_of_month = today.replace(month=today.month + 1, day=1) - timedelta(seconds=1)
+        return start_of_month, end_of_month
+
+    elif period == 'yearly':
+        # Start of the year
+        start_of_year = today.replace(month=1, day=1)
+        # End of the year
+        end_of_year = today.replace(year=today.year + 1, month=1, day=1) - timedelta(seconds=1)
+        return start_of_year, end_of_year
+
+    # Default to current day
+    return today, today.replace(hour=23, minute=59, second=59)
+
+
+def week_start(day):
+    """Monday of the week holding day"""
+    return day - timedelta(days=day.weekday())
+
+
+def month_start(day):
+    """First day of the month holding day"""
+    return day.replace(day=1)
+
+
+def grain_start(grain, day):
+    """First day of the day, week or month holding day"""
+    if grain == 'week':
+        return week_start(day)
+    if grain == 'month':
+        return month_start(day)
+    return day
+
+
+def period_rows(day_totals, grains=GRAINS):
+    """
+    Roll {(category_id, day): amount} up into (category_id, grain, period_start, amount)
+    rows for each grain, leaving out empty periods
+    """
+    totals = {}
+    for (category_id, day), amount in day_totals.items():
+        for grain in grains:
+            key = (category_id, grain, grain_start(grain, day))
+            totals[key] = totals.get(key, 0.0) + amount
+    return [(category_id, grain, start, amount)
+            for (category_id, grain, start), amount in totals.items() if amount]
+
+
+def progress_percentage(amount, spent):
+    """Percentage of the budget spent, capped at 100"""
+    if amount <= 0:
+        return 100  # Avoid division by zero
+    percentage = (spent / amount) * 100
+    return min(percentage, 100)  # Cap at 100%
+
+
+def budget_status(amount, spent):
+    """Return the budget status: 'under', 'approaching', 'over'"""
+    percentage = progress_percentage(amount, spent)
+    if percentage >= 100:
+        return 'over'
+    elif percentage >= 80:
+        return 'approaching'
+    else:
+        return 'under'
+
+
+class BudgetSpending:
+    """A user's spending per category in each current budget period.
+
+    Attributes:
+        periods: period key -> (start, end) of the current period
+        totals: category id -> period key -> the user's share spent
+        subcategories: parent category id -> ids of its subcategories
+    """
+
+    def __init__(self, spend_rows=(), subcategory_rows=(), today=None):
+        """
+        spend_rows: (category_id, period key, amount), one or more per category
+        subcategory_rows: (category_id, parent_id)
+        """
+        self.periods = {period: period_dates(period, today) for period in PERIODS}
+        self.totals = {}
+        self.subcategories = {}
+
+        for category_id, period, amount in spend_rows:
+            self.add(category_id, period, amount)
+
+        for category_id, parent_id in subcategory_rows:
+            self.subcategories.setdefault(parent_id, []).append(category_id)
+
+    def add(self, category_id, period, amount):
+        """Add an amount spent in a category during one of the current periods"""
+        by_period = self.totals.setdefault(category_id, {})
+        by_period[period] = by_period.get(period, 0.0) + (amount or 0)
+
+    @property
+    def date_range(self):
+        """The earliest start and latest end over every period"""
+        return (min(start for start, _ in self.periods.values()),
+                max(end for _, end in self.periods.values()))
+
+    def spent(self, category_id, period, include_subcategories=True):
+        """The user's share spent in a category (and its subcategories) in the current period"""
+        period = period_key(period)
+        category_ids = [category_id]
+        if include_subcategories:
+            category_ids += self.subcategories.get(category_id, [])
+        return sum(self.totals.get(category, {}).get(period, 0.0) for category in category_ids)
@@ -0,0 +1,248 @@
+r"""29a41de6a866d56c36aba5159f45257c"""
+"""
+Compiled category mapping rules.
+
+auto_categorize_transaction() used to load every active CategoryMapping and
+recompile each regex for every transaction. CategoryRuleSet compiles a
+user's mappings once: plain keywords go into a single Aho-Corasick automaton
+so one scan of the description finds all of them, and regex rules are
+compiled up front. CategoryRuleCache keeps a rule set per user and queues
+match-count increments so they can be written in one statement.
+CategoryNameIndex resolves category names for a whole import in memory.
+"""
+import re
+import threading
+import time
+from collections import deque
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over a list of lowercase keywords"""
+
+    def __init__(self, keywords):
+        self.keywords = list(keywords)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for index, keyword in enumerate(self.keywords):
+            node = 0
+            for char in keyword:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[node][char] = next_node
+                node = next_node
+            self._out[node].append(index)
+
+        # Breadth-first pass to link each node to its longest proper suffix
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, next_node in self._goto[node].items():
+                queue.append(next_node)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_node] = self._goto[fallback].get(char, 0)
+                self._out[next_node] = self._out[next_node] + self._out[self._fail[next_node]]
+
+    def first_positions(self, text):
+        """Return keyword index -> start of its first occurrence in text"""
+        goto, fail, out = self._goto, self._fail, self._out
+        found = {}
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for index in out[node]:
+                if index not in found:
+                    found[index] = position - len(self.keywords[index]) + 1
+        return found
+
+
+class CategoryRule:
+    """A snapshot of one active CategoryMapping"""
+    __slots__ = ('id', 'keyword', 'category_id', 'is_regex', 'priority',
+                 'match_count', 'pattern', 'order')
+
+    def __init__(self, mapping_id, keyword, category_id, is_regex=False,
+                 priority=0, match_count=0, order=0):
+        self.id = mapping_id
+        self.keyword = keyword or ''
+        self.category_id = category_id
+        self.is_regex = bool(is_regex)
+        self.priority = priority or 0
+        self.match_count = match_count or 0
+        self.order = order
+        self.pattern = None
+
+        if self.is_regex:
+            try:
+                self.pattern = re.compile(self.keyword, re.IGNORECASE)
+            except re.error:
+                # Invalid regexes fall back to a plain substring search
+                self.pattern = None
+
+    def score(self, position):
+        """
+        Score a match by priority, usage count and keyword length.
+        Plain keywords also score higher the earlier they appear.
+        """
+        score = (self.priority * 100) + (self.match_count * 10) + len(self.keyword)
+        if not self.is_regex:
+            if position == 0:
+                score += 50
+            elif position > 0:
+                score += max(0, 30 - position)
+        return score
+
+
+class CategoryRuleSet:
+    """All of a user's active mapping rules, compiled for matching"""
+
+    def __init__(self, mappings):
+        """
+        mappings: iterable of (id, keyword, category_id, is_regex, priority,
+        match_count), in priority/match_count order as the old query returned
+        them; that order breaks score ties.
+        """
+        self.rules = [CategoryRule(*mapping, order=order) for order, mapping in enumerate(mappings)]
+        self.built_at = time.monotonic()
+
+        self._regex_rules = []
+        self._empty_rules = []
+        keyword_rules = {}
+        for rule in self.rules:
+            if rule.pattern is not None:
+                self._regex_rules.append(rule)
+            elif not rule.keyword:
+                self._empty_rules.append(rule)
+            else:
+                keyword_rules.setdefault(rule.keyword.lower(), []).append(rule)
+
+        self._keyword_rules = list(keyword_rules.values())
+        self._automaton = KeywordAutomaton(keyword_rules.keys())
+
+    def __len__(self):
+        return len(self.rules)
+
+    def match(self, description):
+        """Return the best matching rule for a description, or None"""
+        if not description or not self.rules:
+            return None
+
+        description = description.strip().lower()
+        best = None
+        best_key = None
+
+        def consider(rule, position):
+            nonlocal best, best_key
+            key = (rule.score(position), rule.priority, rule.match_count, -rule.order)
+            if best_key is None or key > best_key:
+                best, best_key = rule, key
+
+        for index, position in self._automaton.first_positions(description).items():
+            for rule in self._keyword_rules[index]:
+                consider(rule, position)
+
+        for rule in self._empty_rules:
+            consider(rule, 0)
+
+        for rule in self._regex_rules:
+            if rule.pattern.search(description):
+                consider(rule, -1)
+
+        return best
+
+    def match_many(self, descriptions):
+        """Return the best rule for each description, matching each distinct description once"""
+        matched = {}
+        results = []
+        for description in descriptions:
+            key = description.strip().lower() if description else ''
+            if key not in matched:
+                matched[key] = self.match(key) if key else None
+            results.append(matched[key])
+        return results
+
+
+class CategoryNameIndex:
+    """
+    In-memory version of get_category_id()'s name lookups: an exact
+    case-insensitive match first, then a partial match on subcategories,
+    then a partial match on top-level categories.
+    """
+
+    def __init__(self, categories=()):
+        """categories: iterable of (id, name, parent_id), in id order"""
+        self._exact = {}
+        self._subcategories = []
+        self._parents = []
+        for category_id, name, parent_id in categories:
+            self.add(category_id, name, parent_id)
+
+    def add(self, category_id, name, parent_id=None):
+        name = (name or '').lower()
+        self._exact.setdefault(name, category_id)
+        if parent_id is not None:
+            self._subcategories.append((name, category_id))
+        else:
+            self._parents.append((name, category_id))
+
+    def find(self, name):
+        """Return the id of the category best matching name, or None"""
+        if not name:
+            return None
+        name = name.lower()
+        if name in self._exact:
+            return self._exact[name]
+        for candidates in (self._subcategories, self._parents):
+            for category_name, category_id in candidates:
+                if name in category_name:
+                    return category_id
+        return None
+
+
+class CategoryRuleCache:
+    """
+    Per-user CategoryRuleSet cache.
+
+    Routes that change mappings call invalidate(); the TTL bounds how long
+    other worker processes keep serving a stale rule set.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._rule_sets = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id, loader):
+        """Return the user's rule set, building it with loader(user_id) when missing or expired"""
+        with self._lock:
+            rule_set = self._rule_sets.get(user_id)
+        if rule_set is not None and time.monotonic() - rule_set.built_at < self.ttl:
+            return rule_set
+
+        rule_set = loader(user_id)
+        with self._lock:
+            self._rule_sets[user_id] = rule_set
+        return rule_set
+
+    def invalidate(self, user_id=None):
+        """Drop one user's rule set, or every cached rule set"""
+        with self._lock:
+            if user_id is None:
+                self._rule_sets.clear()
+            else:
+                self._rule_sets.pop(user_id, None)
+
+    def record_matches(self, rules):
+        """Count matches on the cached rules so scoring sees them before the next rebuild; rules may repeat"""
+        with self._lock:
+            for rule in rules:
+                rule.match_count += 1
@@ -0,0 +1,160 @@
+r"""29a41de6a866d56c36aba5159f45257c"""
+"""
+Streaming CSV import.
+
+import_csv used to read the whole upload into one string and then run its
+lookups row by row inside the request. Here rows are decoded from the file as
+it is read and handed out in fixed-size batches, and CsvRowParser turns each
+raw row into transaction fields using the options chosen on the import form.
+Saving a batch (transaction types, duplicate check, categories, balances) is import_csv_rows()
+in app.py, which runs inside the request for small files and as a background
+ImportJob for large ones.
+"""
+import csv
+import codecs
+from datetime import datetime
+from itertools import islice
+
+DATE_FORMATS = {
+    'MM/DD/YYYY': '%m/%d/%Y',
+    'DD/MM/YYYY': '%d/%m/%Y',
+    'YYYY-MM-DD': '%Y-%m-%d',
+    'YYYY/MM/DD': '%Y/%m/%d',
+}
+
+DELIMITERS = {
+    'comma': ',',
+    'tab': '\t',
+    'semicolon': ';',
+    'pipe': '|',
+}
+
+
+class CsvImportOptions:
+    """The column mapping and options of one import, as chosen on the import form"""
+
+    FIELDS = ('date_format', 'date_column', 'amount_column', 'description_column', 'category_column',
+              'type_column', 'id_column', 'delimiter', 'detect_duplicates', 'auto_categorize',
+              'negative_is_expense')
+
+    def __init__(self, date_format='MM/DD/YYYY', date_column='Date', amount_column='Amount',
+                 description_column='Description', category_column=None, type_column=None,
+                 id_column=None, delimiter=',', detect_duplicates=False, auto_categorize=False,
+                 negative_is_expense=False):
+        self.date_format = date_format
+        self.date_column = date_column
+        self.amount_column = amount_column
+        self.description_column = description_column
+        self.category_column = category_column
+        self.type_column = type_column
+        self.id_column = id_column
+        self.delimiter = delimiter
+        self.detect_duplicates = detect_duplicates
+        self.auto_categorize = auto_categorize
+        self.negative_is_expense = negative_is_expense
+
+    @classmethod
+    def from_form(cls, form):
+        """Read the options from the submitted import form"""
+        delimiter = DELIMITERS.get(form.get('delimiter', 'comma'), ',')
+        if form.get('delimiter') == 'custom':
+            delimiter = form.get('custom_delimiter', ',') or ','
+
+        return cls(
+            date_format=form.get('date_format', 'MM/DD/YYYY'),
+            date_column=form.get('date_column', 'Date'),
+            amount_column=form.get('amount_column', 'Amount'),
+            description_column=form.get('description_column', 'Description'),
+            category_column=form.get('category_column'),
+            type_column=form.get('type_column'),
+            id_column=form.get('id_column'),
+            delimiter=delimiter,
+            detect_duplicates='detect_duplicates' in form,
+            auto_categorize='auto_categorize' in form,
+            negative_is_expense='negative_is_expense' in form,
+        )
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{field: data[field] for field in cls.FIELDS if field in data})
+
+
+def iter_csv_rows(stream, delimiter=',', encoding='utf-8-sig'):
+    """Yield dict rows from a binary file object, decoding it as it is read"""
+    # A stream reader only needs read(), which upload spool files have on every Python version
+    text = codecs.getreader(encoding)(stream)
+    yield from csv.DictReader(text, delimiter=delimiter)
+
+
+def batches(iterable, size):
+    """Split an iterable into lists of at most size items"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def parse_amount(value):
+    """Parse an amount like '$1,234.56' or '-24.99'; None if it isn't a number"""
+    try:
+        return float(value.strip().replace('$', '').replace(',', ''))
+    except (AttributeError, ValueError):
+        return None
+
+
+class CsvRowParser:
+    """Turns raw CSV rows into transaction fields for one import's options"""
+
+    def __init__(self, options):
+        self.options = options
+        self.date_pattern = DATE_FORMATS.get(options.date_format, DATE_FORMATS['MM/DD/YYYY'])
+
+    def parse_date(self, date_str):
+        return datetime.strptime(date_str, self.date_pattern)
+
+    def parse(self, row):
+        """
+        Return a dict of date, amount (signed), description, type_value (the type
+        column, for TransactionClassifier), external_id and category_name, or None
+        for rows to skip. Raises ValueError for a date that doesn't match the format.
+        """
+        options = self.options
+        if not all(key in row for key in (options.date_column, options.amount_column, options.description_column)):
+            return None
+
+        date_str = (row[options.date_column] or '').strip()
+        amount_str = (row[options.amount_column] or '').strip()
+        description = (row[options.description_column] or '').strip()
+        if not date_str or not amount_str or not description:
+            return None
+
+        transaction_date = self.parse_date(date_str)
+        amount = parse_amount(amount_str)
+        if amount is None:
+            return None
+
+        external_id = None
+        if options.id_column and options.id_column in row:
+            external_id = row[options.id_column]
+
+        type_value = None
+        if options.type_column and options.type_column in row:
+            type_value = row[options.type_column]
+
+        category_name = None
+        if options.category_column and options.category_column in row:
+            category_name = (row[options.category_column] or '').strip()
+
+        return {
+            'date': transaction_date,
+            'amount': amount,
+            'description': description,
+            'type_value': type_value,
+            'external_id': external_id,
+            'category_name': category_name,
+        }
@@ -29,7 +29,7 @@ def reset_demo_data():
         session = Session()
         
         # Import models for database operations
-        from app import User, Group, Expense, Budget, Category, Tag
+        from app import User, Group, Expense, ExpenseParticipant, Budget, Category, Tag
         
         # Clean demo-specific data
         logger.info("Cleaning demo user data")
@@ -40,6 +40,11 @@ def reset_demo_data():
         for user in demo_users:
             # Delete all user's expenses
             logger.info(f"Deleting expenses for user: {user.id}")
+            session.query(ExpenseParticipant).filter(
+                ExpenseParticipant.expense_id.in_(
+                    session.query(Expense.id).filter(Expense.user_id == user.id)
+                )
+            ).delete(synchronize_session=False)
             session.query(Expense).filter(Expense.user_id == user.id).delete()
             
             # Delete user's budgets
@@ -63,13 +68,21 @@ def reset_demo_data():
         
         # Commit changes
         session.commit()
+        demo_user_ids = [user.id for user in demo_users]
         
-        # Recreate demo data
-        logger.info("Recreating demo data")
-        from app import create_demo_data
-        
-        for user in demo_users:
-            create_demo_data(user.id)
+        from app import app, db, create_demo_data, rebuild_pairwise_balances, rebuild_category_spend
+        with app.app_context():
+            # The bulk deletes above skip the app's IOU ledger and category spend upkeep
+            logger.info("Rebuilding IOU balances and category spend totals for demo users")
+            rebuild_pairwise_balances(demo_user_ids)
+            for user_id in demo_user_ids:
+                rebuild_category_spend(user_id)
+            db.session.commit()
+            
+            # Recreate demo data
+            logger.info("Recreating demo data")
+            for user_id in demo_user_ids:
+                create_demo_data(user_id)
         
         logger.info("Demo environment reset completed successfully")
         
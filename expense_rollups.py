@@ -0,0 +1,224 @@
+r"""29a41de6a866d56c36aba5159f45257c"""
+"""
+Single-pass rollups over a user's expense stream.
+
+The dashboard, transactions and stats pages all summarise the same list of
+expenses: monthly totals by card, account and contributor, totals per
+transaction type, and the current user's year-to-date and month-to-date
+share. ExpenseRollup walks the list once, or folds rows the database has
+already grouped, and keeps every one of those rollups so each route reads
+what it needs instead of looping again.
+"""
+from datetime import datetime
+
+
+def bucket_key(year, month):
+    """Return the 'YYYY-MM' bucket for a year and month"""
+    return f"{int(year):04d}-{int(month):02d}"
+
+
+def month_key(date):
+    """Return the 'YYYY-MM' bucket for a date"""
+    return bucket_key(date.year, date.month)
+
+
+def _add(bucket, key, amount):
+    bucket[key] = bucket.get(key, 0) + amount
+
+
+def _new_month(with_accounts=False):
+    month = {
+        'total': 0.0,
+        'by_card': {},
+        'contributors': {}
+    }
+    if with_accounts:
+        month['by_account'] = {}
+    return month
+
+
+def _add_contributors(contributors, splits):
+    if splits['payer']['amount'] > 0:
+        _add(contributors, splits['payer']['email'], splits['payer']['amount'])
+    for split in splits['splits']:
+        _add(contributors, split['email'], split['amount'])
+
+
+class ExpenseRollup:
+    """All per-user expense rollups, built in one pass.
+
+    Attributes:
+        splits: expense id -> calculate_splits() result
+        monthly_totals: month -> total/by_card/contributors over every
+            transaction type (the transactions page view)
+        expense_monthly_totals: month -> total/by_card/by_account/contributors
+            over expense-type rows only; months holding only income or
+            transfers are present with zero totals (the dashboard view)
+        type_totals: transaction type -> sum of full amounts
+        user_portions: expense id -> the user's own portion (payer share when
+            they paid, their split otherwise)
+        portion_by_month: month -> transaction type -> sum of user portions
+        year_total / year_expense_total: the user's year-to-date share, over
+            all types and expense-type rows only. When the user paid, the
+            share is the whole expense.
+        month_total / month_expense_total: the same for the current month
+        year_income: full amounts of this year's income
+        unique_cards: cards used on expenses the user paid
+    """
+
+    def __init__(self, expenses, user_id, splits=None, now=None):
+        self.user_id = user_id
+        self.now = now or datetime.now()
+        self.splits = splits if splits is not None else {}
+
+        self.monthly_totals = {}
+        self.expense_monthly_totals = {}
+        self.type_totals = {}
+        self.user_portions = {}
+        self.portion_by_month = {}
+        self.year_total = 0
+        self.year_expense_total = 0
+        self.month_total = 0
+        self.month_expense_total = 0
+        self.year_income = 0
+        self.unique_cards = set()
+
+        self._current_year = self.now.year
+        self._current_month = month_key(self.now)
+
+        for expense in expenses:
+            self.add(expense)
+
+    @classmethod
+    def from_totals(cls, user_id, amount_rows, contributor_rows, share_rows,
+                    unique_cards=(), now=None):
+        """Build the monthly, per-type and year/month-to-date rollups from
+        rows the database has already grouped.
+
+        amount_rows: (year, month, transaction_type, card_used, account_name, amount)
+        contributor_rows: (year, month, transaction_type, user_id, amount)
+        share_rows: (year, month, transaction_type, amount) holding the user's share
+
+        Per-expense splits and user portions are left empty; callers that
+        need them fold expenses in with add().
+        """
+        rollup = cls([], user_id, now=now)
+        rollup.unique_cards = set(unique_cards)
+
+        for year, month, transaction_type, card, account_name, amount in amount_rows:
+            key = bucket_key(year, month)
+            amount = amount or 0
+
+            totals = rollup.monthly_totals.setdefault(key, _new_month())
+            totals['total'] += amount
+            _add(totals['by_card'], card, amount)
+
+            totals = rollup.expense_monthly_totals.setdefault(key, _new_month(with_accounts=True))
+            if transaction_type == 'expense':
+                totals['total'] += amount
+                _add(totals['by_card'], card, amount)
+                if account_name:
+                    _add(totals['by_account'], account_name, amount)
+
+            _add(rollup.type_totals, transaction_type, amount)
+            if transaction_type == 'income' and int(year) == rollup._current_year:
+                rollup.year_income += amount
+
+        for year, month, transaction_type, contributor, amount in contributor_rows:
+            key = bucket_key(year, month)
+            amount = amount or 0
+            _add(rollup.monthly_totals.setdefault(key, _new_month())['contributors'],
+                 contributor, amount)
+            if transaction_type == 'expense':
+                totals = rollup.expense_monthly_totals.setdefault(key, _new_month(with_accounts=True))
+                _add(totals['contributors'], contributor, amount)
+
+        for year, month, transaction_type, amount in share_rows:
+            if int(year) != rollup._current_year:
+                continue
+            amount = amount or 0
+            is_expense = transaction_type == 'expense'
+            rollup.year_total += amount
+            if is_expense:
+                rollup.year_expense_total += amount
+            if bucket_key(year, month) == rollup._current_month:
+                rollup.month_total += amount
+                if is_expense:
+                    rollup.month_expense_total += amount
+
+        return rollup
+
+    def add(self, expense):
+        """Fold a single expense into every rollup"""
+        splits = self.splits.get(expense.id)
+        if splits is None:
+            splits = expense.calculate_splits()
+            self.splits[expense.id] = splits
+
+        key = month_key(expense.date)
+        transaction_type = expense.transaction_type
+        is_expense = transaction_type == 'expense'
+        paid_by_user = expense.paid_by == self.user_id
+
+        # Monthly totals over every transaction type
+        month = self.monthly_totals.get(key)
+        if month is None:
+            month = self.monthly_totals[key] = _new_month()
+        month['total'] += expense.amount
+        _add(month['by_card'], expense.card_used, expense.amount)
+        _add_contributors(month['contributors'], splits)
+
+        # Monthly totals over expense-type rows only
+        month = self.expense_monthly_totals.get(key)
+        if month is None:
+            month = self.expense_monthly_totals[key] = _new_month(with_accounts=True)
+        if is_expense:
+            month['total'] += expense.amount
+            _add(month['by_card'], expense.card_used, expense.amount)
+            if expense.account:
+                _add(month['by_account'], expense.account.name, expense.amount)
+            _add_contributors(month['contributors'], splits)
+
+        _add(self.type_totals, transaction_type, expense.amount)
+        if transaction_type == 'income' and expense.date.year == self._current_year:
+            self.year_income += expense.amount
+
+        if paid_by_user:
+            self.unique_cards.add(expense.card_used)
+
+        # The user's own portion, and their share of the whole expense
+        if paid_by_user:
+            portion = splits['payer']['amount']
+            share = portion + sum(split['amount'] for split in splits['splits'])
+        else:
+            portion = next((split['amount'] for split in splits['splits']
+                            if split['email'] == self.user_id), 0)
+            share = portion
+
+        self.user_portions[expense.id] = portion
+        if portion > 0:
+            _add(self.portion_by_month.setdefault(key, {}), transaction_type, portion)
+
+        if expense.date.year == self._current_year:
+            self.year_total += share
+            if is_expense:
+                self.year_expense_total += share
+            if key == self._current_month:
+                self.month_total += share
+                if is_expense:
+                    self.month_expense_total += share
+
+    def type_total(self, transaction_type):
+        """Sum of full amounts for one transaction type"""
+        return self.type_totals.get(transaction_type, 0)
+
+    def cash_flow(self):
+        """Net cash flow (this year's income less the user's year-to-date expenses) and the savings rate as a percentage of that income"""
+        net_cash_flow = self.year_income - self.year_expense_total
+        savings_rate = (net_cash_flow / self.year_income) * 100 if self.year_income > 0 else 0
+        return net_cash_flow, savings_rate
+
+    @property
+    def portion_total(self):
+        """Sum of the user's portions across every expense"""
+        return sum(self.user_portions.values())
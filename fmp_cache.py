@@ -1,144 +1,610 @@
 import os
 import json
 import time
+import hashlib
+import re
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import requests
 
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; stats updates are then unlocked
+    fcntl = None
+
+STATS_NAMES = ('hits', 'memory_hits', 'misses', 'api_calls')
+
+# Keys written by FMPCache._get_cache_key: readable endpoint prefix, then a digest
+CACHE_KEY_PATTERN = re.compile(r'^(?P<endpoint>.*)_[0-9a-f]{32}$')
+
+
+def _write_json(directory, path, payload):
+    """Write JSON to a temp file in directory and rename it over path"""
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.part')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(payload, f)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class JSONFileStore:
+    """
+    One JSON file per response in the cache directory
+
+    Expiry and listings have to open every file to read its timestamp.
+    """
+
+    STATS_FILE = '.stats'
+
+    def __init__(self, cache_dir, expire_seconds):
+        self.cache_dir = cache_dir
+        self.expire_seconds = expire_seconds
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _files(self):
+        for filename in os.listdir(self.cache_dir):
+            cache_file = os.path.join(self.cache_dir, filename)
+            if os.path.isfile(cache_file) and cache_file.endswith('.json'):
+                yield cache_file
+
+    def _read_file(self, cache_file):
+        """Return the cached payload dict in a file, or None if missing or unreadable"""
+        try:
+            with open(cache_file, 'r') as f:
+                cache_data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(cache_data, dict) or 'timestamp' not in cache_data or 'data' not in cache_data:
+            return None
+        return cache_data
+
+    def _is_fresh(self, cache_data, now):
+        # Files written before entries carried their own expiry use the store default
+        expires_at = cache_data.get('expires_at', cache_data['timestamp'] + self.expire_seconds)
+        return now < expires_at
+
+    def read(self, key, now):
+        """Return (fetched_at, expires_at, data) for an unexpired entry, or None"""
+        cache_data = self._read_file(self._path(key))
+        if cache_data is None or not self._is_fresh(cache_data, now):
+            return None
+        expires_at = cache_data.get('expires_at', cache_data['timestamp'] + self.expire_seconds)
+        return cache_data['timestamp'], expires_at, cache_data['data']
+
+    def write(self, key, endpoint, fetched_at, data, expire_seconds=None):
+        self.write_many([(key, endpoint, fetched_at, data)], expire_seconds)
+
+    def write_many(self, entries, expire_seconds=None):
+        """Store (key, endpoint, fetched_at, data) tuples, expiring after expire_seconds"""
+        if expire_seconds is None:
+            expire_seconds = self.expire_seconds
+        for key, endpoint, fetched_at, data in entries:
+            _write_json(self.cache_dir, self._path(key), {
+                'timestamp': fetched_at,
+                'expires_at': fetched_at + expire_seconds,
+                'endpoint': endpoint,
+                'data': data
+            })
+
+    def delete_expired(self, now):
+        count = 0
+        for cache_file in self._files():
+            cache_data = self._read_file(cache_file)
+            # Invalid cache files are removed too
+            if cache_data is None or not self._is_fresh(cache_data, now):
+                try:
+                    os.remove(cache_file)
+                    count += 1
+                except FileNotFoundError:
+                    pass
+        return count
+
+    def delete_all(self):
+        count = 0
+        for cache_file in self._files():
+            try:
+                os.remove(cache_file)
+                count += 1
+            except FileNotFoundError:
+                pass
+        return count
+
+    def entries(self, now, limit=None):
+        """Return the newest entries as dicts of key, endpoint, size_bytes, fetched_at, expired"""
+        entries = []
+        for cache_file in self._files():
+            cache_data = self._read_file(cache_file)
+            key = os.path.basename(cache_file)[:-len('.json')]
+            fetched_at = cache_data['timestamp'] if cache_data else os.path.getmtime(cache_file)
+            entries.append({
+                'key': key,
+                'endpoint': (cache_data or {}).get('endpoint'),
+                'size_bytes': os.path.getsize(cache_file),
+                'fetched_at': fetched_at,
+                'expired': cache_data is None or not self._is_fresh(cache_data, now)
+            })
+        entries.sort(key=lambda entry: entry['fetched_at'], reverse=True)
+        return entries[:limit] if limit else entries
+
+    def summary(self, now):
+        entries = self.entries(now)
+        return {
+            'entries': len(entries),
+            'expired_entries': sum(1 for entry in entries if entry['expired']),
+            'size_bytes': sum(entry['size_bytes'] for entry in entries)
+        }
+
+    def add_stats(self, counts):
+        """Add hit/miss counts to the stats file shared by all workers"""
+        stats_path = os.path.join(self.cache_dir, self.STATS_FILE)
+        with open(f"{stats_path}.lock", 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            totals = self.read_stats()
+            for name, value in counts.items():
+                totals[name] = totals.get(name, 0) + value
+            _write_json(self.cache_dir, stats_path, totals)
+
+    def read_stats(self):
+        try:
+            with open(os.path.join(self.cache_dir, self.STATS_FILE), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+
+class SQLiteStore:
+    """
+    All responses in one indexed SQLite file
+
+    Expiry is a single DELETE on the expires_at index and the cache page
+    summary a single aggregate query. Each thread (and forked worker) opens
+    its own connection; WAL mode lets workers read while another writes.
+    """
+
+    def __init__(self, path, expire_seconds):
+        self.path = path
+        self.expire_seconds = expire_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+
+        connection = self._connect()
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS fmp_cache (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                payload TEXT NOT NULL
+            )
+        ''')
+        connection.execute('CREATE INDEX IF NOT EXISTS idx_fmp_cache_expires_at ON fmp_cache (expires_at)')
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS fmp_cache_stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        ''')
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        # A connection inherited across fork() must not be reused
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def read(self, key, now):
+        """Return (fetched_at, expires_at, data) for an unexpired entry, or None"""
+        row = self._connect().execute(
+            'SELECT fetched_at, expires_at, payload FROM fmp_cache WHERE key = ? AND expires_at > ?',
+            (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def write(self, key, endpoint, fetched_at, data, expire_seconds=None):
+        self.write_many([(key, endpoint, fetched_at, data)], expire_seconds)
+
+    def write_many(self, entries, expire_seconds=None):
+        """Store (key, endpoint, fetched_at, data) tuples in one transaction, expiring after expire_seconds"""
+        if expire_seconds is None:
+            expire_seconds = self.expire_seconds
+        self.write_rows([(key, endpoint, fetched_at, fetched_at + expire_seconds, data)
+                         for key, endpoint, fetched_at, data in entries])
+
+    def write_rows(self, rows):
+        """Store (key, endpoint, fetched_at, expires_at, data) rows in one transaction"""
+        with self._transaction() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO fmp_cache (key, endpoint, fetched_at, expires_at, payload) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(key, endpoint, fetched_at, expires_at, json.dumps(data))
+                 for key, endpoint, fetched_at, expires_at, data in rows]
+            )
+
+    def delete_expired(self, now):
+        return self._connect().execute('DELETE FROM fmp_cache WHERE expires_at <= ?', (now,)).rowcount
+
+    def delete_all(self):
+        return self._connect().execute('DELETE FROM fmp_cache').rowcount
+
+    def entries(self, now, limit=None):
+        rows = self._connect().execute(
+            'SELECT key, endpoint, length(payload), fetched_at, expires_at <= ? '
+            'FROM fmp_cache ORDER BY fetched_at DESC LIMIT ?',
+            (now, limit if limit else -1)
+        ).fetchall()
+        return [{
+            'key': key,
+            'endpoint': endpoint,
+            'size_bytes': size_bytes,
+            'fetched_at': fetched_at,
+            'expired': bool(expired)
+        } for key, endpoint, size_bytes, fetched_at, expired in rows]
+
+    def summary(self, now):
+        entries, expired_entries, size_bytes = self._connect().execute(
+            'SELECT count(*), coalesce(sum(expires_at <= ?), 0), coalesce(sum(length(payload)), 0) FROM fmp_cache',
+            (now,)
+        ).fetchone()
+        return {
+            'entries': entries,
+            'expired_entries': expired_entries,
+            'size_bytes': size_bytes
+        }
+
+    def add_stats(self, counts):
+        with self._transaction() as connection:
+            connection.executemany(
+                'INSERT INTO fmp_cache_stats (name, value) VALUES (?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value',
+                list(counts.items())
+            )
+
+    def read_stats(self):
+        return dict(self._connect().execute('SELECT name, value FROM fmp_cache_stats').fetchall())
+
+
 class FMPCache:
     """
     Cache for Financial Modeling Prep API responses
     Reduces unnecessary API calls by storing responses locally
+
+    Responses are kept in two tiers: a per-process LRU in memory, in front of
+    a store on disk that every worker process shares - one JSON file per
+    response ('files'), or a single SQLite file ('sqlite'). Cache keys are
+    SHA-256 digests of the endpoint and params, so they are the same in every
+    process and survive restarts.
     """
-    
-    def __init__(self, cache_dir='instance/cache/fmp', expire_hours=24):
+
+    BACKENDS = ('files', 'sqlite')
+    SQLITE_FILENAME = 'fmp_cache.sqlite3'
+    STATS_FLUSH_SECONDS = 5
+
+    def __init__(self, cache_dir='instance/cache/fmp', expire_hours=24, memory_entries=512, backend='files'):
         """
         Initialize the cache
-        
+
         Args:
             cache_dir: Directory to store cache files
             expire_hours: Hours before cache expires (default: 24 hours)
+            memory_entries: Most responses kept in memory per process (0 disables the memory tier)
+            backend: 'files' for one JSON file per response, 'sqlite' for a single SQLite file
         """
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown FMP cache backend {backend!r}, expected one of {', '.join(self.BACKENDS)}")
+
         self.cache_dir = cache_dir
         self.expire_seconds = expire_hours * 3600
-        
-        # Create cache directory if it doesn't exist
-        if not os.path.exists(self.cache_dir):
-            os.makedirs(self.cache_dir)
-            
-        # Stats for monitoring
-        self.stats = {
-            'hits': 0,
-            'misses': 0,
-            'api_calls': 0
-        }
-    
-    def _get_cache_filename(self, endpoint, params):
-        """Generate a unique filename for the request"""
-        # Sort params to ensure consistent filename for same requests with different param order
+        self.memory_entries = memory_entries
+        self.backend = backend
+
+        if backend == 'sqlite':
+            self.store = SQLiteStore(os.path.join(cache_dir, self.SQLITE_FILENAME), self.expire_seconds)
+        else:
+            self.store = JSONFileStore(cache_dir, self.expire_seconds)
+
+        # cache key -> (timestamp, expires_at, data), least recently used first
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Stats for monitoring; counts not yet added to the shared store
+        self.stats = dict.fromkeys(STATS_NAMES, 0)
+        self._pending_stats = dict.fromkeys(STATS_NAMES, 0)
+        self._stats_flushed_at = time.monotonic()
+
+    def _get_cache_key(self, endpoint, params):
+        """Generate a stable key for the request, the same in every process"""
+        # Sort params to ensure the same key for the same request with different param order
         params_str = json.dumps(params, sort_keys=True)
-        # Create a hash from the endpoint and params
-        cache_key = f"{endpoint}_{hash(params_str)}"
-        return os.path.join(self.cache_dir, f"{cache_key.replace('/', '_')}.json")
-    
-    def get(self, api_url, endpoint, api_key, params=None):
+        digest = hashlib.sha256(f"{endpoint}?{params_str}".encode('utf-8')).hexdigest()
+        # Keep the endpoint readable in the cache management page
+        prefix = re.sub(r'[^A-Za-z0-9._-]', '_', endpoint)[:64]
+        return f"{prefix}_{digest[:32]}"
+
+    def _memory_get(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if time.time() >= entry[1]:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return entry
+
+    def _memory_put(self, key, timestamp, expires_at, data):
+        if self.memory_entries <= 0:
+            return
+        with self._lock:
+            self._memory[key] = (timestamp, expires_at, data)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _count(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                self.stats[name] += value
+                self._pending_stats[name] += value
+            due = time.monotonic() - self._stats_flushed_at >= self.STATS_FLUSH_SECONDS
+        if due:
+            self._flush_stats()
+
+    def _flush_stats(self):
+        """Add this process's pending counts to the stats shared by all workers"""
+        with self._lock:
+            pending, self._pending_stats = self._pending_stats, dict.fromkeys(STATS_NAMES, 0)
+            self._stats_flushed_at = time.monotonic()
+        if not any(pending.values()):
+            return
+
+        try:
+            self.store.add_stats(pending)
+        except (OSError, sqlite3.Error):
+            # Put the counts back for the next flush
+            with self._lock:
+                for name, value in pending.items():
+                    self._pending_stats[name] += value
+
+    def _lookup(self, key):
+        """Return cached data from memory or the shared store, counting the hit; None on a miss"""
+        # Memory tier
+        entry = self._memory_get(key)
+        if entry is not None:
+            self._count(hits=1, memory_hits=1)
+            return entry[2]
+
+        # Store shared with the other workers
+        entry = self.store.read(key, time.time())
+        if entry is not None:
+            self._memory_put(key, *entry)
+            self._count(hits=1)
+            return entry[2]
+
+        return None
+
+    def _fetch(self, api_url, endpoint, api_key, params):
+        """Request an endpoint from the API and return the parsed response"""
+        # Add API key to params
+        request_params = params.copy()
+        request_params['apikey'] = api_key
+
+        full_url = f"{api_url}/{endpoint}"
+        response = requests.get(full_url, params=request_params)
+
+        if response.status_code != 200:
+            raise Exception(f"API request failed with status code {response.status_code}: {response.text}")
+
+        # Parse response data
+        return response.json()
+
+    def _save(self, entries, expire_seconds=None):
+        """Save (key, endpoint, data) entries to the store and the memory tier"""
+        if expire_seconds is None:
+            expire_seconds = self.expire_seconds
+        timestamp = time.time()
+        self.store.write_many([(key, endpoint, timestamp, data) for key, endpoint, data in entries], expire_seconds)
+        for key, _, data in entries:
+            self._memory_put(key, timestamp, timestamp + expire_seconds, data)
+
+    def get(self, api_url, endpoint, api_key, params=None, expire_seconds=None):
         """
         Get data from cache or API
-        
+
         Args:
             api_url: Base API URL
             endpoint: API endpoint
             api_key: API key
             params: Additional parameters for the request (excluding API key)
-            
+            expire_seconds: How long to keep a fresh response (default: the cache expiry)
+
         Returns:
             API response data
         """
         if params is None:
             params = {}
-            
-        # Add API key to params
-        request_params = params.copy()
-        request_params['apikey'] = api_key
-        
-        # Check if response is in cache
-        cache_file = self._get_cache_filename(endpoint, params)
-        
-        if os.path.exists(cache_file):
-            # Read cache file
-            with open(cache_file, 'r') as f:
-                cache_data = json.load(f)
-            
-            # Check if cache is still valid
-            if time.time() - cache_data['timestamp'] < self.expire_seconds:
-                self.stats['hits'] += 1
-                return cache_data['data']
-        
+
+        key = self._get_cache_key(endpoint, params)
+        data = self._lookup(key)
+        if data is not None:
+            return data
+
         # Cache miss or expired, make API request
-        self.stats['misses'] += 1
-        self.stats['api_calls'] += 1
-        
-        full_url = f"{api_url}/{endpoint}"
-        response = requests.get(full_url, params=request_params)
-        
-        if response.status_code != 200:
-            raise Exception(f"API request failed with status code {response.status_code}: {response.text}")
-        
-        # Parse response data
-        data = response.json()
-        
+        self._count(misses=1, api_calls=1)
+        data = self._fetch(api_url, endpoint, api_key, params)
+
         # Save to cache
-        cache_data = {
-            'timestamp': time.time(),
-            'data': data
-        }
-        
-        with open(cache_file, 'w') as f:
-            json.dump(cache_data, f)
-        
+        self._save([(key, endpoint, data)], expire_seconds)
+
         return data
-    
+
+    def get_batch(self, api_url, endpoint, symbols, api_key, chunk_size=100, expire_seconds=None):
+        """
+        Get per-symbol data for many symbols from an endpoint that takes a
+        comma-separated symbol list (e.g. quote/AAPL,MSFT)
+
+        Each symbol is cached under the same key as a single-symbol request
+        (endpoint/SYMBOL), so get() and get_batch() share entries. Only the
+        symbols missing from the cache are requested, chunk_size at a time.
+
+        Args:
+            api_url: Base API URL
+            endpoint: API endpoint without the symbol, e.g. 'quote'
+            symbols: Symbols to look up
+            api_key: API key
+            chunk_size: Most symbols per API request
+            expire_seconds: How long to keep fresh responses (default: the cache expiry)
+
+        Returns:
+            Dict of symbol -> the API's list response for that symbol. Symbols
+            the API doesn't return are left out.
+        """
+        results = {}
+        missing = []
+        for symbol in dict.fromkeys(symbols):
+            data = self._lookup(self._get_cache_key(f"{endpoint}/{symbol}", {}))
+            if data is not None:
+                results[symbol] = data
+            else:
+                missing.append(symbol)
+
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            self._count(misses=len(chunk), api_calls=1)
+            data = self._fetch(api_url, f"{endpoint}/{','.join(chunk)}", api_key, {})
+
+            # Fan the combined response back out into per-symbol entries
+            by_symbol = {}
+            for item in data or []:
+                if isinstance(item, dict) and item.get('symbol') in chunk:
+                    by_symbol.setdefault(item['symbol'], []).append(item)
+
+            self._save([(self._get_cache_key(f"{endpoint}/{symbol}", {}), f"{endpoint}/{symbol}", items)
+                        for symbol, items in by_symbol.items()], expire_seconds)
+            results.update(by_symbol)
+
+        return results
+
     def clear_expired(self):
-        """Clear expired cache files"""
-        count = 0
-        for filename in os.listdir(self.cache_dir):
-            cache_file = os.path.join(self.cache_dir, filename)
-            
-            if os.path.isfile(cache_file) and cache_file.endswith('.json'):
-                try:
-                    with open(cache_file, 'r') as f:
-                        cache_data = json.load(f)
-                    
-                    if time.time() - cache_data['timestamp'] >= self.expire_seconds:
-                        os.remove(cache_file)
-                        count += 1
-                except (json.JSONDecodeError, KeyError):
-                    # Invalid cache file, remove it
-                    os.remove(cache_file)
-                    count += 1
-        
+        """Clear expired cache entries"""
+        now = time.time()
+        count = self.store.delete_expired(now)
+
+        with self._lock:
+            for key in [key for key, (_, expires_at, _) in self._memory.items() if now >= expires_at]:
+                del self._memory[key]
+
         return count
-    
+
     def clear_all(self):
-        """Clear all cache files"""
-        count = 0
-        for filename in os.listdir(self.cache_dir):
-            cache_file = os.path.join(self.cache_dir, filename)
-            
-            if os.path.isfile(cache_file) and cache_file.endswith('.json'):
-                os.remove(cache_file)
-                count += 1
-        
+        """Clear all cache entries"""
+        count = self.store.delete_all()
+
+        # Other workers keep their memory tier until the entries expire
+        with self._lock:
+            self._memory.clear()
+
         return count
-    
+
+    def list_entries(self, limit=None):
+        """Return the newest cache entries, for the cache management page"""
+        return self.store.entries(time.time(), limit)
+
+    def summary(self):
+        """Return the number of stored entries, how many have expired and their total size"""
+        return self.store.summary(time.time())
+
+    def migrate_json_files(self):
+        """
+        Move entries from the JSON file store into the SQLite store
+
+        Unexpired entries are copied over; every JSON file is then removed,
+        including expired ones and files from before keys were stable, which
+        nothing could look up any more.
+
+        Returns:
+            (migrated, removed) counts
+        """
+        if self.backend != 'sqlite':
+            raise ValueError('JSON files can only be migrated into the sqlite backend')
+
+        file_store = JSONFileStore(self.cache_dir, self.expire_seconds)
+        now = time.time()
+        entries = []
+        cache_files = list(file_store._files())
+        for cache_file in cache_files:
+            key = os.path.basename(cache_file)[:-len('.json')]
+            match = CACHE_KEY_PATTERN.match(key)
+            cache_data = file_store._read_file(cache_file)
+            if match and cache_data and file_store._is_fresh(cache_data, now):
+                endpoint = cache_data.get('endpoint') or match.group('endpoint')
+                expires_at = cache_data.get('expires_at', cache_data['timestamp'] + self.expire_seconds)
+                entries.append((key, endpoint, cache_data['timestamp'], expires_at, cache_data['data']))
+
+        # Entries keep their own expiry times
+        self.store.write_rows(entries)
+        removed = file_store.delete_all()
+        return len(entries), removed
+
     def get_stats(self):
-        """Get cache stats"""
-        total_requests = self.stats['hits'] + self.stats['misses']
-        hit_rate = (self.stats['hits'] / total_requests * 100) if total_requests > 0 else 0
-        
+        """Get cache stats, summed across every worker process sharing the cache"""
+        self._flush_stats()
+        try:
+            totals = self.store.read_stats()
+        except (OSError, sqlite3.Error):
+            totals = {}
+
+        # Fall back to this process's counts if the shared stats can't be read
+        if not totals:
+            with self._lock:
+                totals = dict(self.stats)
+
+        hits = totals.get('hits', 0)
+        misses = totals.get('misses', 0)
+        total_requests = hits + misses
+        hit_rate = (hits / total_requests * 100) if total_requests > 0 else 0
+
+        with self._lock:
+            memory_entries = len(self._memory)
+
         return {
-            'hits': self.stats['hits'],
-            'misses': self.stats['misses'],
-            'api_calls': self.stats['api_calls'],
+            'hits': hits,
+            'memory_hits': totals.get('memory_hits', 0),
+            'misses': misses,
+            'api_calls': totals.get('api_calls', 0),
             'hit_rate': f"{hit_rate:.2f}%",
-            'api_calls_saved': self.stats['hits']
-        }
\ No newline at end of file
+            'api_calls_saved': hits,
+            'memory_entries': memory_entries
+        }
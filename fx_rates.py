@@ -0,0 +1,253 @@
+r"""29a41de6a866d56c36aba5159f45257c"""
+"""
+In-process exchange-rate tables.
+
+convert_currency() used to query the Currency table three times per call,
+and trend calculations call it per account, per transaction and per month.
+RateSnapshot holds every currency's current rate_to_base plus the base
+currency code; RateHistory holds the dated rates from the currency_rates
+table so amounts can be converted at the rate in effect on their date.
+RateTable caches either, reloading when its version counter is bumped by a
+write to the currencies, or when the TTL runs out (other worker processes
+only see their own bumps).
+
+Frankfurter-format files (https://www.frankfurter.app) can be parsed for
+backfilling history with parse_frankfurter_json() and parse_rates_csv().
+"""
+import csv
+import threading
+import time
+from bisect import bisect_right
+from datetime import date, datetime
+
+
+def as_date(value):
+    """Return value as a date; accepts dates, datetimes and ISO strings"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+class RateSnapshot:
+    """Rates as of one load: code -> rate_to_base, plus the base code"""
+
+    def __init__(self, rates, base_code=None):
+        self.rates = dict(rates)
+        self.base_code = base_code
+
+    def factors(self, from_code, to_code):
+        """Return (multiplier, divisor) turning from_code amounts into to_code"""
+        if from_code == to_code or self.base_code is None:
+            return None
+        if from_code not in self.rates or to_code not in self.rates:
+            return None
+        multiplier = 1 if from_code == self.base_code else self.rates[from_code]
+        divisor = 1 if to_code == self.base_code else self.rates[to_code]
+        return multiplier, divisor
+
+    def convert(self, amount, from_code, to_code):
+        """Convert one amount; unknown currencies leave it unchanged"""
+        factors = self.factors(from_code, to_code)
+        if factors is None:
+            return amount
+        # Through the base currency, in the same order as the old per-row conversion
+        return amount * factors[0] / factors[1]
+
+    def convert_many(self, amounts, from_codes, to_code):
+        """
+        Convert a list of amounts into to_code. from_codes is either one code
+        for every amount or a list parallel to amounts. Factors are worked
+        out once per distinct source currency.
+        """
+        amounts = list(amounts)
+        if isinstance(from_codes, str) or from_codes is None:
+            factors = self.factors(from_codes, to_code)
+            if factors is None:
+                return amounts
+            multiplier, divisor = factors
+            return [amount * multiplier / divisor for amount in amounts]
+
+        factors_by_code = {}
+        converted = []
+        for amount, from_code in zip(amounts, from_codes):
+            if from_code not in factors_by_code:
+                factors_by_code[from_code] = self.factors(from_code, to_code)
+            factors = factors_by_code[from_code]
+            converted.append(amount if factors is None else amount * factors[0] / factors[1])
+        return converted
+
+
+class RateHistory:
+    """Dated rates per currency, each series sorted by date for bisect lookups"""
+
+    def __init__(self, rows):
+        """rows: iterable of (code, date, rate_to_base), in any order"""
+        series = {}
+        for code, day, rate in rows:
+            series.setdefault(code, []).append((as_date(day), rate))
+
+        self._dates = {}
+        self._rates = {}
+        for code, points in series.items():
+            points.sort()
+            self._dates[code] = [day for day, _ in points]
+            self._rates[code] = [rate for _, rate in points]
+
+    def __len__(self):
+        return sum(len(dates) for dates in self._dates.values())
+
+    def rate_on(self, code, day):
+        """
+        Return the rate in effect on day: the latest one on or before it, or the
+        earliest known rate for days before the history starts. None without history.
+        """
+        dates = self._dates.get(code)
+        if not dates:
+            return None
+        index = bisect_right(dates, as_date(day)) - 1
+        return self._rates[code][max(index, 0)]
+
+    def _rate(self, code, day, current):
+        if code == current.base_code:
+            return 1
+        rate = self.rate_on(code, day)
+        return current.rates[code] if rate is None else rate
+
+    def convert(self, amount, from_code, to_code, day, current):
+        """
+        Convert one amount at the rates in effect on day. current is the
+        RateSnapshot used for currencies without history; amounts in unknown
+        currencies are returned unchanged, as with RateSnapshot.convert().
+        """
+        if current.factors(from_code, to_code) is None:
+            return amount
+        return amount * self._rate(from_code, day, current) / self._rate(to_code, day, current)
+
+    def convert_many(self, amounts, from_codes, to_code, days, current):
+        """
+        Convert a list of amounts to to_code, each at the rate on its own day.
+        from_codes is one code for every amount or a list parallel to amounts.
+        """
+        amounts = list(amounts)
+        if isinstance(from_codes, str) or from_codes is None:
+            from_codes = [from_codes] * len(amounts)
+
+        rates = {}
+
+        def rate(code, day):
+            key = (code, day)
+            if key not in rates:
+                rates[key] = self._rate(code, day, current)
+            return rates[key]
+
+        converted = []
+        for amount, from_code, day in zip(amounts, from_codes, days):
+            if current.factors(from_code, to_code) is None:
+                converted.append(amount)
+            else:
+                day = as_date(day)
+                converted.append(amount * rate(from_code, day) / rate(to_code, day))
+        return converted
+
+
+def rates_to_base(base_code, quotes, target_base):
+    """
+    Turn one day's Frankfurter quotes (units of each currency per 1 base_code)
+    into rate_to_base values against target_base. Returns None when the day
+    can't be expressed in target_base.
+    """
+    quotes = dict(quotes)
+    quotes[base_code] = 1.0
+    target_quote = quotes.get(target_base)
+    if not target_quote:
+        return None
+    return {code: target_quote / quote for code, quote in quotes.items() if quote}
+
+
+def parse_frankfurter_json(data):
+    """
+    Yield (date, base, quotes) from a Frankfurter response: either a single
+    day ({"base", "date", "rates": {code: quote}}) or a time series
+    ({"base", "rates": {date: {code: quote}}})
+    """
+    base_code = data['base']
+    rates = data.get('rates', {})
+    if 'date' in data:
+        yield as_date(data['date']), base_code, rates
+        return
+    for day, quotes in rates.items():
+        yield as_date(day), base_code, quotes
+
+
+def parse_rates_csv(lines, base_code=None):
+    """
+    Yield (date, base, quotes) from a CSV of Frankfurter quotes. Either one row
+    per day with a column per currency (date,USD,GBP,...), or one row per rate
+    (date,base,currency,rate). A 'base' column overrides base_code.
+    """
+    known_columns = ('date', 'base', 'currency', 'rate')
+
+    def column(name):
+        # Known columns are matched case-insensitively, currency columns are upper-cased codes
+        name = name.strip()
+        return name.lower() if name.lower() in known_columns else name.upper()
+
+    reader = csv.DictReader(lines)
+    fields = [column(field) for field in reader.fieldnames or []]
+    long_format = 'currency' in fields and 'rate' in fields
+
+    days = {}
+    for row in reader:
+        row = {column(key): (value or '').strip() for key, value in row.items() if key}
+        row_base = (row.get('base') or base_code or '').upper()
+        if not row.get('date') or not row_base:
+            raise ValueError('Each row needs a date and a base currency')
+        quotes = days.setdefault((as_date(row['date']), row_base), {})
+        if long_format:
+            if row.get('rate'):
+                quotes[row['currency'].upper()] = float(row['rate'])
+        else:
+            for code, value in row.items():
+                if code not in ('date', 'base') and value:
+                    quotes[code] = float(value)
+
+    for (day, row_base), quotes in days.items():
+        yield day, row_base, quotes
+
+
+class RateTable:
+    """Process-wide cache of a rate object, reloaded when the version changes or the TTL expires"""
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.version = 0
+        self._cached = None
+        self._cached_version = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def bump(self):
+        """Mark the loaded rates stale after currencies change"""
+        with self._lock:
+            self.version += 1
+
+    def get(self, loader):
+        """Return the cached object, building it with loader() when stale"""
+        with self._lock:
+            cached = self._cached
+            version = self.version
+            fresh = (cached is not None and self._cached_version == version
+                     and time.monotonic() - self._loaded_at < self.ttl)
+        if fresh:
+            return cached
+
+        loaded = loader()
+        with self._lock:
+            # Keep it only if no write landed while loading
+            if self.version == version:
+                self._cached = loaded
+                self._cached_version = version
+                self._loaded_at = time.monotonic()
+        return loaded
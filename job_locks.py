@@ -0,0 +1,78 @@
+r"""29a41de6a866d56c36aba5159f45257c"""
+"""
+Single execution of scheduled jobs across gunicorn workers and hosts.
+
+Every web process starts its own APScheduler, so without coordination each
+cron job fires once per worker. Before running, a job claims its current run:
+the run is keyed by the job id and the period it belongs to (the month for the
+monthly reports, the day for the nightly sync, a fixed window for interval
+jobs). The first process to claim a run executes it and the rest skip it.
+
+Claims are rows in the scheduled_job_runs table, whose unique key settles the
+race on a shared database server. SQLite deployments live on a single host,
+so there FileRunLock settles it with lock files instead of concurrent writes.
+"""
+import os
+import re
+import socket
+import calendar
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; claims are then unlocked
+    fcntl = None
+
+
+def run_key(period, now=None):
+    """
+    Key of the run that now falls in. period is 'monthly', 'daily', 'hourly'
+    or a number of seconds for interval jobs (windows counted from the epoch)
+    """
+    now = now or datetime.utcnow()
+    if period == 'monthly':
+        return now.strftime('%Y-%m')
+    if period == 'daily':
+        return now.strftime('%Y-%m-%d')
+    if period == 'hourly':
+        return now.strftime('%Y-%m-%dT%H')
+
+    seconds = int(period)
+    timestamp = calendar.timegm(now.utctimetuple())
+    return str(timestamp // seconds * seconds)
+
+
+def holder_id():
+    """Identify this process in claims: host and pid"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class FileRunLock:
+    """Claims runs through one lock file per job, holding the last claimed run key"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, re.sub(r'[^A-Za-z0-9_-]', '_', job_id) + '.lock')
+
+    def claim(self, job_id, key):
+        """Return True if this process claimed the run, False if another one already has"""
+        with open(self._path(job_id), 'a+') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                lock_file.seek(0)
+                if lock_file.readline().strip() == key:
+                    return False
+
+                lock_file.seek(0)
+                lock_file.truncate()
+                lock_file.write(f"{key}\n{holder_id()}\n")
+                lock_file.flush()
+                os.fsync(lock_file.fileno())
+                return True
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,77 @@
+r"""29a41de6a866d56c36aba5159f45257c"""
+"""
+Sending many emails over one SMTP connection.
+
+mail.send() opens, authenticates and closes a connection for every message,
+which dominates the time of a run of monthly reports. BatchMailer keeps one
+mail.connect() connection open, starts a fresh one every batch_size messages
+(servers limit messages per connection) and retries temporary failures on a
+new connection.
+"""
+import time
+import smtplib
+
+
+def is_permanent_failure(error):
+    """Whether retrying a message that failed with error is pointless"""
+    if isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPAuthenticationError)):
+        return True
+    # 5xx replies are permanent, 4xx ones temporary
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+class BatchMailer:
+    """Sends messages through a persistent Flask-Mail connection; use as a context manager"""
+
+    def __init__(self, mail, batch_size=100, retries=3, backoff=1.0, logger=None):
+        self.mail = mail
+        self.batch_size = max(1, batch_size)
+        self.retries = max(1, retries)
+        self.backoff = backoff
+        self.logger = logger
+        self.connection = None
+        self.sent_on_connection = 0
+        self.connections_opened = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def _connect(self):
+        self.connection = self.mail.connect()
+        self.connection.__enter__()
+        self.sent_on_connection = 0
+        self.connections_opened += 1
+
+    def close(self):
+        """Quit the current connection, ignoring a server that already went away"""
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except (smtplib.SMTPException, OSError):
+                pass
+
+    def send(self, message):
+        """
+        Send one message, reconnecting and retrying on temporary failures.
+        Returns the number of attempts; raises the last error once out of retries
+        """
+        for attempt in range(1, self.retries + 1):
+            try:
+                if self.connection is None or self.sent_on_connection >= self.batch_size:
+                    self.close()
+                    self._connect()
+                self.connection.send(message)
+                self.sent_on_connection += 1
+                return attempt
+            except (smtplib.SMTPException, OSError) as e:
+                # The connection may be unusable now; start the next message on a new one
+                self.close()
+                if is_permanent_failure(e) or attempt == self.retries:
+                    raise
+                if self.logger:
+                    self.logger.warning(f"Retrying email to {', '.join(message.recipients)}: {str(e)}")
+                time.sleep(self.backoff * 2 ** (attempt - 1))
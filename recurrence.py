@@ -0,0 +1,70 @@
+r"""29a41de6a866d56c36aba5159f45257c"""
+"""
+Occurrence dates of recurring transactions.
+
+Occurrences are counted from the template's start date rather than from the
+previous instance, so a monthly template starting on the 31st falls on the
+last day of shorter months and goes back to the 31st afterwards. The start
+date itself is the first occurrence; create_scheduled_expenses() in app.py
+generates every occurrence after the last one created (from the start date
+on, when none has been), up to today, which catches up on runs the scheduler
+missed.
+"""
+import calendar
+from datetime import date, timedelta
+
+# Step between occurrences: ('days', n) or ('months', n)
+FREQUENCIES = {
+    'daily': ('days', 1),
+    'weekly': ('days', 7),
+    'biweekly': ('days', 14),
+    'monthly': ('months', 1),
+    'quarterly': ('months', 3),
+    'yearly': ('months', 12),
+}
+
+
+def add_months(start, months):
+    """start moved by a number of months, on the same day or the last day of a shorter month"""
+    month_index = start.month - 1 + months
+    year, month = start.year + month_index // 12, month_index % 12 + 1
+    return start.replace(year=year, month=month, day=min(start.day, calendar.monthrange(year, month)[1]))
+
+
+def occurrence(start, frequency, n):
+    """Date of the nth occurrence (the start date is the 0th); raises ValueError for an unknown frequency"""
+    if frequency not in FREQUENCIES:
+        raise ValueError(f"Unknown recurring frequency: {frequency}")
+    unit, step = FREQUENCIES[frequency]
+    if unit == 'days':
+        return start + timedelta(days=step * n)
+    return add_months(start, step * n)
+
+
+def due_dates(start, frequency, after, until, end=None):
+    """
+    Dates of the occurrences after the date after, up to and including until
+    (and end, if the template has an end date). All arguments are dates
+    """
+    if end is not None and end < until:
+        until = end
+    if until <= after:
+        return []
+
+    # Jump close to the first occurrence after after instead of stepping from the start
+    unit, step = FREQUENCIES.get(frequency, ('days', 1))
+    if unit == 'days':
+        n = (after - start).days // step
+    else:
+        n = ((after.year - start.year) * 12 + after.month - start.month) // step
+    n = max(0, n - 1)
+
+    dates = []
+    current = occurrence(start, frequency, n)
+    while current <= until:
+        if current > after:
+            dates.append(current)
+        n += 1
+        current = occurrence(start, frequency, n)
+    return dates
+
@@ -1,122 +1,176 @@
 from datetime import datetime, timedelta
-from collections import defaultdict
+import re
 import calendar
+
+import numpy as np
 from flask import current_app
-from sqlalchemy import and_, or_
+from sqlalchemy import text
+
+# Transactions whose amounts differ by up to this fraction belong to the same pattern
+AMOUNT_TOLERANCE = 0.1
+
+# Patterns are still active if the last transaction is within two intervals (plus this) of today
+ACTIVE_GRACE_DAYS = 7
+
+# Minimum interval consistency for a pattern to be reported
+MIN_CONSISTENCY = 0.7
+
+# Frequencies by average interval in days, checked in this order
+FREQUENCY_RANGES = (
+    ('monthly', 25, 35),
+    ('weekly', 6, 8),
+    ('biweekly', 13, 16),
+    ('quarterly', 85, 95),
+    ('yearly', 350, 380),
+    ('daily', float('-inf'), 3),
+)
+
+# Description words that say how a transaction was paid rather than who was paid
+NOISE_TOKENS = frozenset((
+    'pos', 'debit', 'credit', 'card', 'checkcard', 'purchase', 'payment', 'pmt', 'ach', 'recurring',
+    'autopay', 'online', 'web', 'www', 'com', 'inc', 'llc', 'ltd', 'co', 'the', 'visa', 'mastercard',
+    'dbt', 'txn', 'ref', 'id',
+))
 
-def detect_recurring_transactions(user_id, lookback_days=60, min_occurrences=2):
+WORD_PATTERN = re.compile(r'[a-z]+')
+
+
+def merchant_key(description, max_tokens=3):
     """
-    Detect potential recurring transactions for a user based on transaction history.
+    Normalized merchant name for grouping: the first few lowercase words of the
+    description, without numbers (reference numbers, dates, card digits) and
+    payment-method noise, so 'NETFLIX.COM 866-579 #1234' and 'Netflix.com 866-580'
+    fall in the same group
     """
-    # Get the current app and its database models
-    from flask import current_app
+    words = WORD_PATTERN.findall((description or '').lower())
+    tokens = [word for word in words if len(word) > 1 and word not in NOISE_TOKENS]
+    return ' '.join(tokens[:max_tokens]) or (description or '').strip().lower()
+
+
+def load_transactions(user_id, lookback_days=None):
+    """The user's transactions not created from a recurring template, oldest first; all history by default"""
     db = current_app.extensions['sqlalchemy'].db
-    # Expense = db.session.get_bind().execute("SELECT 1").dialect.name
     
     # Use raw SQL query to avoid SQLAlchemy model dependencies
-    from sqlalchemy import text
-    
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=lookback_days)
-    
-    # Execute a raw SQL query to get transactions
-    query = text("""
+    query = """
         SELECT id, description, amount, date, currency_code, account_id, category_id, transaction_type
         FROM expenses
         WHERE user_id = :user_id
-          AND date >= :start_date
-          AND date <= :end_date
           AND recurring_id IS NULL
-        ORDER BY date
-    """)
+    """
+    params = {'user_id': user_id}
+    if lookback_days:
+        query += " AND date >= :start_date"
+        params['start_date'] = datetime.now() - timedelta(days=lookback_days)
     
-    result = db.session.execute(
-        query, 
-        {'user_id': user_id, 'start_date': start_date, 'end_date': end_date}
-    )
+    result = db.session.execute(text(query + " ORDER BY date"), params)
+    return [{
+        'id': row.id,
+        'description': row.description,
+        'amount': row.amount,
+        'date': row.date if isinstance(row.date, datetime) else datetime.fromisoformat(str(row.date)),
+        'currency_code': row.currency_code,
+        'account_id': row.account_id,
+        'category_id': row.category_id,
+        'transaction_type': row.transaction_type
+    } for row in result]
+
+
+def detect_recurring_transactions(user_id, lookback_days=None, min_occurrences=2):
+    """
+    Detect potential recurring transactions for a user based on transaction history.
+    """
+    return find_recurring_candidates(load_transactions(user_id, lookback_days), min_occurrences=min_occurrences)
+
+
+def find_recurring_candidates(transactions, today=None, min_occurrences=2, amount_tolerance=AMOUNT_TOLERANCE):
+    """
+    Find recurring patterns in transaction dicts (see load_transactions).
     
-    # Convert result to a list of dictionaries for easier processing
-    transactions = []
-    for row in result:
-        transactions.append({
-            'id': row.id,
-            'description': row.description,
-            'amount': row.amount,
-            'date': row.date,
-            'currency_code': row.currency_code,
-            'account_id': row.account_id,
-            'category_id': row.category_id,
-            'transaction_type': row.transaction_type
-        })
+    Transactions are grouped by merchant_key() and type, and each group is split
+    into amount bands: sorted by amount, a new band starts where an amount is more
+    than amount_tolerance above the previous one. The interval statistics of every
+    band are computed at once over arrays sorted by band and date; same-day
+    repeats don't count as intervals. Bands with a known frequency, consistent
+    intervals and a recent last transaction are returned, most confident first
+    """
+    if not transactions:
+        return []
+    today = (today or datetime.now()).toordinal()
     
-    # Group transactions by name + amount (potential recurrence key)
-    transaction_groups = defaultdict(list)
+    # Repeated descriptions are normalized once
+    merchant_keys = {}
+    groups = {}
+    codes = []
+    for t in transactions:
+        description = t['description']
+        if description not in merchant_keys:
+            merchant_keys[description] = merchant_key(description)
+        codes.append(groups.setdefault((merchant_keys[description], t['transaction_type'] or 'expense'), len(groups)))
+    group_codes = np.array(codes, dtype=np.int64)
+    amounts = np.array([abs(t['amount'] or 0.0) for t in transactions], dtype=float)
+    days = np.array([t['date'].toordinal() for t in transactions], dtype=np.int64)
     
-    for transaction in transactions:
-        # Create a composite key of description and amount
-        key = f"{transaction['description'].strip().lower()}_{round(transaction['amount'], 2)}"
-        transaction_groups[key].append(transaction)
+    # Amount bands within each group
+    order = np.lexsort((amounts, group_codes))
+    sorted_amounts = amounts[order]
+    sorted_groups = group_codes[order]
+    band_starts = np.ones(len(order), dtype=bool)
+    band_starts[1:] = ((sorted_groups[1:] != sorted_groups[:-1])
+                       | (sorted_amounts[1:] - sorted_amounts[:-1] > sorted_amounts[:-1] * amount_tolerance + 0.005))
+    bands = np.empty(len(order), dtype=np.int64)
+    bands[order] = np.cumsum(band_starts) - 1
+    band_count = int(bands.max()) + 1
     
-    # Find recurring patterns
-    recurring_candidates = []
+    # Each band's transactions in date order, bands one after another
+    order = np.lexsort((days, bands))
+    sorted_bands = bands[order]
+    sorted_days = days[order]
+    counts = np.bincount(sorted_bands, minlength=band_count)
+    ends = np.cumsum(counts)
     
-    for key, group in transaction_groups.items():
-        # Only consider groups with multiple occurrences
-        if len(group) < min_occurrences:
-            continue
-        
-        # Sort transactions by date
-        sorted_transactions = sorted(group, key=lambda x: x['date'])
-        
-        # Analyze time intervals between transactions
-        intervals = []
-        for i in range(1, len(sorted_transactions)):
-            delta = (sorted_transactions[i]['date'] - sorted_transactions[i-1]['date']).days
-            intervals.append(delta)
-        
-        # Skip if no intervals (only one transaction)
-        if not intervals:
-            continue
-            
-        # Calculate average interval
-        avg_interval = sum(intervals) / len(intervals)
-        
-        # Determine frequency based on average interval
-        frequency = determine_frequency(avg_interval)
-        
-        # Skip if frequency couldn't be determined
-        if not frequency:
-            continue
-            
-        # Check consistency of intervals for higher confidence
-        interval_consistency = calculate_interval_consistency(intervals)
-        
-        # Last transaction date
-        last_transaction = sorted_transactions[-1]
-        
-        # Calculate next expected date
-        next_date = calculate_next_occurrence(last_transaction['date'], frequency)
+    # Interval statistics per band
+    intervals = np.diff(sorted_days)
+    valid = (sorted_bands[1:] == sorted_bands[:-1]) & (intervals > 0)
+    intervals = intervals[valid].astype(float)
+    interval_bands = sorted_bands[1:][valid]
+    interval_counts = np.bincount(interval_bands, minlength=band_count)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = np.bincount(interval_bands, weights=intervals, minlength=band_count) / interval_counts
+        deviations = (intervals - means[interval_bands]) ** 2
+        std_deviations = np.sqrt(np.bincount(interval_bands, weights=deviations, minlength=band_count) / interval_counts)
+    
+    consistency = interval_consistency(means, std_deviations, interval_counts)
+    frequency_codes = frequency_codes_for(means)
+    last_days = sorted_days[ends - 1]
+    keep = ((counts >= min_occurrences) & (interval_counts > 0) & (frequency_codes >= 0)
+            & (consistency >= MIN_CONSISTENCY) & (today - last_days <= 2 * means + ACTIVE_GRACE_DAYS))
+    
+    recurring_candidates = []
+    for band in np.flatnonzero(keep):
+        band_transactions = [transactions[i] for i in order[ends[band] - counts[band]:ends[band]]]
+        first_transaction = band_transactions[0]
+        last_transaction = band_transactions[-1]
+        frequency = FREQUENCY_RANGES[frequency_codes[band]][0]
         
-        # Only include if consistency is reasonable
-        if interval_consistency >= 0.7:  # 70% consistency threshold
-            # Get sample transaction for details
-            sample = sorted_transactions[0]
-            
-            recurring_candidates.append({
-                'description': sample['description'],
-                'amount': sample['amount'],
-                'currency_code': sample['currency_code'],
-                'frequency': frequency,
-                'account_id': sample['account_id'],
-                'category_id': sample['category_id'],
-                'transaction_type': sample['transaction_type'],
-                'confidence': min(interval_consistency * 100, 98),
-                'occurrences': len(sorted_transactions),
-                'last_date': last_transaction['date'],
-                'next_date': next_date,
-                'avg_interval': round(avg_interval, 1),
-                'transaction_ids': [t['id'] for t in sorted_transactions]
-            })
+        recurring_candidates.append({
+            # Identifies the pattern for ignoring it; the first transaction doesn't change as new ones arrive
+            'pattern_key': f"{first_transaction['description']}_{first_transaction['amount']}_{frequency}",
+            # The latest transaction has the current description, amount, account and category
+            'description': last_transaction['description'],
+            'amount': last_transaction['amount'],
+            'currency_code': last_transaction['currency_code'],
+            'frequency': frequency,
+            'account_id': last_transaction['account_id'],
+            'category_id': last_transaction['category_id'],
+            'transaction_type': last_transaction['transaction_type'],
+            'confidence': min(float(consistency[band]) * 100, 98),
+            'occurrences': int(counts[band]),
+            'last_date': last_transaction['date'],
+            'next_date': calculate_next_occurrence(last_transaction['date'], frequency),
+            'avg_interval': round(float(means[band]), 1),
+            'transaction_ids': [t['id'] for t in band_transactions]
+        })
     
     # Sort by confidence (highest first)
     recurring_candidates.sort(key=lambda x: x['confidence'], reverse=True)
@@ -124,53 +178,22 @@ def detect_recurring_transactions(user_id, lookback_days=60, min_occurrences=2):
     return recurring_candidates
 
 
-def determine_frequency(avg_interval):
-    """Determine the likely frequency based on average interval in days"""
-    if 25 <= avg_interval <= 35:
-        return 'monthly'
-    elif 6 <= avg_interval <= 8:
-        return 'weekly'
-    elif 13 <= avg_interval <= 16:
-        return 'biweekly'
-    elif 85 <= avg_interval <= 95:
-        return 'quarterly'
-    elif 350 <= avg_interval <= 380:
-        return 'yearly'
-    elif avg_interval <= 3:
-        return 'daily'
-    else:
-        return None  # Can't determine frequency
+def frequency_codes_for(avg_intervals):
+    """Index into FREQUENCY_RANGES of the frequency for each average interval, -1 where there is none"""
+    conditions = [(avg_intervals >= low) & (avg_intervals <= high) for _, low, high in FREQUENCY_RANGES]
+    return np.select(conditions, list(range(len(FREQUENCY_RANGES))), default=-1)
 
 
-def calculate_interval_consistency(intervals):
+def interval_consistency(means, std_deviations, interval_counts):
     """
-    Calculate how consistent the intervals are.
-    Returns a value between 0 and 1, where 1 is perfectly consistent.
+    How consistent each band's intervals are, between 0 and 1 (1 is perfectly consistent),
+    from the coefficient of variation; a single interval counts as 0.95
     """
-    if not intervals:
-        return 0
-    
-    # If only one interval, it's consistent by definition
-    if len(intervals) == 1:
-        return 0.95  # High but not perfect confidence
-    
-    # Calculate mean and standard deviation
-    mean_interval = sum(intervals) / len(intervals)
-    variance = sum((x - mean_interval) ** 2 for x in intervals) / len(intervals)
-    std_deviation = variance ** 0.5
-    
-    # Calculate coefficient of variation (lower is more consistent)
-    if mean_interval == 0:
-        return 0
-    
-    cv = std_deviation / mean_interval
-    
-    # Convert to consistency score (1 - normalized CV)
-    # If CV is greater than 0.5, consistency drops quickly
-    if cv > 0.5:
-        return max(0, 1 - (cv * 1.5))
-    else:
-        return max(0, 1 - cv)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cv = std_deviations / means
+    consistency = np.where(cv > 0.5, 1 - cv * 1.5, 1 - cv).clip(min=0)
+    consistency = np.where((interval_counts == 0) | ~(means > 0), 0.0, consistency)
+    return np.where(interval_counts == 1, 0.95, consistency)
 
 
 def calculate_next_occurrence(last_date, frequency):
@@ -70,8 +70,8 @@ class SimpleFin:
             self.app.logger.error(f"Error parsing access URL: {str(e)}")
             return None
 
-    def get_accounts_with_transactions(self, access_url, days_back=30):
-        """Get accounts with transactions from the given days back"""
+    def get_accounts_with_transactions(self, access_url, days_back=30, timeout=None):
+        """Get accounts with transactions from the given days back, waiting at most timeout seconds on the bridge"""
         # Calculate start date for X days ago
         start_date = datetime.now() - timedelta(days=days_back)
         start_timestamp = int(start_date.timestamp())
@@ -87,7 +87,7 @@ class SimpleFin:
             
             self.app.logger.info(f"Fetching accounts and transactions from: {url}")
             
-            response = requests.get(url, auth=(parsed['username'], parsed['password']))
+            response = requests.get(url, auth=(parsed['username'], parsed['password']), timeout=timeout)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -198,8 +198,10 @@ class SimpleFin:
             
         return processed_transactions
 
-    def test_access_url(self, access_url):
-        """Test if an access URL is valid by making a simple request"""
+    def test_access_url(self, access_url, timeout=None):
+        """Test if an access URL is valid by making a simple request, waiting at most timeout seconds on the bridge"""
+        if timeout is None:
+            timeout = self.app.config.get('SIMPLEFIN_SYNC_TIMEOUT')
         try:
             # Parse the access URL to get auth credentials
             parsed = self.parse_access_url(access_url)
@@ -209,7 +211,7 @@ class SimpleFin:
             # Make a simple request to fetch accounts (without transactions)
             url = f"{parsed['base_url']}/accounts"
             
-            response = requests.get(url, auth=(parsed['username'], parsed['password']))
+            response = requests.get(url, auth=(parsed['username'], parsed['password']), timeout=timeout)
             return response.status_code == 200
             
         except Exception as e:
@@ -218,7 +220,8 @@ class SimpleFin:
 
     def create_transactions_from_account(self, account_data, db_account, user_id, 
                                         detect_transfer_func=None, auto_categorize_func=None, 
-                                        get_category_id_func=None):
+                                        get_category_id_func=None, categorize_many_func=None,
+                                        classifier=None):
         """
         Create Expense model instances from processed account data, applying transfer detection
         and auto-categorization.
@@ -230,6 +233,11 @@ class SimpleFin:
         - detect_transfer_func: Function to detect internal transfers
         - auto_categorize_func: Function for auto-categorization
         - get_category_id_func: Function to get or create a category by name
+        - categorize_many_func: Function categorizing a batch of descriptions, called as
+          (descriptions, user_id, category_names); when given it replaces the two per-transaction
+          functions above
+        - classifier: TransactionClassifier for the user; when given the account's transactions
+          are classified in one batch instead of through detect_transfer_func
         
         Returns:
         - Tuple of (list of transactions, imported_count)
@@ -237,8 +245,30 @@ class SimpleFin:
         transactions_to_add = []
         imported_count = 0
         
+        # Categorize in one batch at the end instead of transaction by transaction
+        if categorize_many_func:
+            auto_categorize_func = get_category_id_func = None
+        to_categorize = []
+        
+        account_transactions = account_data.get('transactions', [])
+        classifications = [None] * len(account_transactions)
+        if classifier and db_account:
+            detect_transfer_func = None
+            try:
+                classifications = classifier.classify_many(
+                    {
+                        'description': trans.get('description', ''),
+                        'amount': trans.get('raw_amount', trans.get('amount', 0)),  # Use raw amount with sign
+                        'account_id': db_account.id,
+                        'default_type': trans.get('transaction_type', 'expense')
+                    }
+                    for trans in account_transactions
+                )
+            except Exception as e:
+                self.app.logger.error(f"Error in transfer detection: {str(e)}")
+        
         # Process each transaction in the account data
-        for trans in account_data.get('transactions', []):
+        for trans, classification in zip(account_transactions, classifications):
             try:
                 # Create model instance for each transaction
                 transaction, is_transfer = self.create_transaction_instance(
@@ -247,22 +277,38 @@ class SimpleFin:
                     user_id,
                     detect_transfer_func,
                     auto_categorize_func,
-                    get_category_id_func
+                    get_category_id_func,
+                    classification
                 )
                 
                 if transaction:
                     transactions_to_add.append(transaction)
                     imported_count += 1
+                    if categorize_many_func and not is_transfer and transaction.transaction_type != 'transfer':
+                        to_categorize.append((transaction, trans.get('category_name')))
             except Exception as e:
                 self.app.logger.error(f"Error creating transaction: {str(e)}")
                 # Continue with next transaction
                 continue
+        
+        if to_categorize:
+            try:
+                category_ids = categorize_many_func(
+                    [transaction.description for transaction, _ in to_categorize],
+                    user_id,
+                    [category_name for _, category_name in to_categorize]
+                )
+                for (transaction, _), category_id in zip(to_categorize, category_ids):
+                    if category_id:
+                        transaction.category_id = category_id
+            except Exception as e:
+                self.app.logger.error(f"Error in auto-categorization: {str(e)}")
                 
         return transactions_to_add, imported_count
 
     def create_transaction_instance(self, trans_data, db_account, user_id, 
                                   detect_transfer_func=None, auto_categorize_func=None,
-                                  get_category_id_func=None):
+                                  get_category_id_func=None, classification=None):
         """
         Create a single transaction model instance with transfer detection and categorization.
         
@@ -273,6 +319,8 @@ class SimpleFin:
         - detect_transfer_func: Function to detect internal transfers
         - auto_categorize_func: Function for auto-categorization
         - get_category_id_func: Function to get or create a category by name
+        - classification: (transaction_type, destination_account_id) from a TransactionClassifier,
+          used instead of detect_transfer_func
         
         Returns:
         - Tuple of (Transaction model instance, is_transfer boolean)
@@ -305,7 +353,10 @@ class SimpleFin:
         source_account_id = db_account.id if db_account else None
         destination_account_id = None
         
-        if detect_transfer_func and source_account_id:
+        if classification and source_account_id:
+            transaction_type, destination_account_id = classification
+            is_transfer = transaction_type == 'transfer'
+        elif detect_transfer_func and source_account_id:
             try:
                 is_transfer, source_account_id, destination_account_id = detect_transfer_func(
                     trans_data.get('description', ''),
@@ -6,6 +6,11 @@
 let currentExpenseId = null;
 let baseCurrencySymbol = ''; // Will be set from the template
 
+// Keyset pagination state for the server-filtered list
+let nextCursor = null;
+let isLoadingPage = false;
+let pageRequestId = 0;
+
 document.addEventListener('DOMContentLoaded', function() {
     // Get base currency symbol from the page
     baseCurrencySymbol = document.querySelector('meta[name="base-currency-symbol"]')?.content || '$';
@@ -32,6 +37,9 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Set up category split display in the transaction list
     setupCategorySplitDisplay();
+    
+    // Load further pages as the user scrolls
+    setupInfiniteScroll();
 
     // Auto-categorize button
     const bulkCategorizeBtn = document.getElementById('bulkCategorizeBtn');
@@ -47,57 +55,15 @@ document.addEventListener('DOMContentLoaded', function() {
 function initializeSearch() {
     const globalSearchInput = document.getElementById('globalSearchInput');
     const clearSearchBtn = document.getElementById('clearSearchBtn');
-    const transactionsTable = document.querySelector('#transactionsTable tbody');
-    const resultCountEl = document.getElementById('resultCount');
+    let searchTimer = null;
 
-    // Function to perform global search
+    // Search runs on the server, so wait for the user to stop typing
     function performGlobalSearch() {
-        const searchTerm = globalSearchInput.value.toLowerCase().trim();
+        const searchTerm = globalSearchInput.value.trim();
         clearSearchBtn.style.display = searchTerm ? 'block' : 'none';
 
-        let visibleCount = 0;
-        const rows = document.querySelectorAll('#transactionsTable tbody tr[data-expense-id]');
-
-        rows.forEach(row => {
-            // Search across multiple fields
-            const searchableTexts = [
-                row.cells[0].textContent.toLowerCase(),  // Date
-                row.cells[2].textContent.toLowerCase(),  // Description
-                row.cells[3].textContent.toLowerCase(),  // Amount
-                row.cells[4].textContent.toLowerCase(), // Account
-                row.querySelector('td:nth-child(6)').textContent.toLowerCase() // Category
-            ];
-
-            // Additional metadata search
-            const typeText = row.querySelector('.badge').textContent.toLowerCase();
-            searchableTexts.push(typeText);
-
-            // Check if any searchable text includes the search term
-            const isMatch = searchableTexts.some(text => 
-                text.includes(searchTerm) || 
-                (searchTerm.startsWith('>') && parseFloat(text.replace(/[^\d.-]/g, '')) > parseFloat(searchTerm.slice(1))) ||
-                (searchTerm.startsWith('<') && parseFloat(text.replace(/[^\d.-]/g, '')) < parseFloat(searchTerm.slice(1)))
-            );
-
-            row.style.display = isMatch ? '' : 'none';
-            if (isMatch) visibleCount++;
-        });
-
-        // Update result count
-        if (resultCountEl) {
-            resultCountEl.textContent = `${visibleCount} transaction${visibleCount !== 1 ? 's' : ''}`;
-        }
-
-        // Handle no results
-        const noResultsRow = document.querySelector('#transactionsTable tbody tr.no-results');
-        if (visibleCount === 0 && !noResultsRow) {
-            const noResultRow = document.createElement('tr');
-            noResultRow.className = 'no-results';
-            noResultRow.innerHTML = `<td colspan="7" class="text-center text-muted">No transactions match your search</td>`;
-            transactionsTable.appendChild(noResultRow);
-        } else if (visibleCount > 0 && noResultsRow) {
-            noResultsRow.remove();
-        }
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(applyFilters, 300);
     }
 
     // Add event listeners for dynamic search
@@ -152,17 +118,32 @@ function setupFilterButtons() {
 
 // Set up action buttons for transactions
 function setupActionButtons() {
-    // View split details buttons
-    document.querySelectorAll('.view-split-btn').forEach(btn => {
-        btn.addEventListener('click', function() {
-            const expenseId = this.getAttribute('data-expense-id');
+    const tbody = document.querySelector('#transactionsTable tbody');
+    if (!tbody) return;
+    
+    // Rows are replaced and appended as pages load, so delegate from the table body
+    tbody.addEventListener('click', function(e) {
+        // View split details buttons
+        const viewBtn = e.target.closest('.view-split-btn');
+        if (viewBtn) {
+            const expenseId = viewBtn.getAttribute('data-expense-id');
             if (expenseId) {
                 const splitDetails = document.getElementById(`split-${expenseId}`);
                 if (splitDetails) {
                     splitDetails.style.display = splitDetails.style.display === 'none' ? 'block' : 'none';
                 }
             }
-        });
+            return;
+        }
+        
+        // Delete expense buttons
+        const deleteBtn = e.target.closest('.delete-expense-btn');
+        if (deleteBtn) {
+            const expenseId = deleteBtn.getAttribute('data-expense-id');
+            if (expenseId) {
+                showDeleteConfirmation(expenseId);
+            }
+        }
     });
     
     // Edit expense buttons - use TransactionModule if available
@@ -182,16 +163,6 @@ function setupActionButtons() {
         });
     });
     
-    // Delete expense buttons remain unchanged
-    document.querySelectorAll('.delete-expense-btn').forEach(btn => {
-        btn.addEventListener('click', function() {
-            const expenseId = this.getAttribute('data-expense-id');
-            if (expenseId) {
-                showDeleteConfirmation(expenseId);
-            }
-        });
-    });
-    
     // Confirm delete button
     const confirmDeleteBtn = document.getElementById('confirmDeleteBtn');
     if (confirmDeleteBtn) {
@@ -208,34 +179,35 @@ function setupActionButtons() {
 }
 // Function to display split categories in the transactions table
 function setupCategorySplitDisplay() {
-    // Find all transactions with split categories
-    document.querySelectorAll('[data-has-splits="true"]').forEach(element => {
-        const expenseId = element.getAttribute('data-expense-id');
+    // One handler on the table body covers the rows of every page loaded later
+    const tbody = document.querySelector('#transactionsTable tbody');
+    if (!tbody) return;
+    
+    tbody.addEventListener('click', function(e) {
+        const toggle = e.target.closest('[data-has-splits="true"] .split-toggle');
+        if (!toggle || !tbody.contains(toggle)) return;
         
-        // Add click handler to toggle
-        element.querySelector('.split-toggle')?.addEventListener('click', function(e) {
-            e.preventDefault();
-            e.stopPropagation();
-            
-            const expenseId = this.getAttribute('data-expense-id');
-            const detailElement = document.getElementById(`split-categories-${expenseId}`);
-            
-            if (detailElement) {
-                // Toggle visibility
-                if (detailElement.style.display === 'none') {
-                    detailElement.style.display = 'block';
-                    this.querySelector('i').classList.replace('fa-chevron-down', 'fa-chevron-up');
-                    
-                    // Check if we need to load the data
-                    if (detailElement.querySelector('.loading')) {
-                        loadCategorySplits(expenseId, detailElement);
-                    }
-                } else {
-                    detailElement.style.display = 'none';
-                    this.querySelector('i').classList.replace('fa-chevron-up', 'fa-chevron-down');
+        e.preventDefault();
+        e.stopPropagation();
+        
+        const expenseId = toggle.getAttribute('data-expense-id');
+        const detailElement = document.getElementById(`split-categories-${expenseId}`);
+        
+        if (detailElement) {
+            // Toggle visibility
+            if (detailElement.style.display === 'none') {
+                detailElement.style.display = 'block';
+                toggle.querySelector('i').classList.replace('fa-chevron-down', 'fa-chevron-up');
+                
+                // Check if we need to load the data
+                if (detailElement.querySelector('.loading')) {
+                    loadCategorySplits(expenseId, detailElement);
                 }
+            } else {
+                detailElement.style.display = 'none';
+                toggle.querySelector('i').classList.replace('fa-chevron-up', 'fa-chevron-down');
             }
-        });
+        }
     });
 }
 
@@ -409,99 +381,140 @@ function deleteExpense(expenseId) {
     });
 }
 
-// Apply filters to transactions table
-function applyFilters() {
-    const startDate = document.getElementById('startDate')?.value;
-    const endDate = document.getElementById('endDate')?.value;
-    const transactionType = document.getElementById('transactionTypeFilter')?.value || 'all';
-    const categoryId = document.getElementById('categoryFilter')?.value || 'all';
-    const accountId = document.getElementById('accountFilter')?.value || 'all';
-    const description = (document.getElementById('descriptionFilter')?.value || '').toLowerCase();
-    const minAmount = document.getElementById('minAmount')?.value;
-    const maxAmount = document.getElementById('maxAmount')?.value;
-    
-    let visibleCount = 0;
-    
-    // Get all rows
-    const rows = document.querySelectorAll('#transactionsTable tbody tr[data-expense-id]');
-    if (!rows.length) return;
-    
-    rows.forEach(row => {
-        const rowDate = row.cells[0].textContent.trim();
-        const rowType = row.querySelector('.badge')?.textContent.toLowerCase() || '';
-        const rowDescription = row.cells[2].textContent.trim().toLowerCase();
-        const rowCategory = row.getAttribute('data-category-id') || 'none';
-        const rowSourceAccount = row.getAttribute('data-account-source-id') || 'none';
-        const rowDestAccount = row.getAttribute('data-account-dest-id') || 'none';
-        
-        // Extract amount from the amount cell (removing currency symbol and formatting)
-        const amountText = row.cells[3].textContent.trim();
-        const rowAmount = parseFloat(amountText.replace(/[^\d.-]/g, '')) || 0;
-        
-        let visible = true;
-        
-        // Date filter
-        if (startDate && new Date(rowDate) < new Date(startDate)) visible = false;
-        if (endDate && new Date(rowDate) > new Date(endDate)) visible = false;
-        
-        // Transaction type filter
-        if (transactionType !== 'all') {
-            if (transactionType === 'expense' && !rowType.includes('expense')) visible = false;
-            if (transactionType === 'income' && !rowType.includes('income')) visible = false;
-            if (transactionType === 'transfer' && !rowType.includes('transfer')) visible = false;
-        }
-        
-        // Category filter
-        if (categoryId === 'none') {
-            // Only show uncategorized items
-            if (rowCategory !== 'none') visible = false;
-        } else if (categoryId !== 'all') {
-            // Show only the selected category
-            if (rowCategory !== categoryId) visible = false;
-        }
-
-        // account filter
-        if (accountId !== 'all') {
-            // Show only the selected account
-            if (rowSourceAccount !== accountId && rowDestAccount !== accountId) visible = false;
+// Collect the filter form into query parameters for /transactions/data
+function getFilterParams() {
+    const params = new URLSearchParams();
+    const fields = {
+        startDate: document.getElementById('startDate')?.value,
+        endDate: document.getElementById('endDate')?.value,
+        transactionType: document.getElementById('transactionTypeFilter')?.value,
+        categoryId: document.getElementById('categoryFilter')?.value,
+        accountId: document.getElementById('accountFilter')?.value,
+        cardUsed: document.getElementById('cardFilter')?.value,
+        description: document.getElementById('descriptionFilter')?.value.trim(),
+        minAmount: document.getElementById('minAmount')?.value,
+        maxAmount: document.getElementById('maxAmount')?.value,
+        search: document.getElementById('globalSearchInput')?.value.trim()
+    };
+    
+    Object.entries(fields).forEach(([key, value]) => {
+        if (value && value !== 'all') {
+            params.set(key, value);
         }
-        
-        // Description filter
-        if (description && !rowDescription.includes(description)) visible = false;
-        
-        // Amount filter
-        if (minAmount && !isNaN(parseFloat(minAmount)) && Math.abs(rowAmount) < parseFloat(minAmount)) visible = false;
-        if (maxAmount && !isNaN(parseFloat(maxAmount)) && Math.abs(rowAmount) > parseFloat(maxAmount)) visible = false;
-        
-        // Show/hide row
-        row.style.display = visible ? '' : 'none';
-        if (visible) visibleCount++;
     });
     
-    // Update result count
-    const resultCountEl = document.getElementById('resultCount');
-    if (resultCountEl) {
-        resultCountEl.textContent = `${visibleCount} transaction${visibleCount !== 1 ? 's' : ''}`;
+    return params;
+}
+
+// Fetch a page of transactions; without a cursor the table is replaced
+function loadTransactionPage(cursor = null) {
+    const tbody = document.querySelector('#transactionsTable tbody');
+    if (!tbody) return Promise.resolve();
+    
+    const params = getFilterParams();
+    if (cursor) {
+        params.set('cursor', cursor);
     }
     
-    // Show/hide the "no results" message
+    // Ignore responses for filters that have since changed
+    const requestId = ++pageRequestId;
+    isLoadingPage = true;
+    toggleLoadMoreIndicator(true);
+    
+    return fetch(`/transactions/data?${params.toString()}`)
+        .then(response => response.json())
+        .then(data => {
+            if (requestId !== pageRequestId) return;
+            
+            if (!data.success) {
+                throw new Error(data.message || 'Failed to load transactions');
+            }
+            
+            if (!cursor) {
+                tbody.innerHTML = '';
+            }
+            
+            const template = document.createElement('tbody');
+            template.innerHTML = data.html;
+            const newRows = Array.from(template.children);
+            newRows.forEach(row => tbody.appendChild(row));
+            
+            nextCursor = data.next_cursor;
+            
+            // Update result count
+            const resultCountEl = document.getElementById('resultCount');
+            if (resultCountEl && data.total !== undefined) {
+                resultCountEl.textContent = `${data.total} transaction${data.total !== 1 ? 's' : ''}`;
+            }
+            
+            // Show the "no results" message
+            if (!cursor && data.transactions.length === 0) {
+                const noResultsRow = document.createElement('tr');
+                noResultsRow.className = 'no-results';
+                noResultsRow.innerHTML = '<td colspan="7" class="text-center">No transactions match your filters</td>';
+                tbody.appendChild(noResultsRow);
+            }
+        })
+        .catch(error => {
+            console.error('Error loading transactions:', error);
+            showMessage(`Error loading transactions: ${error.message}`, 'error');
+        })
+        .finally(() => {
+            if (requestId !== pageRequestId) return;
+            isLoadingPage = false;
+            toggleLoadMoreIndicator(false);
+            
+            // Keep loading if the page is still short enough to show the indicator
+            maybeLoadNextPage();
+        });
+}
+
+// Show the loading indicator only while more pages remain
+function toggleLoadMoreIndicator(loading) {
+    const indicator = document.getElementById('transactionsLoadMore');
+    if (indicator) {
+        indicator.style.display = (loading || nextCursor) ? 'block' : 'none';
+    }
+}
+
+// Load the next page when the indicator below the table is on screen
+function maybeLoadNextPage() {
+    const indicator = document.getElementById('transactionsLoadMore');
+    if (!indicator || isLoadingPage || !nextCursor) return;
+    
+    const rect = indicator.getBoundingClientRect();
+    if (rect.top < window.innerHeight + 200) {
+        loadTransactionPage(nextCursor);
+    }
+}
+
+// Watch the indicator below the table and fetch pages as it scrolls into view
+function setupInfiniteScroll() {
     const tbody = document.querySelector('#transactionsTable tbody');
-    let noResultsRow = document.querySelector('#transactionsTable tbody tr.no-results');
-    
-    if (visibleCount === 0) {
-        // Add "no results" row if none exists
-        if (!noResultsRow && tbody) {
-            noResultsRow = document.createElement('tr');
-            noResultsRow.className = 'no-results';
-            noResultsRow.innerHTML = '<td colspan="7" class="text-center">No transactions match your filters</td>';
-            tbody.appendChild(noResultsRow);
-        }
-    } else if (noResultsRow) {
-        // Remove "no results" row if we have visible rows
-        noResultsRow.remove();
+    nextCursor = tbody?.getAttribute('data-next-cursor') || null;
+    toggleLoadMoreIndicator(false);
+    
+    const indicator = document.getElementById('transactionsLoadMore');
+    if (!indicator) return;
+    
+    if ('IntersectionObserver' in window) {
+        const observer = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                maybeLoadNextPage();
+            }
+        }, { rootMargin: '200px' });
+        observer.observe(indicator);
+    } else {
+        window.addEventListener('scroll', maybeLoadNextPage);
     }
 }
 
+// Apply filters to transactions table
+function applyFilters() {
+    nextCursor = null;
+    return loadTransactionPage();
+}
+
 // Clear all filters
 function clearFilters() {
     // Reset filter form fields
@@ -523,6 +536,7 @@ function exportTransactions() {
         endDate: document.getElementById('endDate')?.value,
         transactionType: document.getElementById('transactionTypeFilter')?.value,
         categoryId: document.getElementById('categoryFilter')?.value,
+        cardUsed: document.getElementById('cardFilter')?.value,
         minAmount: document.getElementById('minAmount')?.value,
         maxAmount: document.getElementById('maxAmount')?.value,
         description: document.getElementById('descriptionFilter')?.value
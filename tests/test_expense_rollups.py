@@ -0,0 +1,272 @@
+"""
+ExpenseRollup against the per-route loops it replaced.
+
+The legacy_* functions below are the dashboard, transactions and stats loops
+as they stood before the rollup, run over a small fixture of shared, personal,
+income and transfer transactions spanning two years. Amounts are exact in
+binary floating point, so the nested monthly totals compare directly.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+import pytest
+
+from expense_rollups import ExpenseRollup, bucket_key, month_key
+
+NOW = datetime(2026, 6, 15, 12, 0)
+USER = 'me@example.com'
+
+Account = namedtuple('Account', 'name')
+
+
+class FakeExpense:
+    """Just enough of Expense for the rollups: equal splits between the payer and split_with"""
+
+    def __init__(self, id, date, amount, paid_by, split_with=(), card_used='Visa',
+                 transaction_type='expense', account=None):
+        self.id = id
+        self.date = date
+        self.amount = amount
+        self.paid_by = paid_by
+        self.split_with = list(split_with)
+        self.card_used = card_used
+        self.transaction_type = transaction_type
+        self.account = Account(account) if account else None
+
+    def calculate_splits(self):
+        share = round(self.amount / (len(self.split_with) + 1), 2)
+        return {
+            'payer': {'email': self.paid_by, 'amount': round(self.amount - share * len(self.split_with), 2)},
+            'splits': [{'email': email, 'amount': share} for email in self.split_with],
+        }
+
+
+EXPENSES = [
+    FakeExpense(1, datetime(2026, 6, 3), 90.0, USER, ['bob@x.com', 'carol@x.com'], account='Checking'),
+    FakeExpense(2, datetime(2026, 6, 10), 1200.0, 'bob@x.com', [USER], card_used='Bob Amex'),
+    FakeExpense(3, datetime(2026, 6, 1), 4000.0, USER, transaction_type='income', card_used='Direct deposit'),
+    FakeExpense(4, datetime(2026, 5, 20), 45.5, USER, account='Checking'),
+    FakeExpense(5, datetime(2026, 5, 2), 300.0, USER, transaction_type='transfer', account='Savings'),
+    FakeExpense(6, datetime(2026, 4, 18), 60.0, 'carol@x.com', ['bob@x.com']),
+    FakeExpense(7, datetime(2026, 3, 7), 25.0, USER, ['bob@x.com'], card_used='Mastercard'),
+    FakeExpense(8, datetime(2026, 1, 31), 3900.0, USER, transaction_type='income', card_used='Direct deposit'),
+    FakeExpense(9, datetime(2025, 12, 24), 150.0, USER, ['carol@x.com'], account='Checking'),
+    FakeExpense(10, datetime(2025, 11, 5), 80.0, 'carol@x.com', [USER]),
+    FakeExpense(11, datetime(2025, 12, 31), 3800.0, USER, transaction_type='income', card_used='Direct deposit'),
+]
+
+
+def _add(bucket, key, amount):
+    bucket[key] = bucket.get(key, 0) + amount
+
+
+def _add_contributors(contributors, splits):
+    if splits['payer']['amount'] > 0:
+        _add(contributors, splits['payer']['email'], splits['payer']['amount'])
+    for split in splits['splits']:
+        _add(contributors, split['email'], split['amount'])
+
+
+def legacy_dashboard(expenses, user_id, now):
+    """The dashboard loops: expense-only monthly totals and the user's year/month shares"""
+    splits_by_id = {expense.id: expense.calculate_splits() for expense in expenses}
+
+    monthly_totals = {}
+    for expense in expenses:
+        key = expense.date.strftime('%Y-%m')
+        month = monthly_totals.setdefault(key, {'total': 0.0, 'by_card': {}, 'contributors': {}, 'by_account': {}})
+        if expense.transaction_type == 'expense':
+            month['total'] += expense.amount
+            _add(month['by_card'], expense.card_used, expense.amount)
+            if expense.account:
+                _add(month['by_account'], expense.account.name, expense.amount)
+            _add_contributors(month['contributors'], splits_by_id[expense.id])
+
+    total_income = sum(e.amount for e in expenses if e.transaction_type == 'income')
+    total_transfers = sum(e.amount for e in expenses if e.transaction_type == 'transfer')
+
+    def shares(keep):
+        total = total_expenses_only = 0
+        for expense in expenses:
+            if not keep(expense):
+                continue
+            is_expense = expense.transaction_type == 'expense'
+            splits = splits_by_id[expense.id]
+            if expense.paid_by == user_id:
+                amounts = [splits['payer']['amount']] + [split['amount'] for split in splits['splits']]
+            else:
+                amounts = [split['amount'] for split in splits['splits'] if split['email'] == user_id][:1]
+            for amount in amounts:
+                total += amount
+                if is_expense:
+                    total_expenses_only += amount
+        return total, total_expenses_only
+
+    total_expenses, total_expenses_only = shares(lambda e: e.date.year == now.year)
+    current_month_total, current_month_expenses_only = shares(
+        lambda e: e.date.strftime('%Y-%m') == now.strftime('%Y-%m'))
+
+    return {
+        'monthly_totals': monthly_totals,
+        'total_income': total_income,
+        'total_transfers': total_transfers,
+        'total_expenses': total_expenses,
+        'total_expenses_only': total_expenses_only,
+        'current_month_total': current_month_total,
+        'current_month_expenses_only': current_month_expenses_only,
+        'unique_cards': set(e.card_used for e in expenses if e.paid_by == user_id),
+    }
+
+
+def legacy_transactions_monthly_totals(expenses):
+    """The transactions page loop: monthly totals over every transaction type"""
+    monthly_totals = {}
+    for expense in expenses:
+        key = expense.date.strftime('%Y-%m')
+        month = monthly_totals.setdefault(key, {'total': 0.0, 'by_card': {}, 'contributors': {}})
+        month['total'] += expense.amount
+        _add(month['by_card'], expense.card_used, expense.amount)
+        _add_contributors(month['contributors'], expense.calculate_splits())
+    return monthly_totals
+
+
+def legacy_stats_portions(expenses, user_id):
+    """The stats loop: the user's portion per expense, and per month spending and income"""
+    portions = {}
+    monthly_spending = {}
+    monthly_income = {}
+    for expense in expenses:
+        splits = expense.calculate_splits()
+        user_portion = 0
+        if expense.paid_by == user_id:
+            user_portion = splits['payer']['amount']
+        else:
+            for split in splits['splits']:
+                if split['email'] == user_id:
+                    user_portion = split['amount']
+                    break
+        portions[expense.id] = user_portion
+        if user_portion > 0:
+            key = expense.date.strftime('%Y-%m')
+            target = monthly_income if expense.transaction_type == 'income' else monthly_spending
+            _add(target, key, user_portion)
+    return portions, monthly_spending, monthly_income
+
+
+def grouped_rows(expenses, user_id):
+    """The rows the GROUP BY queries behind load_expense_rollup() return for the fixture"""
+    amounts, contributors, shares = {}, {}, {}
+    for expense in expenses:
+        period = (expense.date.year, expense.date.month, expense.transaction_type)
+        account_name = expense.account.name if expense.account else None
+        _add(amounts, period + (expense.card_used, account_name), expense.amount)
+
+        splits = expense.calculate_splits()
+        participants = [splits['payer']] if splits['payer']['amount'] > 0 else []
+        for split in participants + splits['splits']:
+            _add(contributors, period + (split['email'],), split['amount'])
+
+        if expense.paid_by == user_id:
+            share = splits['payer']['amount'] + sum(split['amount'] for split in splits['splits'])
+        else:
+            share = sum(split['amount'] for split in splits['splits'] if split['email'] == user_id)
+        if share:
+            _add(shares, period, share)
+
+    return ([key + (amount,) for key, amount in amounts.items()],
+            [key + (amount,) for key, amount in contributors.items()],
+            [key + (amount,) for key, amount in shares.items()])
+
+
+@pytest.fixture
+def rollup():
+    return ExpenseRollup(EXPENSES, USER, now=NOW)
+
+
+@pytest.fixture
+def legacy():
+    return legacy_dashboard(EXPENSES, USER, NOW)
+
+
+def test_bucket_keys():
+    assert bucket_key(2026, 6) == '2026-06'
+    assert bucket_key('2026', '6') == '2026-06'
+    assert month_key(datetime(2025, 12, 24)) == '2025-12'
+
+
+def test_dashboard_monthly_totals_match(rollup, legacy):
+    assert rollup.expense_monthly_totals == legacy['monthly_totals']
+
+
+def test_transactions_monthly_totals_match(rollup):
+    assert rollup.monthly_totals == legacy_transactions_monthly_totals(EXPENSES)
+
+
+def test_year_and_month_shares_match(rollup, legacy):
+    assert rollup.year_total == pytest.approx(legacy['total_expenses'])
+    assert rollup.year_expense_total == pytest.approx(legacy['total_expenses_only'])
+    assert rollup.month_total == pytest.approx(legacy['current_month_total'])
+    assert rollup.month_expense_total == pytest.approx(legacy['current_month_expenses_only'])
+
+
+def test_type_totals_and_cards_match(rollup, legacy):
+    assert rollup.type_total('income') == pytest.approx(legacy['total_income'])
+    assert rollup.type_total('transfer') == pytest.approx(legacy['total_transfers'])
+    assert rollup.type_total('refund') == 0
+    assert rollup.unique_cards == legacy['unique_cards']
+
+
+def test_stats_portions_match(rollup):
+    portions, monthly_spending, monthly_income = legacy_stats_portions(EXPENSES, USER)
+    assert rollup.user_portions == pytest.approx(portions)
+    assert rollup.portion_total == pytest.approx(sum(portions.values()))
+
+    spending = {key: sum(amount for t, amount in by_type.items() if t != 'income')
+                for key, by_type in rollup.portion_by_month.items()}
+    income = {key: by_type['income'] for key, by_type in rollup.portion_by_month.items() if 'income' in by_type}
+    assert {k: v for k, v in spending.items() if v} == pytest.approx(monthly_spending)
+    assert income == pytest.approx(monthly_income)
+
+
+def test_splits_are_reused(rollup):
+    splits = dict(rollup.splits)
+    again = ExpenseRollup(EXPENSES, USER, splits=splits, now=NOW)
+    assert again.splits is splits
+    assert again.monthly_totals == rollup.monthly_totals
+
+
+def test_from_totals_matches_single_pass(rollup):
+    amount_rows, contributor_rows, share_rows = grouped_rows(EXPENSES, USER)
+    grouped = ExpenseRollup.from_totals(USER, amount_rows, contributor_rows, share_rows,
+                                        unique_cards=rollup.unique_cards, now=NOW)
+
+    assert grouped.monthly_totals == rollup.monthly_totals
+    assert grouped.expense_monthly_totals == rollup.expense_monthly_totals
+    assert grouped.type_totals == pytest.approx(rollup.type_totals)
+    assert grouped.year_total == pytest.approx(rollup.year_total)
+    assert grouped.year_expense_total == pytest.approx(rollup.year_expense_total)
+    assert grouped.month_total == pytest.approx(rollup.month_total)
+    assert grouped.month_expense_total == pytest.approx(rollup.month_expense_total)
+    assert grouped.year_income == pytest.approx(rollup.year_income)
+    assert grouped.cash_flow() == pytest.approx(rollup.cash_flow())
+
+
+def test_cash_flow_subtracts_year_expenses(rollup, legacy):
+    # The old dashboard subtracted total_expenses_only before accumulating it,
+    # so net cash flow was all income and the savings rate always 100%
+    net_cash_flow, savings_rate = rollup.cash_flow()
+
+    # This year's income 7900 (last December's 3800 is left out); this year's
+    # expenses: 90 (paid, whole bill) + 600 (my half of Bob's 1200) + 45.50
+    # + 25 (paid, whole bill) = 760.50
+    assert rollup.type_total('income') == pytest.approx(11700)
+    assert rollup.year_income == pytest.approx(7900)
+    assert rollup.year_expense_total == pytest.approx(760.5)
+    assert net_cash_flow == pytest.approx(7900 - 760.5)
+    assert savings_rate == pytest.approx((7900 - 760.5) / 7900 * 100)
+    assert net_cash_flow != pytest.approx(legacy['total_income'])
+
+
+def test_cash_flow_without_income():
+    rollup = ExpenseRollup([EXPENSES[0]], USER, now=NOW)
+    assert rollup.cash_flow() == (pytest.approx(-90.0), 0)
@@ -0,0 +1,178 @@
+r"""29a41de6a866d56c36aba5159f45257c"""
+"""
+Transfer, income and expense classification for imported transactions.
+
+The CSV import and the SimpleFin sync used to rebuild their keyword lists and
+scan them one by one for every row, and internal transfer detection queried
+the user's accounts (through current_user) for each match. A
+TransactionClassifier is built once per user per import from the user's
+accounts: every keyword list is compiled into one pattern and the account
+names into another, so classifying a row is two regex scans and needs
+neither the database nor a request.
+"""
+import re
+
+# Description keywords marking a transfer between the user's own accounts;
+# only used when the account the transaction came from is known
+TRANSFER_KEYWORDS = (
+    'transfer', 'xfer', 'move', 'moved to', 'sent to', 'to account',
+    'from account', 'between accounts', 'internal', 'account to account',
+    'trx to', 'trx from', 'trans to', 'trans from', 'ach withdrawal',
+    'robinhood', 'bk of amer visa online pmt', 'payment thank you',
+)
+
+# Description keywords for the transaction type, checked in this order
+TYPE_KEYWORDS = (
+    ('transfer', ('transfer', 'xfer', 'move', 'moved to', 'sent to', 'to account', 'between accounts')),
+    ('income', ('salary', 'deposit', 'refund', 'interest', 'dividend', 'payment received')),
+    ('expense', ('payment', 'purchase', 'fee', 'subscription', 'bill')),
+)
+
+# Values of an explicit transaction type (e.g. a CSV type column)
+TYPE_VALUES = {
+    'expense': ('expense', 'debit', 'purchase', 'payment', 'withdrawal'),
+    'income': ('income', 'credit', 'deposit', 'refund'),
+    'transfer': ('transfer', 'move', 'xfer'),
+}
+
+
+def trie_pattern(strings):
+    """
+    A regex matching any of strings, written as a trie (shared prefixes merged),
+    so a position is rejected after a character or two instead of once per string.
+    At each position it matches the longest string there
+    """
+    trie = {}
+    for string in strings:
+        node = trie
+        for char in string:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return '(?:' + body + ')?' if '' in node else body
+
+    return build(trie)
+
+
+class SubstringMatcher:
+    """
+    Finds which of a set of strings occur in a text, case-insensitively, in one
+    regex scan. Matching is zero-width at each position, so overlapping strings
+    are all found: the longest one starting at a position stands in for every
+    shorter one that is a prefix of it.
+    """
+
+    def __init__(self, labels_by_string):
+        """labels_by_string: string -> set of labels reported when it occurs"""
+        strings = {s.lower() for s in labels_by_string if s}
+        self.labels = {}
+        for string in strings:
+            labels = set()
+            for other, other_labels in labels_by_string.items():
+                if other and string.startswith(other.lower()):
+                    labels.update(other_labels)
+            self.labels[string] = frozenset(labels)
+        self.pattern = re.compile('(?=(' + trie_pattern(strings) + '))') if strings else None
+
+    def find(self, text):
+        """The labels of every string occurring in text"""
+        found = set()
+        if self.pattern is None or not text:
+            return found
+        for string in self.pattern.findall(text.lower()):
+            found.update(self.labels[string])
+        return found
+
+
+class TransactionClassifier:
+    """Classifies a user's transactions as transfers, income or expenses"""
+
+    def __init__(self, accounts=(), negative_is_expense=False):
+        """
+        accounts: the user's (account_id, name) pairs, in the order destination
+        accounts are preferred
+        negative_is_expense: for rows classified by their amount's sign, whether
+        negative amounts are expenses (otherwise they are income)
+        """
+        self.negative_is_expense = negative_is_expense
+
+        labels = {}
+        for keyword in TRANSFER_KEYWORDS:
+            labels.setdefault(keyword, set()).add('internal')
+        for transaction_type, keywords in TYPE_KEYWORDS:
+            for keyword in keywords:
+                labels.setdefault(keyword, set()).add(transaction_type)
+        self.keywords = SubstringMatcher(labels)
+
+        self.accounts = [(account_id, (name or '').lower()) for account_id, name in accounts]
+        names = {}
+        for _, name in self.accounts:
+            names.setdefault(name, {name})
+        self.account_names = SubstringMatcher(names)
+
+        self.type_values = {value: transaction_type
+                            for transaction_type, values in TYPE_VALUES.items() for value in values}
+
+    def destination_account(self, description, account_id):
+        """The first of the user's other accounts named in the description, or None"""
+        names = self.account_names.find(description)
+        for other_id, name in self.accounts:
+            if other_id != account_id and name and name in names:
+                return other_id
+        return None
+
+    def detect_transfer(self, description, amount, account_id=None):
+        """
+        Detect if a transaction appears to be an internal transfer between accounts
+        Returns a tuple of (is_transfer, source_account_id, destination_account_id)
+        """
+        if not description or not account_id or 'internal' not in self.keywords.find(description):
+            return False, account_id, None
+        return True, account_id, self.destination_account(description, account_id)
+
+    def classify(self, description, amount, account_id=None, type_value=None, default_type=None):
+        """
+        Return (transaction_type, destination_account_id) for one transaction:
+        a transfer out of account_id if the description says so, else the explicit
+        type_value, else default_type, else description keywords, else the amount's sign
+        """
+        description = description or ''
+        kinds = self.keywords.find(description)
+
+        if account_id and 'internal' in kinds:
+            return 'transfer', self.destination_account(description, account_id)
+
+        if type_value:
+            transaction_type = self.type_values.get(type_value.strip().lower())
+            if transaction_type:
+                return transaction_type, None
+
+        if default_type:
+            return default_type, None
+
+        for transaction_type, _ in TYPE_KEYWORDS:
+            if transaction_type in kinds:
+                return transaction_type, None
+
+        amount = amount or 0
+        if amount < 0:
+            # Without negative_is_expense negative amounts are money coming in
+            return ('expense' if self.negative_is_expense else 'income'), None
+        if amount > 0 and self.negative_is_expense:
+            return 'income', None
+        return 'expense', None
+
+    def classify_many(self, rows):
+        """
+        Classify a batch of rows: dicts with description and amount, and optionally
+        account_id, type_value and default_type (see classify). Returns a list of
+        (transaction_type, destination_account_id)
+        """
+        return [self.classify(row.get('description'), row.get('amount'), row.get('account_id'),
+                              row.get('type_value'), row.get('default_type'))
+                for row in rows]
@@ -0,0 +1,38 @@
+r"""29a41de6a866d56c36aba5159f45257c"""
+"""
+Standalone worker for the scheduled jobs (monthly reports, recurring transactions,
+SimpleFin sync, investment price refresh, re-basing stored amounts after a base
+currency change, background CSV imports), so they run outside the gunicorn web
+processes:
+
+    python worker.py
+
+Set SCHEDULER_ENABLED=False on the web containers when running it. Several
+workers, or workers alongside web processes that still run the scheduler,
+are safe: each run is claimed once (see job_locks).
+"""
+import os
+import signal
+import threading
+
+# The worker starts the scheduler itself once the app is loaded
+os.environ['SCHEDULER_ENABLED'] = 'False'
+
+from app import app, scheduler, start_scheduler
+
+
+def main():
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda signum, frame: stop.set())
+
+    start_scheduler()
+    app.logger.info(f"Scheduler worker started: {', '.join(job.id for job in scheduler.get_jobs())}")
+
+    stop.wait()
+    app.logger.info("Scheduler worker stopping")
+    scheduler.shutdown()
+
+
+if __name__ == '__main__':
+    main()